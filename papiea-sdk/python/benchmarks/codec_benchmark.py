@@ -0,0 +1,93 @@
+"""
+Compares the JSON codecs (eager and lazy attribute access) on a filter
+result page of 10k entities. The default codec (orjson with lazy attribute
+access when orjson is installed) is compared with the eager json decoding
+the SDK used before.
+
+    python -m benchmarks.codec_benchmark [--entities 10000] [--repeat 5]
+"""
+import argparse
+import timeit
+import tracemalloc
+
+from papiea.codec import JsonCodec, OrjsonCodec, get_default_codec, orjson
+
+
+def entity_page(count: int) -> dict:
+    results = []
+    for i in range(count):
+        results.append({
+            "metadata": {
+                "uuid": f"{i:08d}-0000-4000-8000-000000000000",
+                "kind": "bucket",
+                "spec_version": i % 7 + 1,
+                "provider_prefix": "benchmark_provider",
+                "provider_version": "0.1.0",
+                "created_at": "2020-12-01T10:00:00.000Z",
+                "extension": {"owner": "benchmark", "tenant_uuid": "a7d8b2e1"},
+            },
+            "spec": {
+                "name": f"bucket-{i}",
+                "owner": "benchmark",
+                "objects": [{"name": f"object-{j}", "reference": {"uuid": f"{j:08d}", "kind": "object"}}
+                            for j in range(3)],
+            },
+            "status": {
+                "name": f"bucket-{i}",
+                "owner": "benchmark",
+                "objects": [],
+            },
+        })
+    return {"results": results, "entity_count": count}
+
+
+def measure(codec, encoded, repeat):
+    decoded = codec.loads_attrs(encoded)
+    return {
+        "dumps": min(timeit.repeat(lambda: codec.dumps(decoded), number=1, repeat=repeat)),
+        "loads": min(timeit.repeat(lambda: codec.loads(encoded), number=1, repeat=repeat)),
+        "loads_attrs": min(timeit.repeat(lambda: codec.loads_attrs(encoded), number=1, repeat=repeat)),
+    }
+
+
+def decoded_size(codec, encoded) -> int:
+    tracemalloc.start()
+    decoded = codec.loads_attrs(encoded)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del decoded
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    page = entity_page(args.entities)
+    encoded = JsonCodec().dumps(page)
+    codecs = [JsonCodec(), JsonCodec(lazy_attrs=True)]
+    if orjson is not None:
+        codecs.extend([OrjsonCodec(lazy_attrs=False), OrjsonCodec()])
+    else:
+        print("orjson is not installed, only the json codec is measured")
+
+    print(f"{args.entities} entities, {len(encoded) / 1024 / 1024:.1f} MiB, best of {args.repeat}")
+    baseline = None
+    for codec in codecs:
+        timings = measure(codec, encoded, args.repeat)
+        baseline = baseline or timings
+        name = codec.name + ("+lazy" if codec.lazy_attrs else "")
+        for op, secs in timings.items():
+            print(f"{name:>11} {op:<12} {secs * 1000:8.1f} ms  x{baseline[op] / secs:.2f}")
+        print(f"{name:>11} {'memory':<12} {decoded_size(codec, encoded) / 1024 / 1024:8.1f} MiB")
+
+    default = get_default_codec()
+    secs = min(timeit.repeat(lambda: default.loads_attrs(encoded), number=1, repeat=args.repeat))
+    name = default.name + ("+lazy" if default.lazy_attrs else "")
+    print(f"default codec ({name}) loads_attrs {secs * 1000:.1f} ms, x{baseline['loads_attrs'] / secs:.2f} "
+          f"over eager json decoding")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Compares the memory used by a local working set of entity metadata kept as
+AttributeDicts (the decoded wire format) and as CompactMetadata records.
+
+    python -m benchmarks.entity_memory_benchmark [--entities 100000]
+"""
+import argparse
+import timeit
+import tracemalloc
+
+from papiea.codec import JsonCodec
+from papiea.core import CompactMetadata
+
+
+def metadata_page(count: int) -> bytes:
+    return JsonCodec().dumps([
+        {
+            "uuid": f"{i:08d}-0000-4000-8000-000000000000",
+            "kind": "bucket",
+            "spec_version": i % 7 + 1,
+            "provider_prefix": "benchmark_provider",
+            "provider_version": "0.1.0",
+            "created_at": "2020-12-01T10:00:00.000Z",
+        }
+        for i in range(count)
+    ])
+
+
+def working_set_size(build) -> int:
+    tracemalloc.start()
+    working_set = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del working_set
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=100000)
+    args = parser.parse_args()
+
+    encoded = metadata_page(args.entities)
+    codec = JsonCodec()
+    builders = {
+        "AttributeDict": lambda: codec.loads_attrs(encoded),
+        "CompactMetadata": lambda: [CompactMetadata.from_wire(m) for m in codec.loads(encoded)],
+    }
+    baseline = None
+    for name, build in builders.items():
+        size = working_set_size(build)
+        secs = min(timeit.repeat(build, number=1, repeat=3))
+        baseline = baseline or size
+        print(f"{name:>16} {size / args.entities:7.0f} bytes/entity  x{baseline / size:.2f}"
+              f"  decode {secs * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Throughput and latency of the SDK hot paths, measured against the
+in-process stand-in engine (tests.local_engine).
+
+Scenarios:
+    crud        EntityCRUD create/get/update/filter at several concurrency levels
+    scan        filter_iter scan rate
+    dispatch    provider server handler dispatch for entity_procedure,
+                kind_procedure and intentful ('on') handlers
+    decode      json_loads_attrs decode cost per entity
+    memory      memory per decoded entity kept in a local working set
+
+Results are written as JSON, pass a previous result file to --compare to
+print the change of every metric.
+
+    python -m benchmarks.sdk_benchmark [--scenario crud ...] [--quick]
+        [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List
+
+import opentracing
+from aiohttp import ClientSession
+
+from papiea.client import EntityCRUD
+from papiea.codec import JsonCodec, get_default_codec
+from papiea.core import AttributeDict, CompactEntity, ProcedureDescription, Spec
+from papiea.python_sdk import ProviderSdk
+from papiea.transport import Transport
+from papiea.utils import json_loads_attrs
+from tests.local_engine import LocalEngine
+
+logger = logging.getLogger(__name__)
+
+HOST = "127.0.0.1"
+PREFIX = "benchmark_provider"
+VERSION = "0.1.0"
+KIND = "bucket"
+ADMIN_KEY = "benchmark_admin_key"
+
+KIND_DESCRIPTION = {
+    KIND: {
+        "type": "object",
+        "x-papiea-entity": "differ",
+        "properties": {
+            "name": {"type": "string"},
+            "size": {"type": "number"},
+            "tags": {"type": "array", "items": {"type": "string"}},
+        },
+    }
+}
+
+# Number of operations per scenario (full run, quick run)
+SIZES = {
+    "crud": (2000, 200),
+    "scan": (20000, 2000),
+    "dispatch": (5000, 500),
+    "decode": (10000, 1000),
+    "memory": (50000, 5000),
+}
+CONCURRENCY_LEVELS = (1, 8, 32, 128)
+
+
+def bucket_spec(i: int) -> Spec:
+    return Spec(name=f"bucket-{i}", size=i, tags=["benchmark", f"group-{i % 10}"])
+
+
+def entity_document(i: int) -> dict:
+    return {
+        "metadata": {
+            "uuid": f"{i:08d}-0000-4000-8000-000000000000",
+            "kind": KIND,
+            "spec_version": i % 7 + 1,
+            "provider_prefix": PREFIX,
+            "provider_version": VERSION,
+            "created_at": "2020-12-01T10:00:00.000Z",
+            "deleted_at": None,
+            "extension": {"owner": "benchmark"},
+        },
+        "spec": dict(bucket_spec(i)),
+        "status": dict(bucket_spec(i)),
+    }
+
+
+def latency_summary(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "ops": len(latencies),
+        "ops_per_sec": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if len(latencies) >= 100 else latencies[-1] * 1000,
+    }
+
+
+async def run_concurrently(operation: Callable[[int], Awaitable[Any]], count: int, concurrency: int) \
+        -> Dict[str, float]:
+    latencies = []
+    indexes = iter(range(count))
+
+    async def worker():
+        for i in indexes:
+            start = time.perf_counter()
+            await operation(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+class BenchmarkEnvironment(object):
+    """Stand-in engine plus a registered provider serving the benchmark kind."""
+
+    def __init__(self, engine_port: int, provider_port: int):
+        self.engine = LocalEngine(HOST, engine_port)
+        self.provider_port = provider_port
+        self.transport = Transport()
+        self.sdk = None
+
+    async def __aenter__(self) -> "BenchmarkEnvironment":
+        await self.engine.start()
+        self.sdk = ProviderSdk.create_provider(self.engine.url, ADMIN_KEY, HOST, self.provider_port, logger=logger,
+                                               tracer=opentracing.Tracer(), transport=self.transport)
+        self.sdk.version(VERSION)
+        self.sdk.prefix(PREFIX)
+        bucket = self.sdk.new_kind(KIND_DESCRIPTION)
+
+        async def entity_noop(ctx, entity, input):
+            return entity.spec.size
+
+        async def kind_noop(ctx, input):
+            return input
+
+        async def on_size(ctx, entity, input):
+            await ctx.update_status(entity.metadata, {"size": entity.spec.size})
+
+        bucket.entity_procedure("entity_noop", ProcedureDescription(), entity_noop)
+        bucket.kind_procedure("kind_noop", ProcedureDescription(), kind_noop)
+        bucket.on("size", on_size)
+        await self.sdk.register()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.sdk.server.close()
+        await self.sdk.__aexit__(exc_type, exc_val, exc_tb)
+        await self.engine.close()
+
+    def client(self) -> EntityCRUD:
+        return EntityCRUD(self.engine.url, PREFIX, VERSION, KIND, ADMIN_KEY, logger=logger,
+                          tracer=opentracing.Tracer(), transport=self.transport)
+
+    def seed(self, count: int) -> None:
+        # Scans only need stored entities, seeding bypasses the HTTP API
+        store = self.engine.entities.setdefault((PREFIX, VERSION, KIND), {})
+        store.clear()
+        for i in range(count):
+            document = entity_document(i)
+            store[document["metadata"]["uuid"]] = document
+
+
+async def crud_scenario(env: BenchmarkEnvironment, count: int) -> Dict[str, Any]:
+    results = {}
+    async with env.client() as client:
+        for concurrency in CONCURRENCY_LEVELS:
+            env.seed(0)
+            created = [None] * count
+
+            async def create(i):
+                created[i] = await client.create(AttributeDict(spec=bucket_spec(i)))
+
+            async def get(i):
+                await client.get(created[i].metadata)
+
+            async def update(i):
+                await client.update(created[i].metadata, bucket_spec(i + 1))
+
+            async def filter_(i):
+                await client.filter({"spec": {"name": f"bucket-{i}"}})
+
+            results[f"c{concurrency}"] = {
+                "create": await run_concurrently(create, count, concurrency),
+                "get": await run_concurrently(get, count, concurrency),
+                "update": await run_concurrently(update, count, concurrency),
+                "filter": await run_concurrently(filter_, min(count, 500), concurrency),
+            }
+    return results
+
+
+async def scan_scenario(env: BenchmarkEnvironment, count: int) -> Dict[str, Any]:
+    env.seed(count)
+    results = {}
+    async with env.client() as client:
+        for batch_size, prefetch in ((100, 0), (100, 1), (1000, 1)):
+            iterator = await client.filter_iter({}, prefetch=prefetch, stop_on_short_page=True)
+            start = time.perf_counter()
+            scanned = 0
+            async for _ in iterator(batch_size):
+                scanned += 1
+            elapsed = time.perf_counter() - start
+            assert scanned == count, f"Scanned {scanned} of {count} entities"
+            results[f"batch{batch_size}_prefetch{prefetch}"] = {
+                "entities": scanned,
+                "entities_per_sec": scanned / elapsed,
+            }
+    return results
+
+
+async def dispatch_scenario(env: BenchmarkEnvironment, count: int) -> Dict[str, Any]:
+    env.seed(2)
+    codec = get_default_codec()
+    base_url = env.sdk.server.callback_url()
+    document = entity_document(1)
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {ADMIN_KEY}"}
+    # Bodies are the ones the engine sends to each type of callback
+    handlers = {
+        "entity_procedure": (f"{base_url}/{KIND}/entity_noop", dict(document, input=1)),
+        "kind_procedure": (f"{base_url}/{KIND}/kind_noop", {"input": 1}),
+        "on": (f"{base_url}/{KIND}/size", dict(document, input=[{
+            "keys": {}, "key": "size", "path": ["size"], "spec": [2], "status": [1]
+        }])),
+    }
+    results = {}
+    async with ClientSession() as session:
+        for name, (url, body) in handlers.items():
+            data = codec.dumps(body)
+
+            async def call(i):
+                async with session.post(url, data=data, headers=headers) as resp:
+                    await resp.read()
+                    assert resp.status == 200, f"{name} handler returned {resp.status}"
+
+            results[name] = {f"c{c}": await run_concurrently(call, count, c) for c in (1, 32)}
+    return results
+
+
+async def decode_scenario(env: BenchmarkEnvironment, count: int) -> Dict[str, Any]:
+    encoded = JsonCodec().dumps({"results": [entity_document(i) for i in range(count)], "entity_count": count})
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        json_loads_attrs(encoded)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        "codec": get_default_codec().name,
+        "page_bytes": len(encoded),
+        "page_ms": best * 1000,
+        "us_per_entity": best / count * 1e6,
+    }
+
+
+async def memory_scenario(env: BenchmarkEnvironment, count: int) -> Dict[str, Any]:
+    encoded = [JsonCodec().dumps(entity_document(i)) for i in range(count)]
+
+    def per_entity(build: Callable[[bytes], Any]) -> float:
+        tracemalloc.start()
+        working_set = [build(document) for document in encoded]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del working_set
+        return size / count
+
+    return {
+        "entities": count,
+        "attribute_dict_bytes": per_entity(json_loads_attrs),
+        "compact_entity_bytes": per_entity(lambda document: CompactEntity(**json.loads(document))),
+    }
+
+
+SCENARIOS = {
+    "crud": crud_scenario,
+    "scan": scan_scenario,
+    "dispatch": dispatch_scenario,
+    "decode": decode_scenario,
+    "memory": memory_scenario,
+}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL) \
+            .decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(scenarios: List[str], quick: bool, engine_port: int, provider_port: int) -> Dict[str, Any]:
+    results = {}
+    async with BenchmarkEnvironment(engine_port, provider_port) as env:
+        for name in scenarios:
+            count = SIZES[name][1 if quick else 0]
+            print(f"Running {name} ({count})")
+            results[name] = await SCENARIOS[name](env, count)
+    return results
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f"Compared to {baseline['meta']['revision']} ({baseline['meta']['timestamp']})")
+    previous = flatten(baseline["results"])
+    for metric, value in flatten(current["results"]).items():
+        if previous.get(metric):
+            print(f"{metric:<50} {previous[metric]:12.2f} -> {value:12.2f}  {value / previous[metric] - 1:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="Scenario to run, may be repeated (all by default)")
+    parser.add_argument("--quick", action="store_true", help="Run with 10 times fewer operations")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="Previous result file to compare with")
+    parser.add_argument("--engine-port", type=int, default=3100)
+    parser.add_argument("--provider-port", type=int, default=9100)
+    args = parser.parse_args()
+
+    scenarios = args.scenario or list(SCENARIOS)
+    current = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "codec": get_default_codec().name,
+            "quick": args.quick,
+        },
+        "results": asyncio.run(run(scenarios, args.quick, args.engine_port, args.provider_port)),
+    }
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(current, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
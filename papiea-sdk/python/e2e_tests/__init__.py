@@ -8,7 +8,6 @@ from yaml import load as load_yaml
 
 from papiea.client import EntityCRUD
 from papiea.core import AttributeDict
-from papiea.tracing_utils import init_default_tracer
 
 SERVER_PORT = int(os.environ.get("SERVER_PORT", "3000"))
 PAPIEA_ADMIN_S2S_KEY = os.environ.get("PAPIEA_ADMIN_S2S_KEY", "")
@@ -35,7 +34,7 @@ logging.basicConfig(
 )
 
 
-def get_client(kind: str, tracer: Tracer = init_default_tracer()):
+def get_client(kind: str, tracer: Optional[Tracer] = None):
     return EntityCRUD(
         PAPIEA_URL, PROVIDER_PREFIX, PROVIDER_VERSION, kind, USER_S2S_KEY, tracer=tracer
     )
@@ -1,20 +1,24 @@
 import e2e_tests as papiea_test
 
 
+def raise_bulk_errors(results):
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+
+
 async def cleanup():
     async with papiea_test.get_client(papiea_test.OBJECT_KIND) as object_entity_client:
         try:
             object_list = await object_entity_client.get_all()
-            for obj in object_list:
-                await object_entity_client.delete(obj.metadata)
+            raise_bulk_errors(await object_entity_client.delete_many(obj.metadata for obj in object_list))
         except:
             raise
 
     async with papiea_test.get_client(papiea_test.BUCKET_KIND) as bucket_entity_client:
         try:
             bucket_list = await bucket_entity_client.get_all()
-            for bucket in bucket_list:
-                await bucket_entity_client.delete(bucket.metadata)
+            raise_bulk_errors(await bucket_entity_client.delete_many(bucket.metadata for bucket in bucket_list))
         except:
             raise
 
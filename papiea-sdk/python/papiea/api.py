@@ -1,24 +1,58 @@
-import json
+import asyncio
 import logging
+import time
 from types import TracebackType
-from typing import Any, Optional, Type
+from typing import Any, Dict, Optional, Tuple, Type
 
 from aiohttp import ClientSession, ClientTimeout
-from multidict import CIMultiDict
-
-from papiea.python_sdk_exceptions import (
-    ApiException,
-    ConflictingEntityException,
-    EntityNotFoundException,
-    PermissionDeniedException,
-    ProcedureInvocationException,
-    UnauthorizedException,
-    ValidationException,
-    BadRequestException,
-    PapieaServerException,
-    check_response
-)
-from papiea.utils import json_loads_attrs
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from papiea.python_sdk_exceptions import check_response
+from papiea.codec import JsonCodec, get_default_codec
+from papiea.retry import RetryPolicy, get_default_retry_policy
+from papiea.transport import Transport, get_default_transport
+from papiea.utils import json_loads_attrs, retrieve_exception
+
+BODY_METHODS = ("post", "put", "patch")
+
+
+class Operation(str):
+    Get = "get"
+    Filter = "filter"
+    Update = "update"
+    Create = "create"
+    Delete = "delete"
+    Procedure = "procedure"
+
+
+class RequestTimeouts(object):
+    """
+    Timeouts of a request in seconds, None meaning no limit: `connect` to
+    get a connection, `read` between two reads of the response and `total`
+    for the whole request.
+    """
+
+    def __init__(self, connect: Optional[float] = None, read: Optional[float] = None,
+                 total: Optional[float] = None):
+        self.connect = connect
+        self.read = read
+        self.total = total
+        self.client_timeout = ClientTimeout(total=total, sock_connect=connect, sock_read=read)
+
+
+# Procedures may legitimately run for long, they are only bounded by the
+# connect timeout unless configured otherwise. So are entity creations and
+# deletions, which run the provider's constructor and destructor before the
+# engine answers
+DEFAULT_TIMEOUTS: Dict[str, RequestTimeouts] = {
+    Operation.Get: RequestTimeouts(connect=2, read=5, total=10),
+    Operation.Filter: RequestTimeouts(connect=2, read=30, total=60),
+    Operation.Update: RequestTimeouts(connect=2, read=10, total=30),
+    Operation.Create: RequestTimeouts(connect=2),
+    Operation.Delete: RequestTimeouts(connect=2),
+    Operation.Procedure: RequestTimeouts(connect=2),
+}
+
 
 class ApiInstance:
     def __init__(
@@ -27,13 +61,34 @@ class ApiInstance:
             timeout: int = 5000,
             headers: dict = {},
             *,
-            logger: logging.Logger
+            logger: logging.Logger,
+            transport: Optional[Transport] = None,
+            codec: Optional[JsonCodec] = None,
+            retry_policy: Optional[RetryPolicy] = None,
+            timeouts: Optional[Dict[str, RequestTimeouts]] = None,
+            coalesce_reads: bool = False
     ):
         self.base_url = base_url
         self.headers = headers
+        # In milliseconds, the total timeout of requests that are not one
+        # of the operations in `timeouts`
         self.timeout = timeout
-        self.session = ClientSession(timeout=ClientTimeout(total=timeout))
+        self.client_timeout = ClientTimeout(total=timeout / 1000)
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
         self.logger = logger
+        self.codec = codec if codec is not None else get_default_codec()
+        self.transport = transport if transport is not None else get_default_transport()
+        self.retry_policy = retry_policy if retry_policy is not None else get_default_retry_policy()
+        # Identical concurrent gets and filters share a single request (and
+        # its decoded result, which callers must not modify)
+        self.coalesce_reads = coalesce_reads
+        self.coalesced = 0
+        self.coalesce_leaders = 0
+        self._in_flight: Dict[Tuple[Any, ...], asyncio.Future] = {}
+        self.transport.acquire()
+        self._closed = False
 
     async def __aenter__(self) -> "ApiInstance":
         return self
@@ -46,87 +101,124 @@ class ApiInstance:
     ) -> None:
         await self.close()
 
+    @property
+    def headers(self) -> CIMultiDictProxy:
+        return self._base_headers
+
+    @headers.setter
+    def headers(self, headers: dict) -> None:
+        self._base_headers = CIMultiDictProxy(CIMultiDict(headers))
+
+    @property
+    def session(self) -> ClientSession:
+        return self.transport.session
+
     @staticmethod
     def check_result(res: Any) -> Any:
         if res == "":
             return None
         return json_loads_attrs(res)
 
-    async def call(self, method: str, prefix: str, data: Any, headers: dict = {}):
-        new_headers = CIMultiDict()
-        new_headers.update(self.headers)
-        new_headers.update(headers)
-        data_binary = json.dumps(data).encode("utf-8")
-        # TODO: this is too much code duplication but I cannot think of
-        # a way outside macros that could abstract async with block
-        # and sadly there are no macro in python
-        if method == "get":
-            async with self.session.get(
-                    self.base_url + "/" + prefix, headers=new_headers
-            ) as resp:
-                await check_response(resp, self.logger)
-                res = await resp.text()
-            return self.check_result(res)
-        elif method == "post":
-            async with self.session.post(
-                    self.base_url + "/" + prefix, data=data_binary, headers=new_headers
-            ) as resp:
-                await check_response(resp, self.logger)
-                res = await resp.text()
-            return self.check_result(res)
-        elif method == "put":
-            async with self.session.put(
-                    self.base_url + "/" + prefix, data=data_binary, headers=new_headers
-            ) as resp:
-                await check_response(resp, self.logger)
-                res = await resp.text()
-            return self.check_result(res)
-        elif method == "patch":
-            async with self.session.patch(
-                    self.base_url + "/" + prefix, data=data_binary, headers=new_headers
-            ) as resp:
-                await check_response(resp, self.logger)
-                res = await resp.text()
-            return self.check_result(res)
-        elif method == "delete":
-            async with self.session.delete(
-                    self.base_url + "/" + prefix, headers=new_headers
-            ) as resp:
-                await check_response(resp, self.logger)
-                res = await resp.text()
-            return self.check_result(res)
-
-    async def make_request(self, method: str, prefix: str, data: Any, headers: dict):
+    def decode_result(self, res: bytes) -> Any:
+        if not res:
+            return None
+        return self.codec.loads_attrs(res)
+
+    async def call(self, method: str, prefix: str, data: Any, headers: dict = {}, operation: Optional[str] = None):
+        breaker = self.transport.circuit_breaker
+        if breaker is None:
+            return await self._send(method, prefix, data, headers, operation)
+        probe = breaker.acquire()
+        start = time.monotonic()
         try:
-            return await self.call(method, prefix, data, headers)
-        except (ConflictingEntityException, EntityNotFoundException,
-                PermissionDeniedException, ProcedureInvocationException,
-                UnauthorizedException, ValidationException, BadRequestException,
-                PapieaServerException, ApiException):
+            res = await self._send(method, prefix, data, headers, operation)
+        except Exception as e:
+            breaker.record(probe, breaker.is_failure(e), time.monotonic() - start)
             raise
-        except:
-            self.logger.debug("RENEWING SESSION")
-            await self.renew_session()
-            return await self.call(method, prefix, data, headers)
+        except BaseException:
+            breaker.release(probe)
+            raise
+        breaker.record(probe, False, time.monotonic() - start)
+        return res
 
-    async def post(self, prefix: str, data: Any, headers: dict = {}) -> Any:
-        return await self.make_request("post", prefix, data, headers)
+    async def _send(self, method: str, prefix: str, data: Any, headers: dict, operation: Optional[str]):
+        # Per-call headers (e.g. tracing context) are layered on top of the
+        # immutable base set, the shared instance state is never modified
+        if headers:
+            request_headers = CIMultiDict(self._base_headers)
+            request_headers.update(headers)
+        else:
+            request_headers = self._base_headers
+        data_binary = None
+        if method in BODY_METHODS:
+            data_binary = self.codec.dumps(data)
+        timeouts = self.timeouts.get(operation)
+        async with self.session.request(
+                method, self.base_url + "/" + prefix, data=data_binary, headers=request_headers,
+                timeout=timeouts.client_timeout if timeouts is not None else self.client_timeout
+        ) as resp:
+            await check_response(resp, self.logger, self.codec)
+            res = await resp.read()
+        return self.decode_result(res)
 
-    async def put(self, prefix: str, data: Any, headers: dict = {}) -> Any:
-        return await self.make_request("put", prefix, data, headers)
+    async def make_request(self, method: str, prefix: str, data: Any, headers: dict, idempotent: bool = False,
+                           operation: Optional[str] = None):
+        # A failed request only loses its own connection (aiohttp does not
+        # return broken connections to the pool), the shared session and
+        # the other requests on it are left alone
+        def request():
+            return self.retry_policy.call(
+                method, idempotent, lambda: self.call(method, prefix, data, headers, operation)
+            )
 
-    async def patch(self, prefix: str, data: Any, headers: dict = {}) -> Any:
-        return await self.make_request("patch", prefix, data, headers)
+        if not self.coalesce_reads or (method != "get" and operation != Operation.Filter):
+            return await request()
+        key = (method, prefix, self.codec.dumps(data) if method in BODY_METHODS else None, self._authorization(headers))
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.coalesce_leaders += 1
+            future = self._in_flight[key] = asyncio.ensure_future(request())
+            future.add_done_callback(retrieve_exception)
+            future.add_done_callback(lambda done: self._request_done(key, done))
+        # A caller going away must not cancel the request other callers share
+        return await asyncio.shield(future)
 
-    async def get(self, prefix: str, headers: dict = {}) -> Any:
-        return await self.make_request("get", prefix, {}, headers)
+    def _request_done(self, key: Tuple[Any, ...], future: asyncio.Future) -> None:
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
 
-    async def delete(self, prefix: str, headers: dict = {}) -> Any:
-        return await self.make_request("delete", prefix, {}, headers)
+    def _authorization(self, headers: dict) -> Optional[str]:
+        for name, value in headers.items():
+            if name.lower() == "authorization":
+                return value
+        return self._base_headers.get("Authorization")
 
-    async def close(self):
-        await self.session.close()
+    def coalescing_metrics(self) -> Dict[str, int]:
+        return {"requests": self.coalesce_leaders, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
 
-    async def renew_session(self):
-        await self.close()
-        self.session = ClientSession(timeout=ClientTimeout(total=self.timeout))
+    async def post(self, prefix: str, data: Any, headers: dict = {}, idempotent: bool = False,
+                   operation: Optional[str] = None) -> Any:
+        return await self.make_request("post", prefix, data, headers, idempotent, operation)
+
+    async def put(self, prefix: str, data: Any, headers: dict = {}, idempotent: bool = False,
+                  operation: Optional[str] = Operation.Update) -> Any:
+        return await self.make_request("put", prefix, data, headers, idempotent, operation)
+
+    async def patch(self, prefix: str, data: Any, headers: dict = {}, idempotent: bool = False,
+                    operation: Optional[str] = Operation.Update) -> Any:
+        return await self.make_request("patch", prefix, data, headers, idempotent, operation)
+
+    async def get(self, prefix: str, headers: dict = {}, operation: Optional[str] = Operation.Get) -> Any:
+        return await self.make_request("get", prefix, {}, headers, operation=operation)
+
+    async def delete(self, prefix: str, headers: dict = {}, idempotent: bool = False,
+                     operation: Optional[str] = Operation.Delete) -> Any:
+        return await self.make_request("delete", prefix, {}, headers, idempotent, operation)
+
+    async def close(self):
+        # The transport is shared, it is closed after its last user is gone
+        if not self._closed:
+            self._closed = True
+            await self.transport.release()
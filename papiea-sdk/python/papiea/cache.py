@@ -0,0 +1,106 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from .utils import retrieve_exception
+
+
+class TtlCache(object):
+    """
+    Bounded LRU cache whose entries expire `ttl_secs` after they were stored.
+
+    `get_or_load` deduplicates concurrent loads of the same key: callers
+    missing the cache while a load is in flight wait for that load instead
+    of starting their own. Only successful loads are cached, and a load
+    finishing after its key was invalidated is not.
+    """
+
+    def __init__(self, ttl_secs: float, max_size: int = 1024):
+        self.ttl_secs = ttl_secs
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry[1] <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key: Hashable) -> Any:
+        # Like get, without counting a hit or miss and touching the LRU order
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.ttl_secs <= 0 or self.max_size <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.monotonic() + self.ttl_secs)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        future = self._loading.get(key)
+        if future is None:
+            future = self._loading[key] = asyncio.ensure_future(self._load(key, load))
+            future.add_done_callback(retrieve_exception)
+        # A caller going away must not cancel the load other callers share
+        return await asyncio.shield(future)
+
+    async def _load(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        self.loads += 1
+        try:
+            value = await load()
+            if self._loading.get(key) is asyncio.current_task():
+                self.set(key, value)
+            return value
+        finally:
+            if self._loading.get(key) is asyncio.current_task():
+                del self._loading[key]
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+        self._loading.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+        for key in [key for key in self._loading if predicate(key)]:
+            del self._loading[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._loading.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+        }
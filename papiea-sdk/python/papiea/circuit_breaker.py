@@ -0,0 +1,149 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from aiohttp import ClientConnectionError
+
+from .python_sdk_exceptions import CircuitOpenException, PapieaBaseException, ProcedureInvocationException
+
+OVERLOAD_STATUSES = (429, 502, 503, 504)
+
+
+class CircuitState(str):
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half_open"
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker for the requests sent to the engine.
+
+    The outcome of the last `window_size` requests is kept. Once at least
+    `min_calls` of them are known, the circuit opens when the share of
+    failed requests reaches `error_rate_threshold` or the share of requests
+    slower than `slow_call_secs` reaches `slow_call_rate_threshold`. While
+    open, requests fail fast with CircuitOpenException. After `open_secs`
+    up to `half_open_probes` requests are let through: if they all succeed
+    (and are not slow) the circuit closes, otherwise it opens again.
+
+    Connection errors, timeouts, overload answers (429, 502, 503, 504) and
+    5xx answers without a Papiea error body are failures. Other typed Papiea
+    errors (not found, conflicts, validation, and procedure invocation errors
+    which carry the provider's own status) mean that the engine is healthy
+    and count as successes.
+    """
+
+    def __init__(
+            self,
+            error_rate_threshold: float = 0.5,
+            slow_call_secs: Optional[float] = None,
+            slow_call_rate_threshold: float = 1.0,
+            window_size: int = 50,
+            min_calls: int = 10,
+            open_secs: float = 5,
+            half_open_probes: int = 1
+    ):
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_secs = slow_call_secs
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_secs = open_secs
+        self.half_open_probes = half_open_probes
+        self.state = CircuitState.Closed
+        self.opened = 0
+        self.rejected = 0
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        self._failures = 0
+        self._slow = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    @staticmethod
+    def is_failure(error: BaseException) -> bool:
+        if isinstance(error, (ClientConnectionError, asyncio.TimeoutError)):
+            return True
+        if isinstance(error, ProcedureInvocationException):
+            return False
+        if isinstance(error, PapieaBaseException):
+            return error.resp.status in OVERLOAD_STATUSES
+        status = getattr(error, "status", None)
+        return status is not None and (status >= 500 or status in OVERLOAD_STATUSES)
+
+    def acquire(self) -> bool:
+        """
+        Lets a request through or raises CircuitOpenException. Returns
+        whether the request is a half-open probe, which must be passed back
+        to `record` or `release`.
+        """
+        if self.state == CircuitState.Open:
+            retry_after = self._opened_at + self.open_secs - time.monotonic()
+            if retry_after > 0:
+                self.rejected += 1
+                raise CircuitOpenException(retry_after)
+            self.state = CircuitState.HalfOpen
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        if self.state == CircuitState.HalfOpen:
+            if self._probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenException(self.open_secs)
+            self._probes_in_flight += 1
+            return True
+        return False
+
+    def release(self, probe: bool) -> None:
+        # The request was cancelled, its outcome tells nothing
+        if probe and self.state == CircuitState.HalfOpen:
+            self._probes_in_flight -= 1
+
+    def record(self, probe: bool, failed: bool, latency_secs: float) -> None:
+        slow = self.slow_call_secs is not None and latency_secs >= self.slow_call_secs
+        if self.state == CircuitState.HalfOpen:
+            if not probe:
+                return
+            self._probes_in_flight -= 1
+            if failed or slow:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._close()
+            return
+        if self.state == CircuitState.Open:
+            # Requests sent before the circuit opened
+            return
+        if len(self._outcomes) == self._outcomes.maxlen:
+            old_failed, old_slow = self._outcomes[0]
+            self._failures -= old_failed
+            self._slow -= old_slow
+        self._outcomes.append((failed, slow))
+        self._failures += failed
+        self._slow += slow
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and (self._failures / calls >= self.error_rate_threshold
+                                        or self._slow / calls >= self.slow_call_rate_threshold):
+            self._open()
+
+    def _open(self) -> None:
+        self.state = CircuitState.Open
+        self.opened += 1
+        self._opened_at = time.monotonic()
+
+    def _close(self) -> None:
+        self.state = CircuitState.Closed
+        self._outcomes.clear()
+        self._failures = 0
+        self._slow = 0
+
+    def metrics(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "error_rate": self._failures / calls if calls else 0.0,
+            "slow_call_rate": self._slow / calls if calls else 0.0,
+        }
@@ -1,19 +1,34 @@
+import asyncio
+import random
 import time
 import logging
+from collections import OrderedDict, deque
 from types import TracebackType
-from typing import Any, Optional, List, Type, Callable, AsyncGenerator
+from typing import Any, AsyncIterable, Awaitable, Optional, Dict, Iterable, List, Set, Type, Callable, \
+    AsyncGenerator, Tuple, Union
 
 from opentracing import Tracer
 
-from .api import ApiInstance
+from .api import ApiInstance, Operation, RequestTimeouts
+from .cache import TtlCache
+from .codec import JsonCodec
 from .core import AttributeDict, Entity, EntityReference, EntitySpec, IntentfulStatus, IntentWatcher, Metadata, Secret, \
-    Spec
-from .tracing_utils import init_default_tracer, inject_tracing_headers
+    Spec, lazy_attribute_view
+from .tracing_utils import close_tracer, get_default_tracer, tracing_headers
+from .transport import Transport
+from .utils import copy_json
 
 FilterResults = AttributeDict
 
+# Bulk results keep the input order, a failed item holds its exception
+BulkResults = List[Union[Any, Exception]]
+
 BATCH_SIZE = 20
 
+BULK_CONCURRENCY = 16
+
+INTENT_WATCHER_PAGE_SIZE = 1000
+
 
 class EntityCRUD(object):
     def __init__(
@@ -24,7 +39,13 @@ class EntityCRUD(object):
             kind: str,
             s2skey: Optional[str] = None,
             logger: logging.Logger = logging.getLogger(__name__),
-            tracer: Tracer = init_default_tracer()
+            tracer: Optional[Tracer] = None,
+            transport: Optional[Transport] = None,
+            codec: Optional[JsonCodec] = None,
+            timeouts: Optional[Dict[str, RequestTimeouts]] = None,
+            coalesce_reads: bool = False,
+            entity_cache_ttl_secs: float = 0,
+            entity_cache_size: int = 1024
     ):
         headers = {
             "Content-Type": "application/json",
@@ -32,11 +53,16 @@ class EntityCRUD(object):
         if s2skey is not None:
             headers["Authorization"] = f"Bearer {s2skey}"
         self.api_instance = ApiInstance(
-            f"{papiea_url}/services/{prefix}/{version}/{kind}", headers=headers, logger=logger
+            f"{papiea_url}/services/{prefix}/{version}/{kind}", headers=headers, logger=logger,
+            transport=transport, codec=codec, timeouts=timeouts, coalesce_reads=coalesce_reads
         )
         self.kind = kind
-        self.tracer = tracer
+        self.tracer = tracer if tracer is not None else get_default_tracer()
         self.__constructor_present = None
+        # Read-through cache of get, see observe_entity
+        self.entity_cache = None
+        if entity_cache_ttl_secs > 0:
+            self.entity_cache = TtlCache(entity_cache_ttl_secs, entity_cache_size)
 
     async def __aenter__(self) -> "EntityCRUD":
         return self
@@ -47,55 +73,160 @@ class EntityCRUD(object):
             exc_val: Optional[BaseException],
             exc_tb: Optional[TracebackType],
     ) -> None:
+        await self.close()
+
+    async def close(self) -> None:
         await self.api_instance.close()
-        self.tracer.close()
+        close_tracer(self.tracer)
+
+    def coalescing_metrics(self) -> Dict[str, int]:
+        return self.api_instance.coalescing_metrics()
 
     async def get(self, entity_reference: EntityReference) -> Entity:
+        if self.entity_cache is None:
+            return await self._get(entity_reference)
+        # Callers get their own copy, handlers commonly modify the entity
+        return copy_json(await self.entity_cache.get_or_load(
+            entity_reference.uuid, lambda: self._get(entity_reference)
+        ))
+
+    async def _get(self, entity_reference: EntityReference) -> Entity:
         with self.tracer.start_span(operation_name=f"get_entity_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
-            return await self.api_instance.get(entity_reference.uuid)
+            headers = tracing_headers(self.tracer, span)
+            return await self.api_instance.get(entity_reference.uuid, headers=headers)
 
     async def get_all(self) -> List[Entity]:
         with self.tracer.start_span(operation_name=f"list_entities_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
-            res = await self.api_instance.get("")
+            headers = tracing_headers(self.tracer, span)
+            res = await self.api_instance.get("", headers=headers)
             return res.results
 
     async def create(self, payload: Any) -> EntitySpec:
         with self.tracer.start_span(operation_name=f"create_entity_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
-            return await self.api_instance.post("", payload)
+            headers = tracing_headers(self.tracer, span)
+            res = await self.api_instance.post("", payload, headers=headers, operation=Operation.Create)
+        if self.entity_cache is not None and res and res.get("metadata") and "spec" in res:
+            self.entity_cache.set(res.metadata.uuid, copy_json(AttributeDict(
+                metadata=res.metadata, spec=res.spec, status=res.get("status")
+            )))
+        return res
 
     async def update(self, metadata: Metadata, spec: Spec) -> EntitySpec:
         with self.tracer.start_span(operation_name=f"update_entity_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
+            headers = tracing_headers(self.tracer, span)
             payload = {"metadata": {"spec_version": metadata.spec_version}, "spec": spec}
-            return await self.api_instance.put(metadata.uuid, payload)
+            res = await self.api_instance.put(metadata.uuid, payload, headers=headers)
+        if self.entity_cache is not None:
+            self._cache_update(metadata, spec)
+        return res
+
+    def _cache_update(self, metadata: Metadata, spec: Spec) -> None:
+        # The engine only answers with the intent watcher. The spec written at
+        # the next spec version is known, the status is kept as last read,
+        # like any cached status it is up to the cache ttl stale
+        cached = self.entity_cache.peek(metadata.uuid)
+        if cached is None or cached.metadata.get("spec_version") != metadata.spec_version:
+            self.entity_cache.invalidate(metadata.uuid)
+            return
+        entity = copy_json(cached)
+        entity.metadata["spec_version"] = metadata.spec_version + 1
+        entity["spec"] = lazy_attribute_view(copy_json(spec))
+        self.entity_cache.set(metadata.uuid, entity)
 
     async def delete(self, entity_reference: EntityReference) -> None:
+        if self.entity_cache is not None:
+            self.entity_cache.invalidate(entity_reference.uuid)
         with self.tracer.start_span(operation_name=f"delete_entity_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
-            return await self.api_instance.delete(entity_reference.uuid)
+            headers = tracing_headers(self.tracer, span)
+            return await self.api_instance.delete(entity_reference.uuid, headers=headers)
+
+    def observe_entity(self, entity: Entity) -> None:
+        """
+        Drops the cached entity when `entity`, e.g. the one a handler was
+        invoked with, has a newer spec version.
+        """
+        if self.entity_cache is None:
+            return
+        cached = self.entity_cache.peek(entity.metadata.uuid)
+        if cached is not None and (cached.metadata.get("spec_version") or 0) < \
+                (entity.metadata.get("spec_version") or 0):
+            self.entity_cache.invalidate(entity.metadata.uuid)
+
+    def entity_cache_metrics(self) -> Dict[str, Any]:
+        return self.entity_cache.metrics() if self.entity_cache is not None else {}
+
+    async def get_many(self, entity_references: Union[Iterable[EntityReference], AsyncIterable[EntityReference]],
+                       concurrency: int = BULK_CONCURRENCY) -> BulkResults:
+        return await run_bulk(self.get, entity_references, concurrency)
+
+    async def create_many(self, payloads: Union[Iterable[Any], AsyncIterable[Any]],
+                          concurrency: int = BULK_CONCURRENCY) -> BulkResults:
+        return await run_bulk(self.create, payloads, concurrency)
+
+    async def update_many(self, entities: Union[Iterable[Tuple[Metadata, Spec]], AsyncIterable[Tuple[Metadata, Spec]]],
+                          concurrency: int = BULK_CONCURRENCY) -> BulkResults:
+        async def update(entity: Tuple[Metadata, Spec]) -> EntitySpec:
+            metadata, spec = entity
+            return await self.update(metadata, spec)
+
+        return await run_bulk(update, entities, concurrency)
+
+    async def delete_many(self, entity_references: Union[Iterable[EntityReference], AsyncIterable[EntityReference]],
+                          concurrency: int = BULK_CONCURRENCY) -> BulkResults:
+        return await run_bulk(self.delete, entity_references, concurrency)
 
     async def filter(self, filter_obj: Any) -> FilterResults:
         with self.tracer.start_span(operation_name=f"filter_entities_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
-            return await self.api_instance.post("filter", filter_obj)
+            headers = tracing_headers(self.tracer, span)
+            return await self.api_instance.post("filter", filter_obj, headers=headers, idempotent=True,
+                                               operation=Operation.Filter)
+
+    async def filter_iter(self, filter_obj: Any, prefetch: int = 1, stop_on_short_page: bool = False) \
+            -> Callable[[Optional[int], Optional[int]], AsyncGenerator[Any, None]]:
+        """
+        Returns a paginated iterator over the filter results.
+
+        While the caller consumes a page, up to `prefetch` following pages are
+        already being fetched. With `stop_on_short_page` a page shorter than the
+        batch size is taken as the last one, which saves the final request
+        that would otherwise only return an empty page.
+        """
+        async def fetch_page(batch_size: int, offset: int) -> List[Any]:
+            res = await self.api_instance.post(
+                f"filter?limit={batch_size}&offset={offset or ''}", filter_obj, idempotent=True,
+                operation=Operation.Filter
+            )
+            return res.results
 
-    async def filter_iter(self, filter_obj: Any) -> Callable[[Optional[int], Optional[int]], AsyncGenerator[Any, None]]:
         async def iter_func(batch_size: Optional[int] = None, offset: Optional[int] = None):
             if not batch_size:
                 batch_size = BATCH_SIZE
-            res = await self.api_instance.post(f"filter?limit={batch_size}&offset={offset or ''}", filter_obj)
-            if len(res.results) == 0:
-                return
-            else:
-                for entity in res.results:
-                    yield entity
-                offset = offset or 0
-                async for val in iter_func(batch_size, offset + batch_size):
-                    yield val
-                return
+            next_offset = offset or 0
+            pages = deque()
+            exhausted = False
+
+            def schedule_pages(count: int):
+                nonlocal next_offset
+                while not exhausted and len(pages) < count:
+                    pages.append(asyncio.ensure_future(fetch_page(batch_size, next_offset)))
+                    next_offset += batch_size
+
+            try:
+                # The first page and `prefetch` pages ahead of it
+                schedule_pages(prefetch + 1)
+                while pages:
+                    results = await pages.popleft()
+                    if len(results) == 0 or (stop_on_short_page and len(results) < batch_size):
+                        exhausted = True
+                        discard_pages(pages)
+                    else:
+                        schedule_pages(prefetch)
+                    for entity in results:
+                        yield entity
+                    # Without prefetch the next page is only asked for now
+                    schedule_pages(1)
+            finally:
+                discard_pages(pages)
 
         return iter_func
 
@@ -106,17 +237,181 @@ class EntityCRUD(object):
             self, procedure_name: str, entity_reference: EntityReference, input_: Any
     ) -> Any:
         with self.tracer.start_span(operation_name=f"invoke_{procedure_name}_procedure_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
+            headers = tracing_headers(self.tracer, span)
             payload = {"input": input_}
             return await self.api_instance.post(
-                f"{entity_reference.uuid}/procedure/{procedure_name}", payload
+                f"{entity_reference.uuid}/procedure/{procedure_name}", payload, headers=headers,
+                operation=Operation.Procedure
             )
 
     async def invoke_kind_procedure(self, procedure_name: str, input_: Any) -> Any:
         with self.tracer.start_span(operation_name=f"invoke_{procedure_name}_kind_procedure_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
+            headers = tracing_headers(self.tracer, span)
             payload = {"input": input_}
-            return await self.api_instance.post(f"procedure/{procedure_name}", payload)
+            return await self.api_instance.post(
+                f"procedure/{procedure_name}", payload, headers=headers, operation=Operation.Procedure
+            )
+
+
+def discard_pages(pages: "deque[asyncio.Future]") -> None:
+    while pages:
+        page = pages.popleft()
+        if page.done():
+            # Retrieve the result so a failed read-ahead is not reported as unhandled
+            if not page.cancelled():
+                page.exception()
+        else:
+            page.cancel()
+
+
+async def run_bulk(operation: Callable[[Any], Awaitable[Any]],
+                   items: Union[Iterable[Any], AsyncIterable[Any]],
+                   concurrency: int = BULK_CONCURRENCY) -> BulkResults:
+    """
+    Runs `operation` for every item with at most `concurrency` calls in flight.
+
+    Items are pulled lazily, so generators are never materialized. Results are
+    returned in input order and exceptions are collected instead of raised.
+    """
+    results = []
+    if isinstance(items, AsyncIterable):
+        iterator = items.__aiter__()
+        lock = asyncio.Lock()
+
+        async def next_item() -> Optional[Tuple[int, Any]]:
+            # Async generators cannot be advanced by several workers at once
+            async with lock:
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return None
+                results.append(None)
+                return len(results) - 1, item
+    else:
+        iterator = iter(items)
+
+        async def next_item() -> Optional[Tuple[int, Any]]:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return None
+            results.append(None)
+            return len(results) - 1, item
+
+    async def worker() -> None:
+        while True:
+            entry = await next_item()
+            if entry is None:
+                return
+            index, item = entry
+            try:
+                results[index] = await operation(item)
+            except Exception as e:
+                results[index] = e
+
+    await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+    return results
+
+
+class _PooledEntityCRUD(EntityCRUD):
+    # Pooled clients are owned by the EntityClientPool, leaving an
+    # 'async with' block must not close the connection or the shared tracer
+    async def __aexit__(
+            self,
+            exc_type: Optional[Type[BaseException]],
+            exc_val: Optional[BaseException],
+            exc_tb: Optional[TracebackType],
+    ) -> None:
+        pass
+
+    async def close(self) -> None:
+        await self.api_instance.close()
+
+
+class EntityClientPool(object):
+    """
+    Bounded LRU pool of EntityCRUD clients keyed by (token, prefix, version, kind).
+
+    Clients that were not used for `idle_timeout_secs` are evicted, as well as
+    the least recently used ones once the pool grows over `max_size`.
+    """
+
+    def __init__(
+            self,
+            papiea_url: str,
+            max_size: int = 128,
+            idle_timeout_secs: float = 300,
+            logger: logging.Logger = logging.getLogger(__name__),
+            tracer: Optional[Tracer] = None,
+            transport: Optional[Transport] = None,
+            codec: Optional[JsonCodec] = None,
+            entity_cache_ttl_secs: float = 0,
+            entity_cache_size: int = 1024
+    ):
+        self.papiea_url = papiea_url
+        self.max_size = max_size
+        self.idle_timeout_secs = idle_timeout_secs
+        self.logger = logger
+        self.tracer = tracer if tracer is not None else get_default_tracer()
+        self.transport = transport
+        self.codec = codec
+        self.entity_cache_ttl_secs = entity_cache_ttl_secs
+        self.entity_cache_size = entity_cache_size
+        self._clients: "OrderedDict[Tuple[Optional[str], str, str, str], Tuple[EntityCRUD, float]]" = OrderedDict()
+        self._closing: Set[asyncio.Future] = set()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def get(self, prefix: str, version: str, kind: str, s2skey: Optional[str] = None) -> EntityCRUD:
+        now = time.monotonic()
+        self._evict_idle(now)
+        key = (s2skey, prefix, version, kind)
+        entry = self._clients.pop(key, None)
+        if entry is not None:
+            client = entry[0]
+        else:
+            client = _PooledEntityCRUD(
+                self.papiea_url, prefix, version, kind, s2skey, self.logger, self.tracer,
+                transport=self.transport, codec=self.codec,
+                entity_cache_ttl_secs=self.entity_cache_ttl_secs, entity_cache_size=self.entity_cache_size
+            )
+        self._clients[key] = (client, now)
+        while len(self._clients) > self.max_size:
+            _, (evicted, _) = self._clients.popitem(last=False)
+            self._discard(evicted)
+        return client
+
+    def observe_entity(self, prefix: str, version: str, entity: Entity) -> None:
+        # Every user's client of the kind may have cached the entity
+        if self.entity_cache_ttl_secs <= 0:
+            return
+        for (_, client_prefix, client_version, kind), (client, _) in self._clients.items():
+            if (client_prefix, client_version, kind) == (prefix, version, entity.metadata.kind):
+                client.observe_entity(entity)
+
+    def _evict_idle(self, now: float) -> None:
+        # Entries are kept in the order of their last use, so the idle
+        # ones are always at the front
+        while self._clients:
+            key, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_timeout_secs:
+                break
+            del self._clients[key]
+            self._discard(client)
+
+    def _discard(self, client: EntityCRUD) -> None:
+        future = asyncio.ensure_future(client.close())
+        self._closing.add(future)
+        future.add_done_callback(self._closing.discard)
+
+    async def close(self) -> None:
+        clients = [client for client, _ in self._clients.values()]
+        self._clients.clear()
+        for client in clients:
+            await client.close()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
 
 
 class IntentWatcherClient(object):
@@ -125,21 +420,26 @@ class IntentWatcherClient(object):
             papiea_url: str,
             s2skey: Secret = None,
             logger: logging.Logger = logging.getLogger(__name__),
-            tracer: Optional[Tracer] = init_default_tracer()
+            tracer: Optional[Tracer] = None,
+            transport: Optional[Transport] = None,
+            codec: Optional[JsonCodec] = None,
+            timeouts: Optional[Dict[str, RequestTimeouts]] = None
     ):
         headers = {
             "Content-Type": "application/json",
         }
 
-        self.tracer = tracer
+        self.tracer = tracer if tracer is not None else get_default_tracer()
 
         if s2skey is not None:
             headers["Authorization"] = f"Bearer {s2skey}"
         self.api_instance = ApiInstance(
-            f"{papiea_url}/services/intent_watcher", headers=headers, logger=logger
+            f"{papiea_url}/services/intent_watcher", headers=headers, logger=logger,
+            transport=transport, codec=codec, timeouts=timeouts
         )
 
         self.logger = logger
+        self._poller: Optional[IntentWatcherPoller] = None
 
     async def __aenter__(self) -> "IntentWatcherClient":
         return self
@@ -150,40 +450,183 @@ class IntentWatcherClient(object):
             exc_val: Optional[BaseException],
             exc_tb: Optional[TracebackType]
     ) -> None:
+        await self.close()
+        close_tracer(self.tracer)
+
+    async def close(self) -> None:
+        # Leaves the tracer open, it may be shared with the caller
+        if self._poller is not None:
+            await self._poller.close()
         await self.api_instance.close()
-        self.tracer.close()
 
     async def get_intent_watcher(self, id: str) -> IntentWatcher:
         with self.tracer.start_span(operation_name=f"get_intent_watcher_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
-            return await self.api_instance.get(id)
+            headers = tracing_headers(self.tracer, span)
+            return await self.api_instance.get(id, headers=headers)
 
     async def list_intent_watcher(self) -> List[IntentWatcher]:
         with self.tracer.start_span(operation_name=f"list_intent_watchers_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
-            res = await self.api_instance.get("")
+            headers = tracing_headers(self.tracer, span)
+            res = await self.api_instance.get("", headers=headers)
             return res.results
 
     # filter_intent_watcher(AttributeDict(status=IntentfulStatus.Pending))
-    async def filter_intent_watcher(self, filter_obj: Any) -> List[IntentWatcher]:
+    async def filter_intent_watcher(self, filter_obj: Any, limit: Optional[int] = None,
+                                    offset: Optional[int] = None) -> List[IntentWatcher]:
         with self.tracer.start_span(operation_name=f"filter_intent_watcher_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
-            res = await self.api_instance.post("filter", filter_obj)
+            headers = tracing_headers(self.tracer, span)
+            if limit is None and offset is None:
+                res = await self.api_instance.post("filter", filter_obj, headers=headers, idempotent=True,
+                                                   operation=Operation.Filter)
+            else:
+                res = await self.api_instance.post(f"filter?limit={limit or ''}&offset={offset or ''}", filter_obj,
+                                                   headers=headers, idempotent=True, operation=Operation.Filter)
             return res.results
 
     async def wait_for_watcher_status(self, watcher_ref: AttributeDict, watcher_status: IntentfulStatus,
                                       timeout_secs: float = 50, delay_millis: float = 500) -> bool:
-        start_time = time.time()
-        delay_secs = delay_millis / 1000
+        # All the waiters of this client share a single poller, which looks
+        # up every awaited watcher with a single filter query each tick
+        if self._poller is None:
+            self._poller = IntentWatcherPoller(self, logger=self.logger)
+        return await self._poller.wait(watcher_ref.uuid, watcher_status, timeout_secs, delay_millis / 1000)
+
+
+class IntentWatcherPoller(object):
+    """
+    Multiplexes waits for intent watcher statuses onto a single polling task.
+
+    On every tick the poller sends a single filter query, paged by
+    `page_size`, covering all the awaited watchers and resolves the futures
+    of those that reached their awaited status. The query is on the status
+    when every waiter awaits the same one, and stops at the page where the
+    last awaited watcher was found. The interval grows exponentially (with
+    jitter) while nothing resolves and is reset whenever a watcher resolves;
+    a new waiter gets a poll right away.
+    """
+
+    def __init__(
+            self,
+            client: "IntentWatcherClient",
+            max_delay_secs: float = 5,
+            backoff_factor: float = 2,
+            jitter: float = 0.2,
+            page_size: int = INTENT_WATCHER_PAGE_SIZE,
+            logger: logging.Logger = logging.getLogger(__name__)
+    ):
+        self.client = client
+        self.max_delay_secs = max_delay_secs
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.page_size = page_size
+        self.logger = logger
+        # watcher uuid -> list of (awaited status, min delay, future)
+        self._waiters: Dict[str, List[Tuple[IntentfulStatus, float, asyncio.Future]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def pending(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    async def wait(self, watcher_uuid: str, watcher_status: IntentfulStatus,
+                   timeout_secs: float, delay_secs: float) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        waiter = (watcher_status, delay_secs, future)
+        self._waiters.setdefault(watcher_uuid, []).append(waiter)
+        self._ensure_running()
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout_secs)
+        except asyncio.TimeoutError:
+            raise Exception("Timeout waiting for intent watcher status")
+        finally:
+            self._remove_waiter(watcher_uuid, waiter)
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Nothing would resolve the remaining waiters before their timeout
+        for waiters in self._waiters.values():
+            for _, _, future in waiters:
+                if not future.done():
+                    future.set_exception(Exception("Intent watcher client closed"))
+
+    def _remove_waiter(self, watcher_uuid: str, waiter: Tuple[IntentfulStatus, float, asyncio.Future]) -> None:
+        waiters = self._waiters.get(watcher_uuid)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiters[watcher_uuid]
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        else:
+            self._wakeup.set()
+
+    def _min_delay(self) -> float:
+        return min(delay for waiters in self._waiters.values() for _, delay, _ in waiters)
+
+    def _fail(self, error: Exception) -> None:
+        for waiters in self._waiters.values():
+            for _, _, future in waiters:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _fetch_statuses(self, awaited: Set[str],
+                              awaited_statuses: Set[IntentfulStatus]) -> Dict[str, IntentfulStatus]:
+        filter_obj = {"status": next(iter(awaited_statuses))} if len(awaited_statuses) == 1 else {}
+        statuses = {}
+        offset = 0
         while True:
-            watcher = await self.get_intent_watcher(watcher_ref.uuid)
-            if watcher.status == watcher_status:
-                return True
-            end_time = time.time()
-            time_elapsed = end_time - start_time
-            if time_elapsed > timeout_secs:
-                raise Exception("Timeout waiting for intent watcher status")
-            time.sleep(delay_secs)
+            watchers = await self.client.filter_intent_watcher(filter_obj, limit=self.page_size, offset=offset)
+            statuses.update((watcher.uuid, watcher.status) for watcher in watchers if watcher.uuid in awaited)
+            if len(watchers) < self.page_size or len(statuses) == len(awaited):
+                return statuses
+            offset += self.page_size
+
+    async def _poll(self) -> bool:
+        awaited = set(self._waiters)
+        awaited_statuses = {status for waiters in self._waiters.values() for status, _, _ in waiters}
+        try:
+            statuses = await self._fetch_statuses(awaited, awaited_statuses)
+        except Exception as e:
+            self._fail(e)
+            return False
+        resolved = False
+        for watcher_uuid, watcher_status in statuses.items():
+            for status, _, future in self._waiters.get(watcher_uuid, []):
+                if status == watcher_status and not future.done():
+                    future.set_result(True)
+                    resolved = True
+        return resolved
+
+    async def _run(self) -> None:
+        delay = None
+        while self._waiters:
+            self._wakeup.clear()
+            if await self._poll():
+                delay = None
+            if not self._waiters:
+                break
+            min_delay = self._min_delay()
+            if delay is None:
+                delay = min_delay
+            else:
+                delay = min(max(delay * self.backoff_factor, min_delay), self.max_delay_secs)
+            sleep_secs = delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            try:
+                # A new waiter cuts the sleep short, is polled for right away
+                # and resets the backoff
+                await asyncio.wait_for(self._wakeup.wait(), sleep_secs)
+                delay = None
+            except asyncio.TimeoutError:
+                pass
 
 
 class ProviderClient(object):
@@ -194,7 +637,10 @@ class ProviderClient(object):
             version: str,
             s2skey: Optional[str] = None,
             logger: logging.Logger = logging.getLogger(__name__),
-            tracer: Optional[Tracer] = init_default_tracer()
+            tracer: Optional[Tracer] = None,
+            transport: Optional[Transport] = None,
+            codec: Optional[JsonCodec] = None,
+            timeouts: Optional[Dict[str, RequestTimeouts]] = None
     ):
         self.papiea_url = papiea_url
         self.provider = provider
@@ -207,9 +653,10 @@ class ProviderClient(object):
         if s2skey is not None:
             headers["Authorization"] = f"Bearer {s2skey}"
         self.api_instance = ApiInstance(
-            f"{papiea_url}/services/{provider}/{version}", headers=headers, logger=logger
+            f"{papiea_url}/services/{provider}/{version}", headers=headers, logger=logger,
+            transport=transport, codec=codec, timeouts=timeouts
         )
-        self.tracer = tracer
+        self.tracer = tracer if tracer is not None else get_default_tracer()
 
     async def __aenter__(self) -> "ProviderClient":
         return self
@@ -221,15 +668,19 @@ class ProviderClient(object):
             exc_tb: Optional[TracebackType],
     ) -> None:
         await self.api_instance.close()
-        self.tracer.close()
+        close_tracer(self.tracer)
 
     def get_kind(self, kind: str) -> EntityCRUD:
         return EntityCRUD(
-            self.papiea_url, self.provider, self.version, kind, self.s2skey, self.logger
+            self.papiea_url, self.provider, self.version, kind, self.s2skey, self.logger,
+            transport=self.api_instance.transport, codec=self.api_instance.codec,
+            timeouts=self.api_instance.timeouts
         )
 
     async def invoke_procedure(self, procedure_name: str, input: Any) -> Any:
         with self.tracer.start_span(operation_name=f"invoke_{procedure_name}_procedure_client") as span:
-            inject_tracing_headers(self.tracer, span, self.api_instance)
+            headers = tracing_headers(self.tracer, span)
             payload = {"input": input}
-            return await self.api_instance.post(f"procedure/{procedure_name}", payload)
+            return await self.api_instance.post(
+                f"procedure/{procedure_name}", payload, headers=headers, operation=Operation.Procedure
+            )
@@ -0,0 +1,82 @@
+import json
+from typing import Any, Optional, Union
+
+from aiohttp import web
+
+from .core import AttributeDict, CompactRecord, lazy_attribute_view
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_default(obj: Any) -> Any:
+    if isinstance(obj, CompactRecord):
+        return obj.to_wire()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JsonCodec(object):
+    """
+    Encodes request bodies and decodes responses and handler bodies.
+
+    `loads_attrs` returns nested objects with attribute access, which is what
+    the clients and the provider handlers hand out to the user. With
+    `lazy_attrs` the document is decoded into plain objects and only the
+    objects that are accessed get wrapped.
+    """
+
+    name = "json"
+
+    def __init__(self, lazy_attrs: bool = False):
+        self.lazy_attrs = lazy_attrs
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, default=encode_default).encode("utf-8")
+
+    def loads(self, s: Union[str, bytes]) -> Any:
+        return json.loads(s)
+
+    def loads_attrs(self, s: Union[str, bytes]) -> Any:
+        if self.lazy_attrs:
+            return lazy_attribute_view(self.loads(s))
+        return json.loads(s, object_hook=AttributeDict)
+
+    def response(self, data: Any, status: int = 200) -> web.Response:
+        return web.Response(body=self.dumps(data), status=status, content_type="application/json")
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson is stricter than json (e.g. integers over 64 bits)
+            return super().dumps(obj)
+
+    def __init__(self, lazy_attrs: bool = True):
+        # Building AttributeDicts after orjson.loads costs more than the
+        # object_hook of the C json decoder, so attribute access is lazy by
+        # default and eager attribute decoding stays on the json module
+        super().__init__(lazy_attrs)
+
+    def loads(self, s: Union[str, bytes]) -> Any:
+        return orjson.loads(s)
+
+
+_default_codec: Optional[JsonCodec] = None
+
+
+def get_default_codec() -> JsonCodec:
+    global _default_codec
+    if _default_codec is None:
+        _default_codec = OrjsonCodec() if orjson is not None else JsonCodec()
+    return _default_codec
+
+
+def set_default_codec(codec: JsonCodec) -> None:
+    global _default_codec
+    _default_codec = codec
@@ -1,5 +1,6 @@
 import enum
-from typing import Any, Optional, Dict, Union, List, TypedDict
+import sys
+from typing import Any, Iterator, Optional, Dict, Union, List, TypedDict
 
 
 class AttributeDict(dict):
@@ -7,6 +8,77 @@ class AttributeDict(dict):
     __setattr__ = dict.__setitem__
 
 
+def lazy_attribute_view(value: Any) -> Any:
+    value_type = type(value)
+    if value_type is dict:
+        return LazyAttributeDict(value)
+    if value_type is list:
+        return LazyAttributeList(value)
+    return value
+
+
+class LazyAttributeDict(AttributeDict):
+    """
+    AttributeDict over plain decoded JSON.
+
+    Nested objects are only wrapped (and the wrapper stored back) the first
+    time they are accessed, instead of wrapping every object while parsing.
+    """
+
+    def __getitem__(self, key: Any) -> Any:
+        value = dict.__getitem__(self, key)
+        wrapped = lazy_attribute_view(value)
+        if wrapped is not value:
+            dict.__setitem__(self, key, wrapped)
+        return wrapped
+
+    def __getattr__(self, key: str) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key: Any, *args: Any) -> Any:
+        return lazy_attribute_view(dict.pop(self, key, *args))
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            dict.__setitem__(self, key, default)
+        return self[key]
+
+    def values(self) -> List[Any]:
+        return [self[key] for key in self]
+
+    def items(self) -> List[Any]:
+        return [(key, self[key]) for key in self]
+
+    def copy(self) -> "LazyAttributeDict":
+        return LazyAttributeDict(self)
+
+
+class LazyAttributeList(list):
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        value = list.__getitem__(self, index)
+        wrapped = lazy_attribute_view(value)
+        if wrapped is not value:
+            list.__setitem__(self, index, wrapped)
+        return wrapped
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def pop(self, index: int = -1) -> Any:
+        return lazy_attribute_view(list.pop(self, index))
+
+
 Version = str
 Secret = str
 DataDescription = Any
@@ -117,6 +189,114 @@ Metadata = AttributeDict
 #     extension: Optional[Dict[str, Any]]
 
 
+class CompactRecord(object):
+    """
+    Base of the __slots__ based models of hot-path types.
+
+    Records are built from the wire format with `from_wire` and turned back
+    with `to_wire`. Fields are read as attributes (or with [] / get like the
+    AttributeDict representation), keys unknown to the model are kept aside
+    so that a round trip does not lose them.
+    """
+
+    __slots__ = ("_extra",)
+    _fields = ()
+    # Fields left out of the wire format while they are None
+    _optional = ()
+
+    @classmethod
+    def from_wire(cls, data: Dict[str, Any]) -> "CompactRecord":
+        # Unpacking with ** would bypass the wrapping of lazy attribute views
+        return cls(**dict(data.items()))
+
+    def to_wire(self) -> Dict[str, Any]:
+        res = {}
+        for field in self._fields:
+            value = getattr(self, field)
+            if value is None and field in self._optional:
+                continue
+            res[field] = value.to_wire() if isinstance(value, CompactRecord) else value
+        if self._extra:
+            res.update(self._extra)
+        return res
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._fields:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._fields or bool(self._extra and key in self._extra)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, CompactRecord):
+            return self.to_wire() == other.to_wire()
+        if isinstance(other, dict):
+            return self.to_wire() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_wire()!r})"
+
+
+def _intern(value: Any) -> Any:
+    # Low-cardinality strings (kinds, prefixes, versions) are shared between records
+    return sys.intern(value) if type(value) is str else value
+
+
+class CompactEntityReference(CompactRecord):
+    __slots__ = ("uuid", "kind", "name")
+    _fields = __slots__
+    _optional = ("name",)
+
+    def __init__(self, uuid: str = None, kind: str = None, name: Optional[str] = None, **extra: Any):
+        self.uuid = uuid
+        self.kind = _intern(kind)
+        self.name = name
+        self._extra = extra or None
+
+
+class CompactMetadata(CompactRecord):
+    __slots__ = ("uuid", "kind", "provider_prefix", "provider_version", "spec_version",
+                 "created_at", "deleted_at", "extension")
+    _fields = __slots__
+    _optional = ("deleted_at", "extension")
+
+    def __init__(self, uuid: str = None, kind: str = None, provider_prefix: str = None,
+                 provider_version: Version = None, spec_version: int = None, created_at: Any = None,
+                 deleted_at: Optional[Any] = None, extension: Optional[Dict[str, Any]] = None, **extra: Any):
+        self.uuid = uuid
+        self.kind = _intern(kind)
+        self.provider_prefix = _intern(provider_prefix)
+        self.provider_version = _intern(provider_version)
+        self.spec_version = spec_version
+        self.created_at = created_at
+        self.deleted_at = deleted_at
+        self.extension = extension
+        self._extra = extra or None
+
+
+class CompactEntity(CompactRecord):
+    __slots__ = ("metadata", "spec", "status")
+    _fields = __slots__
+
+    def __init__(self, metadata: Any = None, spec: Any = None, status: Any = None, **extra: Any):
+        if isinstance(metadata, dict):
+            metadata = CompactMetadata.from_wire(metadata)
+        self.metadata = metadata
+        self.spec = spec
+        self.status = status
+        self._extra = extra or None
+
+
 class ConstructorResult(TypedDict):
     spec: Spec
     status: Status
@@ -0,0 +1,172 @@
+import asyncio
+import inspect
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .utils import retrieve_exception
+
+
+class ExecutorPolicy(str):
+    Inline = "inline"
+    Thread = "thread"
+    Process = "process"
+
+
+def _timed_call(handler: Callable[..., Any], submitted_at: float, args: Tuple[Any, ...]) -> Tuple[float, Any]:
+    # Runs in the pool, wall clock time is comparable across processes
+    waited = time.time() - submitted_at
+    return waited, handler(*args)
+
+
+class HandlerExecutor(object):
+    """
+    Runs provider handlers according to an executor policy.
+
+    Inline handlers run on the event loop (coroutine functions are awaited,
+    plain functions are called). Thread and process policies run plain
+    functions in a pool, so that synchronous or CPU bound handlers do not
+    block the other callbacks. Handlers run in a process pool must be
+    picklable (module level functions) and get a picklable snapshot of the
+    context instead of the context itself.
+    """
+
+    def __init__(self, policy: str = ExecutorPolicy.Inline, max_workers: Optional[int] = None):
+        if policy not in (ExecutorPolicy.Inline, ExecutorPolicy.Thread, ExecutorPolicy.Process):
+            raise Exception(f"Unknown executor policy: {policy}")
+        self.policy = policy
+        self.max_workers = max_workers
+        self._pool: Optional[Executor] = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_secs = 0.0
+        self.max_wait_secs = 0.0
+        self.total_run_secs = 0.0
+
+    @property
+    def pending(self) -> int:
+        return self.submitted - self.completed - self.failed
+
+    def check_handler(self, handler: Callable[..., Any]) -> None:
+        if self.policy != ExecutorPolicy.Inline and inspect.iscoroutinefunction(handler):
+            raise Exception(f"Handler {handler.__name__} is a coroutine function,"
+                            f" only plain functions can run with the {self.policy} executor policy")
+
+    def _get_pool(self) -> Executor:
+        # Created on first use, so that forked server workers get their own
+        if self._pool is None:
+            if self.policy == ExecutorPolicy.Thread:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="papiea-handler")
+            else:
+                self._pool = ProcessPoolExecutor(self.max_workers)
+        return self._pool
+
+    async def run(self, handler: Callable[..., Any], ctx: Any, *args: Any) -> Any:
+        self.submitted += 1
+        start = time.time()
+        try:
+            if self.policy == ExecutorPolicy.Inline:
+                result = handler(ctx, *args)
+                if inspect.isawaitable(result):
+                    result = await result
+            else:
+                if self.policy == ExecutorPolicy.Process:
+                    ctx = ctx.snapshot()
+                waited, result = await asyncio.get_running_loop().run_in_executor(
+                    self._get_pool(), _timed_call, handler, start, (ctx,) + args
+                )
+                self.total_wait_secs += waited
+                self.max_wait_secs = max(self.max_wait_secs, waited)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.total_run_secs += time.time() - start
+        self.completed += 1
+        return result
+
+    def metrics(self) -> dict:
+        return {
+            "policy": self.policy,
+            "max_workers": self.max_workers,
+            "submitted": self.submitted,
+            "pending": self.pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "total_wait_secs": self.total_wait_secs,
+            "max_wait_secs": self.max_wait_secs,
+            "total_run_secs": self.total_run_secs,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+class _KeyInvocations(object):
+    __slots__ = ("pending_version", "pending_call", "pending_future")
+
+    def __init__(self):
+        self.pending_version: Optional[int] = None
+        self.pending_call: Optional[Callable[[], Awaitable[Any]]] = None
+        self.pending_future: Optional[asyncio.Future] = None
+
+
+class SerializedInvocations(object):
+    """
+    Runs the invocations for the same key (an entity uuid) one at a time.
+
+    Invocations arriving while one is running wait for it to finish and are
+    coalesced: only the one with the latest version runs next, and every
+    waiting caller gets the result of that run.
+    """
+
+    def __init__(self):
+        self._keys: Dict[Any, _KeyInvocations] = {}
+        self.runs = 0
+        self.coalesced = 0
+
+    @property
+    def active(self) -> int:
+        return len(self._keys)
+
+    async def run(self, key: Any, version: Optional[int], call: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = _KeyInvocations()
+            future = loop.create_future()
+            asyncio.ensure_future(self._execute(key, state, call, future))
+        elif state.pending_future is None:
+            state.pending_version, state.pending_call = version, call
+            future = state.pending_future = loop.create_future()
+        else:
+            self.coalesced += 1
+            if version is None or state.pending_version is None or version >= state.pending_version:
+                state.pending_version, state.pending_call = version, call
+            future = state.pending_future
+        # A caller going away must not cancel the run other callers share
+        return await asyncio.shield(future)
+
+    async def _execute(self, key: Any, state: _KeyInvocations, call: Callable[[], Awaitable[Any]],
+                       future: asyncio.Future) -> None:
+        while True:
+            self.runs += 1
+            future.add_done_callback(retrieve_exception)
+            try:
+                future.set_result(await call())
+            except asyncio.CancelledError:
+                future.cancel()
+                if state.pending_future is not None:
+                    state.pending_future.cancel()
+                del self._keys[key]
+                raise
+            except Exception as e:
+                future.set_exception(e)
+            if state.pending_future is None:
+                del self._keys[key]
+                return
+            call, future = state.pending_call, state.pending_future
+            state.pending_version = state.pending_call = state.pending_future = None
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .api import ApiInstance, Operation
+from .core import Action, EntityReference, Version
+from .python_sdk_exceptions import PermissionDeniedException
+from .utils import retrieve_exception
+
+_PermissionKey = Tuple[str, str, Optional[str], str, str]
+_BatchKey = Tuple[str, str, Optional[str]]
+
+
+class PermissionChecker(object):
+    """
+    Checks permissions through the engine's check_permission route with a
+    TTL cache of the answers keyed by (Authorization header, action, entity
+    reference). The Authorization header is sent to the engine as given.
+
+    Checks of the same user started in the same event loop iteration are
+    sent as one request. When the engine denies such a batch its checks are
+    repeated one by one, so that every (action, entity reference) pair gets
+    its own answer. With `ttl_secs` > 0 answers are kept that long, at most
+    `max_size` of them, and can be dropped early with `invalidate`.
+    """
+
+    def __init__(
+            self,
+            api: ApiInstance,
+            ttl_secs: float = 0,
+            max_size: int = 10000,
+            logger: logging.Logger = logging.getLogger(__name__)
+    ):
+        self.api = api
+        self.ttl_secs = ttl_secs
+        self.max_size = max_size
+        self.logger = logger
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+        self._cache: "OrderedDict[_PermissionKey, Tuple[bool, float]]" = OrderedDict()
+        self._in_flight: Dict[_PermissionKey, asyncio.Future] = {}
+        self._batches: Dict[_BatchKey, Dict[_PermissionKey, Tuple[Action, EntityReference, asyncio.Future]]] = {}
+        self._requests: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    async def check(
+            self,
+            provider_prefix: str,
+            provider_version: Version,
+            authorization: Optional[str],
+            entity_action: List[Tuple[Action, EntityReference]],
+    ) -> bool:
+        now = time.monotonic()
+        waiting = []
+        for action, entity_reference in entity_action:
+            key = (provider_prefix, provider_version, authorization, action,
+                   json.dumps(entity_reference, sort_keys=True, default=str))
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                if not entry[0]:
+                    return False
+                continue
+            self.misses += 1
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._in_flight[key] = self._enqueue(key, action, entity_reference)
+            waiting.append(future)
+        if not waiting:
+            return True
+        return all(await asyncio.gather(*[asyncio.shield(future) for future in waiting]))
+
+    def _enqueue(self, key: _PermissionKey, action: Action, entity_reference: EntityReference) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        batch_key = key[:3]
+        batch = self._batches.get(batch_key)
+        if batch is None:
+            batch = self._batches[batch_key] = {}
+            loop.call_soon(self._start_batch, batch_key)
+        future = loop.create_future()
+        future.add_done_callback(retrieve_exception)
+        batch[key] = (action, entity_reference, future)
+        return future
+
+    def _start_batch(self, batch_key: _BatchKey) -> None:
+        batch = self._batches.pop(batch_key)
+        task = asyncio.ensure_future(self._check_batch(batch_key, batch))
+        self._requests.add(task)
+        task.add_done_callback(self._requests.discard)
+
+    async def _check_batch(self, batch_key: _BatchKey,
+                           batch: Dict[_PermissionKey, Tuple[Action, EntityReference, asyncio.Future]]) -> None:
+        items = list(batch.items())
+        try:
+            allowed = await self._request(batch_key, [(action, ref) for _, (action, ref, _) in items])
+        except Exception as e:
+            for key, (_, _, future) in items:
+                self._resolve(key, future, error=e)
+            return
+        if allowed or len(items) == 1:
+            for key, (_, _, future) in items:
+                self._resolve(key, future, allowed)
+            return
+        results = await asyncio.gather(
+            *[self._request(batch_key, [(action, ref)]) for _, (action, ref, _) in items],
+            return_exceptions=True
+        )
+        for (key, (_, _, future)), result in zip(items, results):
+            if isinstance(result, Exception):
+                self._resolve(key, future, error=result)
+            else:
+                self._resolve(key, future, result)
+
+    async def _request(self, batch_key: _BatchKey, entity_action: List[Tuple[Action, EntityReference]]) -> bool:
+        provider_prefix, provider_version, authorization = batch_key
+        headers = {"Authorization": authorization} if authorization is not None else {}
+        self.requests += 1
+        try:
+            res = await self.api.post(
+                f"{provider_prefix}/{provider_version}/check_permission",
+                [[action, ref] for action, ref in entity_action],
+                headers,
+                idempotent=True,
+                operation=Operation.Get
+            )
+        except PermissionDeniedException:
+            return False
+        return res["success"] == "Ok"
+
+    def _resolve(self, key: _PermissionKey, future: asyncio.Future, allowed: bool = False,
+                 error: Optional[Exception] = None) -> None:
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        if error is not None:
+            # Failed checks are not cached, the next one asks the engine again
+            future.set_exception(error)
+            return
+        if self.ttl_secs > 0:
+            self._cache.pop(key, None)
+            self._cache[key] = (allowed, time.monotonic() + self.ttl_secs)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        future.set_result(allowed)
+
+    def invalidate(self, authorization: Optional[str] = None,
+                   entity_reference: Optional[EntityReference] = None) -> None:
+        """
+        Drops the cached answers of an Authorization header, of an entity, of
+        both or all of them when neither is given.
+        """
+        if authorization is None and entity_reference is None:
+            self._cache.clear()
+            return
+        entity = None
+        if entity_reference is not None:
+            entity = (entity_reference.get("kind"), entity_reference.get("uuid"))
+        for key in list(self._cache):
+            if authorization is not None and key[2] != authorization:
+                continue
+            if entity is not None:
+                ref = json.loads(key[4])
+                if not isinstance(ref, dict) or (ref.get("kind"), ref.get("uuid")) != entity:
+                    continue
+            del self._cache[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "requests": self.requests,
+        }
+
+    async def close(self) -> None:
+        if self._requests:
+            await asyncio.gather(*self._requests, return_exceptions=True)
@@ -1,15 +1,28 @@
+import asyncio
+import atexit
 import logging
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from collections import deque
 from types import TracebackType
-from typing import Any, Callable, List, NoReturn, Optional, Type, Union
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NoReturn, Optional, Type, Union
 
 from aiohttp import web
 from opentracing import Tracer, Format, child_of
 
 from .api import ApiInstance
-from .client import IntentWatcherClient
+from .cache import TtlCache
+from .codec import JsonCodec, get_default_codec
+from .client import EntityClientPool, IntentWatcherClient
+from .executors import ExecutorPolicy, HandlerExecutor, SerializedInvocations
 from .core import (
     DataDescription,
     Entity,
+    EntityReference,
     IntentfulExecutionStrategy,
     IntentfulSignature,
     Kind,
@@ -18,32 +31,207 @@ from .core import (
     ProviderPower,
     S2SKey,
     Secret,
+    Status,
     UserInfo,
     Version, ProcedureDescription,
     ConstructorProcedureDescription,
     ConstructorResult, CreateS2SKeyRequest
 )
+from .permissions import PermissionChecker
 from .python_sdk_context import IntentfulCtx, ProceduralCtx
 from .python_sdk_exceptions import InvocationError, SecurityApiError
-from .utils import json_loads_attrs, validate_error_codes
-from .tracing_utils import init_default_tracer, get_special_operation_name
+from .status_buffer import StatusWriteBuffer
+from .utils import copy_json, validate_error_codes
+from .tracing_utils import get_default_tracer, get_special_operation_name
+from .transport import Transport, get_default_transport
+
+
+class ConcurrencyLimit(object):
+    """
+    Bounds the number of callbacks running at once.
+
+    Callbacks over the limit wait in a FIFO queue of at most `max_queue`
+    entries for up to `queue_timeout_secs`, the ones that do not fit in the
+    queue or wait for too long are rejected.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int = 0, queue_timeout_secs: Optional[float] = None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_secs = queue_timeout_secs
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.max_queue_depth = 0
+        self.total_wait_secs = 0.0
+        self.max_wait_secs = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_secs)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            return False
+        except asyncio.CancelledError:
+            # The slot may have been handed over right before the cancellation
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            waited = time.monotonic() - start
+            self.total_wait_secs += waited
+            self.max_wait_secs = max(self.max_wait_secs, waited)
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        # The slot goes straight to the next waiter, so that callbacks
+        # arriving meanwhile cannot overtake the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def metrics(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "total_wait_secs": self.total_wait_secs,
+            "max_wait_secs": self.max_wait_secs,
+        }
 
 
 class ProviderServerManager(object):
-    def __init__(self, public_host: str = "127.0.0.1", public_port: int = 9000):
+    """
+    Serves the provider callbacks.
+
+    With `workers` > 1 the server runs in that many forked processes which
+    share `public_port` through SO_REUSEPORT, while registration with the
+    engine stays in the parent. Workers are forked when the server starts,
+    so they run every handler registered until then, and the parent
+    restarts the ones that exit. Concurrency limits and their metrics are
+    per worker.
+    """
+
+    def __init__(
+            self,
+            public_host: str = "127.0.0.1",
+            public_port: int = 9000,
+            max_concurrency: Optional[int] = None,
+            max_queue: int = 0,
+            queue_timeout_secs: Optional[float] = None,
+            retry_after_secs: float = 1,
+            workers: int = 1,
+            restart_delay_secs: float = 1,
+            logger: logging.Logger = logging.getLogger(__name__)
+    ):
         self.public_host = public_host
         self.public_port = public_port
         self.should_run = False
-        self.app = web.Application()
+        self.app = web.Application(middlewares=[self._limit_middleware])
         self._runner = None
+        self.workers = workers
+        self.restart_delay_secs = restart_delay_secs
+        self.worker_restarts = 0
+        self.logger = logger
+        self._worker_processes: List[multiprocessing.Process] = []
+        self._supervisor: Optional[asyncio.Task] = None
+        self.max_queue = max_queue
+        self.queue_timeout_secs = queue_timeout_secs
+        self.retry_after_secs = retry_after_secs
+        self._global_limit = self._new_limit(max_concurrency) if max_concurrency is not None else None
+        self._route_limits: Dict[str, ConcurrencyLimit] = {}
+        self._kind_limits: Dict[str, ConcurrencyLimit] = {}
+        self._route_kinds: Dict[str, Optional[str]] = {}
 
     def register_handler(
-            self, route: str, handler: Callable[[web.Request], web.Response]
+            self, route: str, handler: Callable[[web.Request], web.Response], kind: Optional[str] = None
     ) -> None:
         if not self.should_run:
             self.should_run = True
+        self._route_kinds[route] = kind
         self.app.add_routes([web.post(route, handler)])
 
+    def _new_limit(self, max_concurrency: int, max_queue: Optional[int] = None,
+                   queue_timeout_secs: Optional[float] = None) -> ConcurrencyLimit:
+        return ConcurrencyLimit(
+            max_concurrency,
+            max_queue if max_queue is not None else self.max_queue,
+            queue_timeout_secs if queue_timeout_secs is not None else self.queue_timeout_secs,
+        )
+
+    def limit_route(self, route: str, max_concurrency: int, max_queue: Optional[int] = None,
+                    queue_timeout_secs: Optional[float] = None) -> "ProviderServerManager":
+        self._route_limits[route] = self._new_limit(max_concurrency, max_queue, queue_timeout_secs)
+        return self
+
+    def limit_kind(self, kind: str, max_concurrency: int, max_queue: Optional[int] = None,
+                   queue_timeout_secs: Optional[float] = None) -> "ProviderServerManager":
+        self._kind_limits[kind] = self._new_limit(max_concurrency, max_queue, queue_timeout_secs)
+        return self
+
+    def limit_metrics(self) -> dict:
+        return {
+            "global": self._global_limit.metrics() if self._global_limit is not None else None,
+            "routes": {route: limit.metrics() for route, limit in self._route_limits.items()},
+            "kinds": {kind: limit.metrics() for kind, limit in self._kind_limits.items()},
+        }
+
+    def _limits_for(self, route: Optional[str]) -> List[ConcurrencyLimit]:
+        if route not in self._route_kinds:
+            return []
+        # Most specific first, so that a callback waiting for its route or
+        # kind does not hold a slot of the global limit meanwhile
+        limits = [
+            self._route_limits.get(route),
+            self._kind_limits.get(self._route_kinds[route]),
+            self._global_limit,
+        ]
+        return [limit for limit in limits if limit is not None]
+
+    @web.middleware
+    async def _limit_middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        resource = request.match_info.route.resource
+        limits = self._limits_for(resource.canonical if resource is not None else None)
+        acquired = []
+        try:
+            for limit in limits:
+                if not await limit.acquire():
+                    e = InvocationError(429, "Too many concurrent requests, retry later", [])
+                    return web.json_response(
+                        e.to_response(), status=e.status_code,
+                        headers={"Retry-After": str(math.ceil(self.retry_after_secs))}
+                    )
+                acquired.append(limit)
+            return await handler(request)
+        finally:
+            for limit in reversed(acquired):
+                limit.release()
+
     def register_healthcheck(self) -> None:
         if not self.should_run:
             self.should_run = True
@@ -55,6 +243,9 @@ class ProviderServerManager(object):
 
     async def start_server(self) -> NoReturn:
         if self.should_run:
+            if self.workers > 1:
+                self._start_workers()
+                return
             runner = web.AppRunner(self.app)
             await runner.setup()
             self._runner = runner
@@ -64,11 +255,84 @@ class ProviderServerManager(object):
     async def close(self) -> None:
         if self._runner is not None:
             await self._runner.cleanup()
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            self._supervisor = None
+        processes, self._worker_processes = self._worker_processes, []
+        atexit.unregister(self._terminate_workers)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        loop = asyncio.get_running_loop()
+        for process in processes:
+            await loop.run_in_executor(None, process.join, 5)
+            if process.is_alive():
+                process.kill()
+                await loop.run_in_executor(None, process.join)
+
+    @property
+    def worker_pids(self) -> List[int]:
+        return [process.pid for process in self._worker_processes if process.is_alive()]
+
+    def _start_workers(self) -> None:
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise Exception("Multiple workers need SO_REUSEPORT, which this platform does not support")
+        # Handlers are closures, the workers have to be forked to get them
+        context = multiprocessing.get_context("fork")
+        self._worker_processes = [self._fork_worker(context) for _ in range(self.workers)]
+        self._supervisor = asyncio.ensure_future(self._supervise(context))
+        # multiprocessing joins the non daemonic workers at exit, they have
+        # to be stopped first when close was not called
+        atexit.register(self._terminate_workers)
+
+    def _fork_worker(self, context) -> multiprocessing.Process:
+        # Not daemonic, daemonic processes can't start the process pools of
+        # ExecutorPolicy.Process handlers
+        process = context.Process(target=self._run_worker, args=(os.getpid(),))
+        process.start()
+        return process
+
+    def _terminate_workers(self) -> None:
+        for process in self._worker_processes:
+            if process.is_alive():
+                process.terminate()
+
+    def _run_worker(self, parent_pid: int) -> None:
+        asyncio.run(self._serve_worker(parent_pid))
+
+    async def _serve_worker(self, parent_pid: int) -> None:
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        runner = web.AppRunner(self.app)
+        await runner.setup()
+        site = web.TCPSite(runner, self.public_host, self.public_port, reuse_port=True)
+        await site.start()
+        try:
+            # Also stop when the parent died without terminating the worker
+            while os.getppid() == parent_pid:
+                try:
+                    await asyncio.wait_for(stop.wait(), 1)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await runner.cleanup()
+
+    async def _supervise(self, context) -> None:
+        while True:
+            await asyncio.sleep(self.restart_delay_secs)
+            for i, process in enumerate(self._worker_processes):
+                if not process.is_alive():
+                    self.logger.error(f"Provider server worker {process.pid} exited with code {process.exitcode},"
+                                      f" restarting it")
+                    process.join()
+                    self._worker_processes[i] = self._fork_worker(context)
+                    self.worker_restarts += 1
 
     def callback_url(self) -> str:
         return f"http://{self.public_host}:{self.public_port}"
 
-    def procedure_callback_url(self, procedure_name: str, kind: Optional[str]) -> str:
+    def procedure_callback_url(self, procedure_name: str, kind: Optional[str] = None) -> str:
         if kind is not None:
             return f"http://{self.public_host}:{self.public_port}/{kind}/{procedure_name}"
         else:
@@ -78,29 +342,46 @@ class ProviderServerManager(object):
 
 
 class SecurityApi(object):
-    def __init__(self, provider, s2s_key: Secret):
+    def __init__(self, provider, s2s_key: Secret, cache: Optional[TtlCache] = None):
         self.provider = provider
         self.s2s_key = s2s_key
+        # Shared by the provider's security apis, user_info and list_keys
+        # answers are kept there per s2s key
+        self.cache = cache
+
+    async def _cached(self, name: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        if self.cache is None:
+            return await load()
+        return copy_json(await self.cache.get_or_load((name, self.s2s_key), load))
+
+    def _invalidate(self, key: Optional[Secret] = None) -> None:
+        if self.cache is not None:
+            # Any key of the provider may be listed by list_keys
+            self.cache.invalidate_where(lambda cached: cached[0] == "list_keys" or cached[1] == key)
+
+    async def _get_user_info(self) -> UserInfo:
+        url = f"{self.provider.get_prefix()}/{self.provider.get_version()}"
+        return await self.provider.provider_api.get(
+            f"{url}/auth/user_info",
+            headers={"Authorization": f"Bearer {self.s2s_key}"},
+        )
+
+    async def _get_keys(self) -> List[S2SKey]:
+        url = f"{self.provider.get_prefix()}/{self.provider.get_version()}"
+        return await self.provider.provider_api.get(
+            f"{url}/s2skey", headers={"Authorization": f"Bearer {self.s2s_key}"}
+        )
 
     async def user_info(self) -> UserInfo:
         "Returns the user-info of user with s2skey or the current user"
         try:
-            url = f"{self.provider.get_prefix()}/{self.provider.get_version()}"
-            res = await self.provider.provider_api.get(
-                f"{url}/auth/user_info",
-                headers={"Authorization": f"Bearer {self.s2s_key}"},
-            )
-            return res
+            return await self._cached("user_info", self._get_user_info)
         except Exception as e:
             raise SecurityApiError.from_error(e, "Cannot get user info")
 
     async def list_keys(self) -> List[S2SKey]:
         try:
-            url = f"{self.provider.get_prefix()}/{self.provider.get_version()}"
-            res = await self.provider.provider_api.get(
-                f"{url}/s2skey", headers={"Authorization": f"Bearer {self.s2s_key}"}
-            )
-            return res
+            return await self._cached("list_keys", self._get_keys)
         except Exception as e:
             raise SecurityApiError.from_error(e, "Cannot list s2s keys")
 
@@ -112,6 +393,7 @@ class SecurityApi(object):
                 data=new_key,
                 headers={"Authorization": f"Bearer {self.s2s_key}"},
             )
+            self._invalidate(res.get("key") if res else None)
             return res
         except Exception as e:
             raise SecurityApiError.from_error(e, "Cannot create s2s key")
@@ -124,6 +406,7 @@ class SecurityApi(object):
                 data={"key": key_to_deactivate, "active": False},
                 headers={"Authorization": f"Bearer {self.s2s_key}"},
             )
+            self._invalidate(key_to_deactivate)
             return res
         except Exception as e:
             raise SecurityApiError.from_error(e, "Cannot deactivate s2s key")
@@ -137,7 +420,23 @@ class ProviderSdk(object):
             server_manager: Optional[ProviderServerManager] = None,
             allow_extra_props: bool = False,
             logger: logging.Logger = None,
-            tracer: Tracer = init_default_tracer()
+            tracer: Optional[Tracer] = None,
+            transport: Optional[Transport] = None,
+            entity_client_pool_size: int = 128,
+            entity_client_idle_timeout_secs: float = 300,
+            codec: Optional[JsonCodec] = None,
+            handler_thread_pool_size: Optional[int] = None,
+            handler_process_pool_size: Optional[int] = None,
+            status_write_behind: bool = False,
+            status_flush_interval_secs: float = 0.05,
+            status_flush_batch_size: int = 500,
+            status_flush_concurrency: int = 16,
+            permission_cache_ttl_secs: float = 0,
+            permission_cache_size: int = 10000,
+            security_cache_ttl_secs: float = 0,
+            security_cache_size: int = 1024,
+            entity_cache_ttl_secs: float = 0,
+            entity_cache_size: int = 1024
     ):
         self._version = None
         self._prefix = None
@@ -150,23 +449,61 @@ class ProviderSdk(object):
             self._server_manager = server_manager
         else:
             self._server_manager = ProviderServerManager()
-        self.tracer = tracer
+        self.tracer = tracer if tracer is not None else get_default_tracer()
         self._procedures = {}
         self.meta_ext = {}
         self.allow_extra_props = allow_extra_props
-        self._security_api = SecurityApi(self, s2skey)
-        self._intent_watcher_client = IntentWatcherClient(papiea_url, s2skey, logger, tracer)
+        self._security_cache = None
+        if security_cache_ttl_secs > 0:
+            self._security_cache = TtlCache(security_cache_ttl_secs, security_cache_size)
+        self._security_api = SecurityApi(self, s2skey, self._security_cache)
+        self._transport = transport if transport is not None else get_default_transport()
+        self.codec = codec if codec is not None else get_default_codec()
+        self._intent_watcher_client = IntentWatcherClient(
+            papiea_url, s2skey, logger, self.tracer, transport=self._transport, codec=self.codec
+        )
         self._provider_api = ApiInstance(
             self.provider_url,
             headers={
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {self._s2skey}",
             },
-            logger=self.logger
+            logger=self.logger,
+            transport=self._transport,
+            codec=self.codec
+        )
+        self._entity_client_pool = EntityClientPool(
+            papiea_url, entity_client_pool_size, entity_client_idle_timeout_secs,
+            logger=logger, tracer=self.tracer, transport=self._transport, codec=self.codec,
+            entity_cache_ttl_secs=entity_cache_ttl_secs, entity_cache_size=entity_cache_size
         )
         self._oauth2 = None
         self._authModel = None
         self._policy = None
+        self._handler_pool_sizes = {
+            ExecutorPolicy.Thread: handler_thread_pool_size,
+            ExecutorPolicy.Process: handler_process_pool_size,
+        }
+        self._handler_executors: Dict[str, HandlerExecutor] = {}
+        # Server workers end with os._exit, without the atexit hook that
+        # stops process pools, so the pools are stopped with the server
+        self._server_manager.app.on_cleanup.append(self._shutdown_handler_executors)
+        self._status_buffer = None
+        if status_write_behind:
+            self._status_buffer = StatusWriteBuffer(
+                self._send_status, status_flush_interval_secs, status_flush_batch_size, status_flush_concurrency,
+                logger=logger or logging.getLogger(__name__)
+            )
+        self._permission_checker = PermissionChecker(
+            ApiInstance(
+                self.entity_url,
+                headers={"Content-Type": "application/json"},
+                logger=self.logger,
+                transport=self._transport,
+                codec=self.codec
+            ),
+            permission_cache_ttl_secs, permission_cache_size, logger=logger or logging.getLogger(__name__)
+        )
 
     async def __aenter__(self) -> "ProviderSdk":
         return self
@@ -177,7 +514,16 @@ class ProviderSdk(object):
             exc_val: Optional[BaseException],
             exc_tb: Optional[TracebackType],
     ) -> None:
+        # Buffered status updates are sent before the clients are closed
+        if self._status_buffer is not None:
+            await self._status_buffer.close()
+        await self._entity_client_pool.close()
+        await self._permission_checker.close()
+        await self._permission_checker.api.close()
+        await self._intent_watcher_client.close()
         await self._provider_api.close()
+        for executor in self._handler_executors.values():
+            executor.shutdown(wait=False)
 
     @property
     def provider(self) -> Provider:
@@ -194,6 +540,14 @@ class ProviderSdk(object):
     def provider_api(self) -> ApiInstance:
         return self._provider_api
 
+    @property
+    def transport(self) -> Transport:
+        return self._transport
+
+    @property
+    def entity_client_pool(self) -> EntityClientPool:
+        return self._entity_client_pool
+
     @property
     def entity_url(self) -> str:
         return f"{self.papiea_url}/services"
@@ -269,7 +623,10 @@ class ProviderSdk(object):
             name: str,
             procedure_description: ProcedureDescription,
             handler: Callable[[ProceduralCtx, Any], Any],
+            executor: Union[str, HandlerExecutor, None] = None,
     ) -> "ProviderSdk":
+        handler_executor = self.handler_executor(executor)
+        handler_executor.check_handler(handler)
         procedure_callback_url = self._server_manager.procedure_callback_url(name)
         callback_url = self._server_manager.callback_url()
         validate_error_codes(procedure_description["errors_schemas"])
@@ -289,21 +646,21 @@ class ProviderSdk(object):
 
         async def procedure_callback_fn(req):
             try:
-                body_obj = json_loads_attrs(await req.text())
+                body_obj = self.codec.loads_attrs(await req.read())
                 span_context = self.tracer.extract(
                     format=Format.HTTP_HEADERS,
                     carrier=req.headers,
                 )
                 with self.tracer.start_span(operation_name=f"{name}_provider_procedure_sdk", references=child_of(span_context)):
-                    result = await handler(
-                        ProceduralCtx(self, prefix, version, req.headers), body_obj
+                    result = await handler_executor.run(
+                        handler, ProceduralCtx(self, prefix, version, req.headers), body_obj
                     )
-                    return web.json_response(result)
+                    return self.codec.response(result)
             except InvocationError as e:
-                return web.json_response(e.to_response(), status=e.status_code)
+                return self.codec.response(e.to_response(), status=e.status_code)
             except Exception as e:
                 e = InvocationError.from_error(e)
-                return web.json_response(e.to_response(), status=e.status_code)
+                return self.codec.response(e.to_response(), status=e.status_code)
 
         self._server_manager.register_handler("/" + name, procedure_callback_fn)
         return self
@@ -352,10 +709,13 @@ class ProviderSdk(object):
             public_port: Optional[int],
             allow_extra_props: bool = False,
             logger: logging.Logger = logging.getLogger(__name__),
-            tracer: Tracer = init_default_tracer()
+            tracer: Optional[Tracer] = None,
+            transport: Optional[Transport] = None,
+            codec: Optional[JsonCodec] = None
     ) -> "ProviderSdk":
         server_manager = ProviderServerManager(public_host, public_port)
-        return ProviderSdk(papiea_url, s2skey, server_manager, allow_extra_props, logger, tracer)
+        return ProviderSdk(papiea_url, s2skey, server_manager, allow_extra_props, logger, tracer, transport,
+                           codec=codec)
 
     def secure_with(
             self, oauth_config: Any, casbin_model: str, casbin_initial_policy: str
@@ -365,6 +725,39 @@ class ProviderSdk(object):
         self._policy = casbin_initial_policy
         return self
 
+    @property
+    def status_buffer(self) -> Optional[StatusWriteBuffer]:
+        return self._status_buffer
+
+    @property
+    def permission_checker(self) -> PermissionChecker:
+        return self._permission_checker
+
+    async def _send_status(self, entity_reference: EntityReference, status: Status) -> None:
+        await self._provider_api.patch(
+            f"{self.get_prefix()}/{self.get_version()}/update_status",
+            {"entity_ref": entity_reference, "status": status},
+        )
+
+    def handler_executor(self, executor: Union[str, HandlerExecutor, None] = None) -> HandlerExecutor:
+        """
+        Executor for a handler, either the given one or the provider's shared
+        executor of the given policy (inline by default).
+        """
+        if isinstance(executor, HandlerExecutor):
+            return executor
+        policy = executor if executor is not None else ExecutorPolicy.Inline
+        if policy not in self._handler_executors:
+            self._handler_executors[policy] = HandlerExecutor(policy, self._handler_pool_sizes.get(policy))
+        return self._handler_executors[policy]
+
+    async def _shutdown_handler_executors(self, app: web.Application) -> None:
+        for executor in self._handler_executors.values():
+            executor.shutdown()
+
+    def handler_executor_metrics(self) -> dict:
+        return {policy: executor.metrics() for policy, executor in self._handler_executors.items()}
+
     @property
     def server_manager(self) -> ProviderServerManager:
         return self._server_manager
@@ -374,7 +767,11 @@ class ProviderSdk(object):
         return self._security_api
 
     def new_security_api(self, s2s_key: str) -> SecurityApi:
-        return SecurityApi(self, s2s_key)
+        return SecurityApi(self, s2s_key, self._security_cache)
+
+    @property
+    def security_cache(self) -> Optional[TtlCache]:
+        return self._security_cache
 
     @property
     def s2s_key(self) -> Secret:
@@ -395,6 +792,7 @@ class KindBuilder:
         self.entity_url = provider.entity_url
         self.provider_url = provider.provider_url
         self.tracer = tracer
+        self.serialized_invocations: Dict[str, SerializedInvocations] = {}
 
     def get_prefix(self) -> str:
         return self.provider.get_prefix()
@@ -407,7 +805,10 @@ class KindBuilder:
             name: str,
             procedure_description: ProcedureDescription,
             handler: Callable[[ProceduralCtx, Entity, Any], Any],
+            executor: Union[str, HandlerExecutor, None] = None,
     ) -> "KindBuilder":
+        handler_executor = self.provider.handler_executor(executor)
+        handler_executor.check_handler(handler)
         procedure_callback_url = self.server_manager.procedure_callback_url(
             name, self.kind["name"]
         )
@@ -429,30 +830,33 @@ class KindBuilder:
 
         async def procedure_callback_fn(req):
             try:
-                body_obj = json_loads_attrs(await req.text())
+                body_obj = self.provider.codec.loads_attrs(await req.read())
                 span_context = self.tracer.extract(
                     format=Format.HTTP_HEADERS,
                     carrier=req.headers,
                 )
                 with self.tracer.start_span(operation_name=f"{name}_entity_procedure", references=child_of(span_context)):
-                    result = await handler(
+                    entity = Entity(
+                        metadata=body_obj.metadata,
+                        spec=body_obj.get("spec", {}),
+                        status=body_obj.get("status", {}),
+                    )
+                    self.provider.entity_client_pool.observe_entity(prefix, version, entity)
+                    result = await handler_executor.run(
+                        handler,
                         ProceduralCtx(self.provider, prefix, version, req.headers),
-                        Entity(
-                            metadata=body_obj.metadata,
-                            spec=body_obj.get("spec", {}),
-                            status=body_obj.get("status", {}),
-                        ),
+                        entity,
                         body_obj.input,
                     )
-                    return web.json_response(result)
+                    return self.provider.codec.response(result)
             except InvocationError as e:
-                return web.json_response(e.to_response(), status=e.status_code)
+                return self.provider.codec.response(e.to_response(), status=e.status_code)
             except Exception as e:
                 e = InvocationError.from_error(e)
-                return web.json_response(e.to_response(), status=e.status_code)
+                return self.provider.codec.response(e.to_response(), status=e.status_code)
 
         self.server_manager.register_handler(
-            f"/{self.kind['name']}/{name}", procedure_callback_fn
+            f"/{self.kind['name']}/{name}", procedure_callback_fn, self.kind["name"]
         )
         return self
 
@@ -461,7 +865,10 @@ class KindBuilder:
             name: str,
             procedure_description: Union[ProcedureDescription, ConstructorProcedureDescription],
             handler: Callable[[ProceduralCtx, Any], Any],
+            executor: Union[str, HandlerExecutor, None] = None,
     ) -> "KindBuilder":
+        handler_executor = self.provider.handler_executor(executor)
+        handler_executor.check_handler(handler)
         procedure_callback_url = self.server_manager.procedure_callback_url(
             name, self.kind["name"]
         )
@@ -489,26 +896,40 @@ class KindBuilder:
                 )
                 operation_name = get_special_operation_name(name, prefix, version, self.kind.name)
                 with self.tracer.start_span(operation_name=operation_name, references=child_of(span_context)):
-                    body_obj = json_loads_attrs(await req.text())
-                    result = await handler(
+                    body_obj = self.provider.codec.loads_attrs(await req.read())
+                    result = await handler_executor.run(
+                        handler,
                         ProceduralCtx(self.provider, prefix, version, req.headers),
                         body_obj.input,
                     )
-                    return web.json_response(result)
+                    return self.provider.codec.response(result)
             except InvocationError as e:
-                return web.json_response(e.to_response(), status=e.status_code)
+                return self.provider.codec.response(e.to_response(), status=e.status_code)
             except Exception as e:
                 e = InvocationError.from_error(e)
-                return web.json_response(e.to_response(), status=e.status_code)
+                return self.provider.codec.response(e.to_response(), status=e.status_code)
 
         self.server_manager.register_handler(
-            f"/{self.kind['name']}/{name}", procedure_callback_fn
+            f"/{self.kind['name']}/{name}", procedure_callback_fn, self.kind["name"]
         )
         return self
 
     def on(
             self, sfs_signature: str, handler: Callable[[IntentfulCtx, Entity, Any], Any],
+            executor: Union[str, HandlerExecutor, None] = None,
+            serialize_per_entity: bool = False,
     ) -> "KindBuilder":
+        """
+        Registers an intentful handler. With `serialize_per_entity` the handler
+        runs for one entity at a time, and the invocations for an entity that
+        arrive meanwhile are coalesced into a single run with the latest
+        spec_version, whose result all of them return.
+        """
+        handler_executor = self.provider.handler_executor(executor)
+        handler_executor.check_handler(handler)
+        serialized = None
+        if serialize_per_entity:
+            serialized = self.serialized_invocations[sfs_signature] = SerializedInvocations()
         procedure_callback_url = self.server_manager.procedure_callback_url(
             sfs_signature, self.kind["name"]
         )
@@ -556,42 +977,50 @@ class KindBuilder:
                     carrier=req.headers,
                 )
                 with self.tracer.start_span(operation_name=f"{sfs_signature}_handler_procedure", references=child_of(span_context)):
-                    body_obj = json_loads_attrs(await req.text())
-                    result = await handler(
-                        IntentfulCtx(self.provider, prefix, version, req.headers),
-                        Entity(
-                            metadata=body_obj.metadata,
-                            spec=body_obj.get("spec", {}),
-                            status=body_obj.get("status", {}),
-                        ),
-                        body_obj.input,
+                    body_obj = self.provider.codec.loads_attrs(await req.read())
+                    ctx = IntentfulCtx(self.provider, prefix, version, req.headers)
+                    entity = Entity(
+                        metadata=body_obj.metadata,
+                        spec=body_obj.get("spec", {}),
+                        status=body_obj.get("status", {}),
                     )
-                return web.json_response(result)
+                    self.provider.entity_client_pool.observe_entity(prefix, version, entity)
+                    if serialized is None:
+                        result = await handler_executor.run(handler, ctx, entity, body_obj.input)
+                    else:
+                        result = await serialized.run(
+                            entity.metadata.uuid,
+                            entity.metadata.get("spec_version"),
+                            lambda: handler_executor.run(handler, ctx, entity, body_obj.input),
+                        )
+                return self.provider.codec.response(result)
             except InvocationError as e:
-                return web.json_response(e.to_response(), status=e.status_code)
+                return self.provider.codec.response(e.to_response(), status=e.status_code)
             except Exception as e:
                 e = InvocationError.from_error(e)
-                return web.json_response(e.to_response(), status=e.status_code)
+                return self.provider.codec.response(e.to_response(), status=e.status_code)
 
         self.server_manager.register_handler(
-            f"/{self.kind['name']}/{sfs_signature}", procedure_callback_fn
+            f"/{self.kind['name']}/{sfs_signature}", procedure_callback_fn, self.kind["name"]
         )
         self.server_manager.register_healthcheck()
         return self
 
-    def on_create(self, description: ConstructorProcedureDescription, handler: Callable[[ProceduralCtx, Any], ConstructorResult]) -> "KindBuilder":
+    def on_create(self, description: ConstructorProcedureDescription, handler: Callable[[ProceduralCtx, Any], ConstructorResult],
+                  executor: Union[str, HandlerExecutor, None] = None) -> "KindBuilder":
         name = f"__{self.kind['name']}_create"
         self.kind_procedure(
-            name, description, handler
+            name, description, handler, executor
         )
         return self
 
     def on_delete(
         self,
         handler: Callable[[ProceduralCtx, Any], Any],
+        executor: Union[str, HandlerExecutor, None] = None,
     ) -> "KindBuilder":
         name = f"__{self.kind['name']}_delete"
         self.kind_procedure(
-            name, ProcedureDescription(), handler
+            name, ProcedureDescription(), handler, executor
         )
         return self
@@ -1,41 +1,75 @@
-import json
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 from deprecated import deprecated
-from aiohttp import ClientSession
 from multidict import CIMultiDict
 
 from .client import EntityCRUD
 from .core import Action, Entity, EntityReference, Secret, Status, Version
+from .status_buffer import status_diff
+from .utils import copy_json
 
 
-class ProceduralCtx(object):
+class CtxSnapshot(object):
+    """
+    Picklable part of a handler context, handlers run in a process pool get
+    this instead of the context itself.
+    """
+
     def __init__(
         self,
-        provider,
+        base_url: str,
+        provider_url: str,
         provider_prefix: str,
         provider_version: str,
         headers: CIMultiDict,
     ):
-        self.provider_url = provider.provider_url
-        self.base_url = provider.entity_url
+        self.base_url = base_url
+        self.provider_url = provider_url
         self.provider_prefix = provider_prefix
         self.provider_version = provider_version
-        self.provider_api = provider.provider_api
-        self.provider = provider
         self.headers = headers
 
     def url_for(self, entity: Entity) -> str:
         return self.base_url + "/" + self.provider_prefix + "/" + self.provider_version \
             + "/" + entity.metadata.kind + "/" + entity.metadata.uuid
 
+    def get_headers(self) -> CIMultiDict:
+        return self.headers
+
+    def get_invoking_token(self) -> str:
+        if "authorization" in self.headers:
+            parts = self.headers["authorization"].split(" ")
+            if parts[0] == "Bearer":
+                return parts[1]
+        raise Exception("No invoking user")
+
+
+class ProceduralCtx(CtxSnapshot):
+    def __init__(
+        self,
+        provider,
+        provider_prefix: str,
+        provider_version: str,
+        headers: CIMultiDict,
+    ):
+        super().__init__(provider.entity_url, provider.provider_url, provider_prefix, provider_version, headers)
+        self.provider_api = provider.provider_api
+        self.provider = provider
+        # Statuses written through update_changed_status by this invocation
+        self._known_statuses: Dict[Tuple[str, str], Status] = {}
+
+    def snapshot(self) -> CtxSnapshot:
+        return CtxSnapshot(
+            self.base_url, self.provider_url, self.provider_prefix, self.provider_version, CIMultiDict(self.headers)
+        )
+
     def entity_client_for_user(self, entity_reference: EntityReference) -> EntityCRUD:
-        return EntityCRUD(
-            self.provider.papiea_url,
+        # Clients come from the provider's pool and stay open after the
+        # handler leaves its 'async with' block, so connections are reused
+        return self.provider.entity_client_pool.get(
             self.provider_prefix,
             self.provider_version,
             entity_reference.kind,
             self.get_invoking_token(),
-            self.provider.logger,
         )
 
     async def check_permission(
@@ -67,29 +101,61 @@ class ProceduralCtx(object):
         entity_action: List[Tuple[Action, EntityReference]],
         headers: dict = {},
     ) -> bool:
+        # Concurrent checks of a user are batched, and answers cached when
+        # enabled, by the provider's permission checker. The Authorization
+        # header is passed through whatever its scheme
         try:
-            data_binary = json.dumps(entity_action).encode("utf-8")
-            async with ClientSession() as session:
-                async with session.post(
-                    f"{ self.base_url }/{ provider_prefix }/{ provider_version }/check_permission",
-                    data=data_binary,
-                    headers=headers,
-                ) as resp:
-                    res = await resp.text()
-            res = json.loads(res)
-            return res["success"] == "Ok"
+            return await self.provider.permission_checker.check(
+                provider_prefix, provider_version, CIMultiDict(headers).get("Authorization"), entity_action
+            )
         except Exception as e:
             return False
 
     async def update_status(
         self, entity_reference: EntityReference, status: Status
     ):
+        # With the provider's write-behind buffer the update is merged with
+        # other updates of the entity and returns once it has been sent
+        if self.provider.status_buffer is not None:
+            await self.provider.status_buffer.update(entity_reference, status)
+            return
         url = f"{self.provider.get_prefix()}/{self.provider.get_version()}"
         await self.provider_api.patch(
             f"{url}/update_status",
             {"entity_ref": entity_reference, "status": status},
         )
 
+    async def update_changed_status(
+        self, entity: Union[Entity, EntityReference], status: Status
+    ) -> bool:
+        '''
+        Updates the status of an entity sending only the fields that differ
+        from its last known status, nothing is sent when no field changed.
+
+        The last known status is the one written by an earlier call in this
+        invocation, else the status of `entity` when it is the entity the
+        handler was invoked with. Without either the whole status is sent.
+        Returns whether a request was sent.
+        '''
+        if "metadata" in entity:
+            entity_reference, last_status = entity["metadata"], entity.get("status")
+        else:
+            entity_reference, last_status = entity, None
+        key = (entity_reference["kind"], entity_reference["uuid"])
+        if key in self._known_statuses:
+            last_status = self._known_statuses[key]
+        diff = status if last_status is None else status_diff(last_status, status)
+        if not diff:
+            return False
+        try:
+            await self.update_status(entity_reference, diff)
+        except Exception:
+            # What the engine holds now is unknown
+            self._known_statuses.pop(key, None)
+            raise
+        self._known_statuses[key] = copy_json(status)
+        return True
+
     @deprecated(version='0.11.0', reason="This function will be removed soon. Use update_status instead.")
     async def replace_status(
         self, entity_reference: EntityReference, status: Status
@@ -102,6 +168,8 @@ class ProceduralCtx(object):
         This functions inserts a new document if no matching document
         is found for the query.
         '''
+        if self.provider.status_buffer is not None:
+            await self.provider.status_buffer.flush()
         url = f"{self.provider.get_prefix()}/{self.provider.get_version()}"
         await self.provider_api.post(
             f"{url}/update_status",
@@ -117,15 +185,6 @@ class ProceduralCtx(object):
     def get_user_security_api(self, user_s2skey: Secret):
         return self.provider.new_security_api(user_s2skey)
 
-    def get_headers(self) -> CIMultiDict:
-        return self.headers
-
-    def get_invoking_token(self) -> str:
-        if "authorization" in self.headers:
-            parts = self.headers["authorization"].split(" ")
-            if parts[0] == "Bearer":
-                return parts[1]
-        raise Exception("No invoking user")
 
 class IntentfulCtx(ProceduralCtx):
     pass
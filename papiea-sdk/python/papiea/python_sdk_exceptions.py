@@ -1,24 +1,31 @@
-import json
 import logging
-from typing import Any, List, Optional
+from typing import Any, List, Mapping, Optional
 
 from aiohttp import ClientResponse
 
+from papiea.codec import JsonCodec, get_default_codec
 from papiea.core import PapieaError
-from papiea.utils import json_loads_attrs
 
 
 class ApiException(Exception):
-    def __init__(self, status: int, reason: str, details: str):
+    def __init__(self, status: int, reason: str, details: str, headers: Optional[Mapping[str, str]] = None):
         super().__init__(reason)
         self.status = status
         self.reason = reason
         self.details = details
+        self.headers = headers
 
 
-async def check_response(resp: ClientResponse, logger: logging.Logger):
+class CircuitOpenException(Exception):
+    # Raised without contacting the engine while the circuit breaker is open
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit breaker is open, retry in {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+async def check_response(resp: ClientResponse, logger: logging.Logger, codec: Optional[JsonCodec] = None):
     if resp.status >= 400:
-        await PapieaBaseException.raise_error(resp, logger)
+        await PapieaBaseException.raise_error(resp, logger, codec)
 
 
 class PapieaBaseException(Exception):
@@ -30,22 +37,22 @@ class PapieaBaseException(Exception):
         self.details = details
 
     @staticmethod
-    async def raise_error(resp: ClientResponse, logger: logging.Logger):
+    async def raise_error(resp: ClientResponse, logger: logging.Logger, codec: Optional[JsonCodec] = None):
         details = await resp.text()
         try:
-            details = json_loads_attrs(details)
+            details = (codec or get_default_codec()).loads_attrs(details)
             logger.error(f"Got exception while making request. Status: {resp.status}, Reason: {resp.reason},"
                          f" Details: {details}")
         except:
             logger.error(f"Got exception while making request. Status: {resp.status}, Reason: {resp.reason}")
-            raise ApiException(resp.status, resp.reason, details)
+            raise ApiException(resp.status, resp.reason, details, resp.headers)
         error = details.get("error")
         if error:
             exception = EXCEPTION_MAP.get(error["type"])
             if exception:
                 logger.info("There is exception")
                 raise exception(error.get("errors")[0].get("message"), resp, details)
-        raise ApiException(resp.status, resp.reason, details)
+        raise ApiException(resp.status, resp.reason, details, resp.headers)
 
 
 class ConflictingEntityException(PapieaBaseException):
@@ -94,6 +101,10 @@ class InvocationError(Exception):
         self.errors = errors
         self.stack = stack
 
+    def __reduce__(self):
+        # Handlers run in a process pool send their errors back pickled
+        return type(self), (self.status_code, self.message, self.errors, self.stack)
+
     @staticmethod
     def from_error(e: Exception):
         return InvocationError(500, str(e), [])
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left, insort
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set
+
+from .client import EntityCRUD
+from .core import CompactEntity, CompactRecord, Entity
+
+BATCH_SIZE = 500
+
+
+def _path_value(entity: Entity, path: List[str]) -> Any:
+    value = entity
+    for key in path:
+        if not isinstance(value, (dict, CompactRecord)) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def _index_key(value: Any) -> Hashable:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
+
+
+class _Index(object):
+    # Entity uuids by the value at one path, the distinct string values are
+    # also kept sorted for prefix lookups
+    def __init__(self, path: str):
+        self.path = path.split(".")
+        self.uuids: Dict[Hashable, Set[str]] = {}
+        self.sorted_strings: List[str] = []
+
+    def add(self, uuid: str, entity: Entity) -> None:
+        value = _path_value(entity, self.path)
+        if value is None:
+            return
+        key = _index_key(value)
+        uuids = self.uuids.get(key)
+        if uuids is None:
+            uuids = self.uuids[key] = set()
+            if isinstance(key, str):
+                insort(self.sorted_strings, key)
+        uuids.add(uuid)
+
+    def remove(self, uuid: str, entity: Entity) -> None:
+        value = _path_value(entity, self.path)
+        if value is None:
+            return
+        key = _index_key(value)
+        uuids = self.uuids.get(key)
+        if uuids is None:
+            return
+        uuids.discard(uuid)
+        if not uuids:
+            del self.uuids[key]
+            if isinstance(key, str):
+                del self.sorted_strings[bisect_left(self.sorted_strings, key)]
+
+    def lookup(self, value: Any) -> Set[str]:
+        return self.uuids.get(_index_key(value), set())
+
+    def lookup_prefix(self, prefix: str) -> Set[str]:
+        uuids = set()
+        start = bisect_left(self.sorted_strings, prefix)
+        for key in self.sorted_strings[start:]:
+            if not key.startswith(prefix):
+                break
+            uuids |= self.uuids[key]
+        return uuids
+
+
+class KindReplica(object):
+    """
+    In-memory replica of the entities of a kind, answering equality and
+    prefix lookups on declared spec, status or metadata paths (e.g.
+    "spec.name") without a request to the engine.
+
+    The replica is loaded with a full scan on `start` and refreshed by
+    another scan every `refresh_interval_secs`. A refresh only touches the
+    entities whose spec version or status changed, and drops the ones that
+    are gone. Lookups are at most `staleness_secs` behind the engine; with
+    `max_staleness_secs` set they raise once the replica is older than
+    that, e.g. because the engine can't be reached.
+
+    With `compact_entities` the entities are kept as CompactEntity records,
+    whose metadata take a fraction of the memory of the decoded dicts on
+    large replicas.
+
+    The returned entities are shared with the replica and must not be
+    modified.
+    """
+
+    def __init__(
+            self,
+            client: EntityCRUD,
+            indexes: Iterable[str] = (),
+            refresh_interval_secs: float = 5,
+            max_staleness_secs: Optional[float] = None,
+            filter_obj: Any = None,
+            batch_size: int = BATCH_SIZE,
+            compact_entities: bool = False,
+            logger: logging.Logger = logging.getLogger(__name__)
+    ):
+        self.client = client
+        self.refresh_interval_secs = refresh_interval_secs
+        self.max_staleness_secs = max_staleness_secs
+        self.filter_obj = filter_obj if filter_obj is not None else {}
+        self.batch_size = batch_size
+        self.compact_entities = compact_entities
+        self.logger = logger
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self._indexes: Dict[str, _Index] = {path: _Index(path) for path in indexes}
+        self._entities: Dict[str, Entity] = {}
+        self._refreshed_at: Optional[float] = None
+        self._refresh_lock = asyncio.Lock()
+        self._poller: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    async def __aenter__(self) -> "KindReplica":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        await self.refresh()
+        if self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll())
+
+    async def close(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval_secs)
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.failed_refreshes += 1
+                self.logger.warning(f"Failed to refresh the replica of {self.client.kind}: {e}")
+
+    async def refresh(self) -> None:
+        async with self._refresh_lock:
+            # Lookups are as old as the start of the scan
+            started_at = time.monotonic()
+            seen = set()
+            iterator = await self.client.filter_iter(self.filter_obj, stop_on_short_page=True)
+            async for entity in iterator(self.batch_size):
+                uuid = entity.metadata.uuid
+                seen.add(uuid)
+                old = self._entities.get(uuid)
+                if old is not None and old.metadata.get("spec_version") == entity.metadata.get("spec_version") \
+                        and old.get("status") == entity.get("status"):
+                    continue
+                if self.compact_entities:
+                    entity = CompactEntity.from_wire(entity)
+                self._replace(uuid, old, entity)
+            for uuid in [uuid for uuid in self._entities if uuid not in seen]:
+                self._replace(uuid, self._entities[uuid], None)
+            self._refreshed_at = started_at
+            self.refreshes += 1
+
+    def _replace(self, uuid: str, old: Optional[Entity], new: Optional[Entity]) -> None:
+        for index in self._indexes.values():
+            if old is not None:
+                index.remove(uuid, old)
+            if new is not None:
+                index.add(uuid, new)
+        if new is None:
+            del self._entities[uuid]
+        else:
+            self._entities[uuid] = new
+
+    @property
+    def staleness_secs(self) -> Optional[float]:
+        if self._refreshed_at is None:
+            return None
+        return time.monotonic() - self._refreshed_at
+
+    def _check_fresh(self) -> None:
+        staleness = self.staleness_secs
+        if staleness is None:
+            raise Exception(f"Replica of {self.client.kind} is not loaded, start it first")
+        if self.max_staleness_secs is not None and staleness > self.max_staleness_secs:
+            raise Exception(f"Replica of {self.client.kind} is {staleness:.1f}s old, "
+                            f"more than {self.max_staleness_secs}s")
+
+    def _index(self, path: str) -> _Index:
+        index = self._indexes.get(path)
+        if index is None:
+            raise Exception(f"Path {path} is not indexed in the replica of {self.client.kind}")
+        return index
+
+    def get(self, uuid: str) -> Optional[Entity]:
+        self._check_fresh()
+        return self._entities.get(uuid)
+
+    def entities(self) -> List[Entity]:
+        self._check_fresh()
+        return list(self._entities.values())
+
+    def lookup(self, path: str, value: Any) -> List[Entity]:
+        index = self._index(path)
+        self._check_fresh()
+        return [self._entities[uuid] for uuid in index.lookup(value)]
+
+    def lookup_prefix(self, path: str, prefix: str) -> List[Entity]:
+        index = self._index(path)
+        self._check_fresh()
+        return [self._entities[uuid] for uuid in index.lookup_prefix(prefix)]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entities),
+            "refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes,
+            "staleness_secs": self.staleness_secs,
+        }
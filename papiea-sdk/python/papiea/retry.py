@@ -0,0 +1,143 @@
+import asyncio
+import random
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from aiohttp import ClientConnectionError, ClientConnectorError
+
+from .python_sdk_exceptions import PapieaBaseException
+
+# Methods that never change state on the engine, they are always retried
+SAFE_METHODS = ("get", "head", "options")
+
+# Responses telling that the request was not processed
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class RetryBudget(object):
+    """
+    Token bucket that keeps retries to a fraction of the requests.
+
+    Every request adds `ratio` tokens (up to `max_tokens`) and every retry
+    takes one, so that a failing engine gets at most about `ratio` extra
+    requests per request instead of a retry storm.
+    """
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RetryPolicy(object):
+    """
+    Retries failed requests with exponential backoff and full jitter.
+
+    Requests that did not reach the engine (connection refused) are retried
+    whatever their method. Broken connections, timeouts and responses with
+    one of `retry_statuses` are only retried for safe methods and for
+    requests marked idempotent. A retry waits for the backoff or the
+    response's Retry-After, whichever is longer, but at most
+    `backoff_max_secs`.
+    """
+
+    def __init__(
+            self,
+            max_attempts: int = 3,
+            backoff_base_secs: float = 0.05,
+            backoff_max_secs: float = 2.0,
+            jitter: bool = True,
+            retry_statuses: Tuple[int, ...] = RETRY_STATUSES,
+            budget: Optional[RetryBudget] = None
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_base_secs = backoff_base_secs
+        self.backoff_max_secs = backoff_max_secs
+        self.jitter = jitter
+        self.retry_statuses = retry_statuses
+        self.budget = budget if budget is not None else RetryBudget()
+        self.retries = 0
+        self.budget_exhausted = 0
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max_secs, self.backoff_base_secs * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def is_retryable(self, method: str, idempotent: bool, error: Exception) -> bool:
+        if isinstance(error, ClientConnectorError):
+            return True
+        if not idempotent and method.lower() not in SAFE_METHODS:
+            return False
+        if isinstance(error, (ClientConnectionError, asyncio.TimeoutError)):
+            return True
+        return _status(error) in self.retry_statuses
+
+    async def call(self, method: str, idempotent: bool, request: Callable[[], Awaitable[Any]]) -> Any:
+        self.budget.deposit()
+        attempt = 1
+        while True:
+            try:
+                return await request()
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.is_retryable(method, idempotent, e):
+                    raise
+                if not self.budget.withdraw():
+                    self.budget_exhausted += 1
+                    raise
+                delay = max(self.backoff(attempt), _retry_after(e) or 0)
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(min(delay, self.backoff_max_secs))
+
+    def metrics(self) -> dict:
+        return {
+            "retries": self.retries,
+            "budget_exhausted": self.budget_exhausted,
+            "budget_tokens": self.budget.tokens,
+        }
+
+
+def _status(error: Exception) -> Optional[int]:
+    if isinstance(error, PapieaBaseException):
+        return error.resp.status
+    return getattr(error, "status", None)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    # Papiea errors keep the response, ApiException and aiohttp's
+    # ClientResponseError keep its headers
+    if isinstance(error, PapieaBaseException):
+        headers = error.resp.headers
+    else:
+        headers = getattr(error, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+_default_retry_policy: Optional[RetryPolicy] = None
+
+
+def get_default_retry_policy() -> RetryPolicy:
+    global _default_retry_policy
+    if _default_retry_policy is None:
+        _default_retry_policy = RetryPolicy()
+    return _default_retry_policy
+
+
+def set_default_retry_policy(retry_policy: RetryPolicy) -> None:
+    global _default_retry_policy
+    _default_retry_policy = retry_policy
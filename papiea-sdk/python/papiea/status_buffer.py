@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .client import run_bulk
+from .core import EntityReference, Status
+from .utils import copy_json, retrieve_exception
+
+
+def merge_partial_status(earlier: dict, later: dict) -> Optional[dict]:
+    """
+    Merges two partial statuses into one with the same effect as sending
+    `earlier` and then `later` to the PATCH update_status route: objects are
+    merged, arrays and scalars are replaced and null (unset) wins over
+    earlier values. Returns None when a single partial status cannot express
+    both, i.e. when `later` sets fields of an object that `earlier` unsets.
+    """
+    merged = dict(earlier)
+    for key, value in later.items():
+        current = merged.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            nested = merge_partial_status(current, value)
+            if nested is None:
+                return None
+            merged[key] = nested
+        elif isinstance(value, dict) and key in merged and current is None:
+            return None
+        else:
+            merged[key] = value
+    return merged
+
+
+def status_diff(last: Optional[dict], new: dict) -> dict:
+    """
+    Partial status which turns `last` into `new` when sent to the PATCH
+    update_status route: changed fields with their new values (arrays as a
+    whole), removed fields as null and nothing for unchanged ones.
+    """
+    last = last or {}
+    diff = {}
+    for key, value in new.items():
+        current = last.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            nested = status_diff(current, value)
+            if nested:
+                diff[key] = nested
+        elif value != current:
+            diff[key] = copy_json(value)
+    for key, value in last.items():
+        if key not in new and value is not None:
+            diff[key] = None
+    return diff
+
+
+class _StatusUpdate(object):
+    __slots__ = ("status", "future")
+
+    def __init__(self, status: dict, future: asyncio.Future):
+        self.status = status
+        self.future = future
+
+
+class _PendingEntity(object):
+    __slots__ = ("entity_reference", "updates")
+
+    def __init__(self, entity_reference: EntityReference):
+        self.entity_reference = entity_reference
+        self.updates: List[_StatusUpdate] = []
+
+
+class StatusWriteBuffer(object):
+    """
+    Write-behind buffer of partial status updates.
+
+    Updates of the same entity are merged until the buffer is flushed, which
+    happens `flush_interval_secs` after the first buffered update, as soon as
+    `max_batch_size` entities are buffered, or on `flush()`/`close()`.
+    Every update returns a future which completes once the update reached the
+    engine. Updates of the same entity are sent in order, at most
+    `max_concurrency` requests are in flight.
+    """
+
+    def __init__(
+            self,
+            send: Callable[[EntityReference, Status], Awaitable[Any]],
+            flush_interval_secs: float = 0.05,
+            max_batch_size: int = 500,
+            max_concurrency: int = 16,
+            logger: logging.Logger = logging.getLogger(__name__)
+    ):
+        self.send = send
+        self.flush_interval_secs = flush_interval_secs
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.logger = logger
+        self.updates = 0
+        self.merged = 0
+        self.requests = 0
+        self.failed = 0
+        self._pending: Dict[Tuple[str, str], _PendingEntity] = {}
+        self._sending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._flushes: Set[asyncio.Task] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def update(self, entity_reference: EntityReference, status: Status) -> asyncio.Future:
+        if self._closed:
+            raise Exception("Status write buffer is closed")
+        loop = asyncio.get_running_loop()
+        self.updates += 1
+        key = (entity_reference["kind"], entity_reference["uuid"])
+        entity = self._pending.get(key)
+        if entity is None:
+            entity = self._pending[key] = _PendingEntity(entity_reference)
+        status = copy_json(status)
+        merged = merge_partial_status(entity.updates[-1].status, status) if entity.updates else None
+        if merged is not None:
+            self.merged += 1
+            entity.updates[-1].status = merged
+            future = entity.updates[-1].future
+        else:
+            future = loop.create_future()
+            future.add_done_callback(retrieve_exception)
+            entity.updates.append(_StatusUpdate(status, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_interval_secs, self._start_flush)
+        return future
+
+    def _start_flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.ensure_future(run_bulk(self._send_entity, list(batch.items()), self.max_concurrency))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _send_entity(self, item: Tuple[Tuple[str, str], _PendingEntity]) -> None:
+        key, entity = item
+        # An earlier flush may still be sending updates of this entity
+        previous = self._sending.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._sending[key] = done
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            for update in entity.updates:
+                try:
+                    await self.send(entity.entity_reference, update.status)
+                    self.requests += 1
+                    update.future.set_result(None)
+                except Exception as e:
+                    self.failed += 1
+                    self.logger.error(f"Failed to update status of {entity.entity_reference['uuid']}: {e}")
+                    update.future.set_exception(e)
+        finally:
+            done.set_result(None)
+            if self._sending.get(key) is done:
+                del self._sending[key]
+
+    async def flush(self) -> None:
+        self._start_flush()
+        while self._flushes:
+            await asyncio.gather(*self._flushes)
+
+    async def close(self) -> None:
+        self._closed = True
+        await self.flush()
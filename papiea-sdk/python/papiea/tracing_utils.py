@@ -1,12 +1,23 @@
+from typing import Optional
+
 import opentracing
-from jaeger_client import Config
+from deprecated import deprecated
 from opentracing import Tracer, Format, Span
 
 from papiea.api import ApiInstance
 import re
 
+# opentracing.Tracer itself is a no-op implementation, spans created by it
+# are a shared constant and nothing is injected into the request headers
+NOOP_TRACER = Tracer()
+
+_default_tracer: Optional[Tracer] = None
+
 
 def init_default_tracer() -> Tracer:
+    # Imported here so that importing the sdk does not pull in jaeger
+    from jaeger_client import Config
+
     config = Config(
         config={
             'sampler': {
@@ -29,15 +40,53 @@ def init_default_tracer() -> Tracer:
         return opentracing.global_tracer()
 
 
-def inject_tracing_headers(tracer: Tracer, span: Span, api_instance: ApiInstance):
+def get_default_tracer() -> Tracer:
+    """
+    Returns the tracer used by clients and providers that were not given one.
+
+    The jaeger tracer is only initialized on the first call.
+    """
+    global _default_tracer
+    if _default_tracer is None:
+        _default_tracer = init_default_tracer()
+    return _default_tracer
+
+
+def set_default_tracer(tracer: Tracer) -> None:
+    global _default_tracer
+    _default_tracer = tracer
+
+
+def disable_tracing() -> None:
+    set_default_tracer(NOOP_TRACER)
+
+
+def close_tracer(tracer: Tracer) -> None:
+    # The default tracer is shared by every client that was not given one
+    if tracer is _default_tracer or tracer is NOOP_TRACER:
+        return
+    close = getattr(tracer, "close", None)
+    if close is not None:
+        close()
+
+
+def tracing_headers(tracer: Tracer, span: Span) -> dict:
+    if tracer is NOOP_TRACER:
+        return {}
     http_header_carrier = {}
     tracer.inject(
         span_context=span.context,
         format=Format.HTTP_HEADERS,
         carrier=http_header_carrier)
+    return http_header_carrier
 
-    for key, value in http_header_carrier.items():
-        api_instance.headers[key] = value
+
+@deprecated(version='0.11.0', reason="Headers set on a shared ApiInstance leak into concurrent requests. "
+                                     "Pass tracing_headers() to the request instead.")
+def inject_tracing_headers(tracer: Tracer, span: Span, api_instance: ApiInstance):
+    headers = dict(api_instance.headers)
+    headers.update(tracing_headers(tracer, span))
+    api_instance.headers = headers
 
 
 def get_special_operation_name(operation_name: str, prefix: str, version: str, kind: str) -> str:
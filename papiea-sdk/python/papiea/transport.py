@@ -0,0 +1,136 @@
+import asyncio
+import os
+from typing import Dict, Optional
+
+from aiohttp import ClientSession, TCPConnector
+
+from .circuit_breaker import CircuitBreaker
+
+
+class Transport(object):
+    """
+    Pooled HTTP transport shared between ApiInstance objects.
+
+    A single aiohttp ClientSession (and its TCP connector) is kept per
+    event loop, so every ApiInstance that uses the same transport from that
+    loop reuses the same keep-alive connections. Sessions are created lazily,
+    the session of a loop is closed once that loop is found closed, and all
+    of them are closed once the last ApiInstance using the transport is
+    closed.
+    """
+
+    def __init__(
+            self,
+            limit: int = 100,
+            limit_per_host: int = 0,
+            keepalive_timeout: float = 15.0,
+            ttl_dns_cache: Optional[int] = 10,
+            use_dns_cache: bool = True,
+            circuit_breaker: Optional[CircuitBreaker] = None
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.use_dns_cache = use_dns_cache
+        # Shared by every ApiInstance of the transport, see ApiInstance.call
+        self.circuit_breaker = circuit_breaker
+        # Sessions are bound to the loop they were created on. A session
+        # references its loop, so entries are dropped when their loop is
+        # found closed rather than through weak references
+        self._sessions: Dict[asyncio.AbstractEventLoop, ClientSession] = {}
+        self._pid = os.getpid()
+        self._refs = 0
+
+    def _new_connector(self) -> TCPConnector:
+        return TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=self.use_dns_cache,
+        )
+
+    @property
+    def session(self) -> ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed or self._pid != os.getpid():
+            self._forget_parent_sessions()
+            self._close_sessions_of_closed_loops()
+            session = ClientSession(connector=self._new_connector())
+            self._sessions[loop] = session
+        return session
+
+    def _forget_parent_sessions(self) -> None:
+        # A forked worker inherits the sessions of its parent, their
+        # connections belong to the parent and are left alone
+        if self._pid == os.getpid():
+            return
+        for session in self._sessions.values():
+            session.detach()
+        self._sessions.clear()
+        self._pid = os.getpid()
+
+    def _close_sessions_of_closed_loops(self) -> None:
+        for loop in [loop for loop in self._sessions if loop.is_closed()]:
+            self._close_abandoned(self._sessions.pop(loop), loop)
+
+    @staticmethod
+    def _close_abandoned(session: ClientSession, loop: asyncio.AbstractEventLoop) -> None:
+        # The session of a loop other than the running one
+        if session.closed:
+            return
+        if loop.is_running():
+            # That loop runs in another thread, the session is closed there
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        # The loop won't run the close, the session lets go of its connector
+        # and, if the loop is closed, the connector drops its connections
+        # which went away with the loop
+        connector = session.connector
+        session.detach()
+        if connector is not None and loop.is_closed():
+            asyncio.ensure_future(connector.close())
+
+    @property
+    def closed(self) -> bool:
+        return all(session.closed for session in self._sessions.values())
+
+    def acquire(self) -> None:
+        self._refs += 1
+
+    async def release(self) -> None:
+        self._refs = max(self._refs - 1, 0)
+        if self._refs == 0:
+            await self.close()
+
+    async def close(self) -> None:
+        self._forget_parent_sessions()
+        sessions, self._sessions = self._sessions, {}
+        running_loop = asyncio.get_running_loop()
+        for loop, session in sessions.items():
+            if loop is running_loop:
+                await session.close()
+            else:
+                self._close_abandoned(session, loop)
+
+
+_default_transport: Optional[Transport] = None
+
+
+def get_default_transport() -> Transport:
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = Transport()
+    return _default_transport
+
+
+def set_default_transport(transport: Transport) -> None:
+    global _default_transport
+    _default_transport = transport
+
+
+async def close_default_transport() -> None:
+    if _default_transport is not None:
+        await _default_transport.close()
@@ -1,14 +1,22 @@
-import json
+import asyncio
 from typing import Any, Optional
 
-from .core import AttributeDict, ErrorSchemas
+from .codec import get_default_codec
+from .core import ErrorSchemas
 
 
 def json_loads_attrs(s: str) -> Any:
-    def object_hook(obj):
-        return AttributeDict(obj)
+    return get_default_codec().loads_attrs(s)
 
-    return json.loads(s, object_hook=object_hook)
+
+def copy_json(value: Any) -> Any:
+    # copy.deepcopy does not work with AttributeDict, its attribute lookup
+    # raises KeyError instead of AttributeError
+    if isinstance(value, dict):
+        return type(value)((key, copy_json(item)) for key, item in dict.items(value))
+    if isinstance(value, list):
+        return type(value)(copy_json(item) for item in list.__iter__(value))
+    return value
 
 
 def validate_error_codes(error_schemas: Optional[ErrorSchemas]):
@@ -16,4 +24,11 @@ def validate_error_codes(error_schemas: Optional[ErrorSchemas]):
         for code in error_schemas:
             numeric_code = int(code)
             if not isinstance(numeric_code, int) or not (400 < numeric_code < 599):
-                raise Exception("Error description should feature status code in 4xx or 5xx")
\ No newline at end of file
+                raise Exception("Error description should feature status code in 4xx or 5xx")
+
+
+def retrieve_exception(future: asyncio.Future) -> None:
+    # Done callback for futures that may end up with nobody awaiting them,
+    # it keeps asyncio from logging their errors as never retrieved
+    if not future.cancelled():
+        future.exception()
@@ -20,12 +20,13 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/nutanix/papiea-js",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=["tests", "tests.*", "benchmarks", "benchmarks.*"]),
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: Apache Software License",
         "Operating System :: OS Independent",
     ],
     python_requires=">=3.7",
-    install_requires=["aiohttp>=3.6.2", "jaeger-client>=4.4.0"],
+    install_requires=["aiohttp>=3.6.2", "jaeger-client>=4.4.0", "Deprecated>=1.2.10"],
+    extras_require={"fast": ["orjson>=3.4.0"]},
 )
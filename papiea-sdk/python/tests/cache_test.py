@@ -0,0 +1,138 @@
+import asyncio
+import logging
+
+import opentracing
+import pytest
+
+from papiea.cache import TtlCache
+from papiea.client import EntityCRUD
+from papiea.core import AttributeDict
+from papiea.python_sdk import ProviderSdk
+from papiea.python_sdk_exceptions import EntityNotFoundException, SecurityApiError
+from papiea.transport import Transport
+from tests.local_engine import LocalEngine
+
+logger = logging.getLogger(__name__)
+
+ENGINE_HOST = "127.0.0.1"
+ENGINE_PORT = 9021
+ADMIN_KEY = "cache_admin_key"
+
+
+class TestTtlCache:
+    @pytest.mark.asyncio
+    async def test_concurrent_loads_are_deduplicated(self):
+        cache = TtlCache(ttl_secs=60)
+        loads = []
+
+        async def load():
+            loads.append(1)
+            await asyncio.sleep(0.01)
+            return "value"
+
+        assert await asyncio.gather(*[cache.get_or_load("key", load) for _ in range(5)]) == ["value"] * 5
+        assert await cache.get_or_load("key", load) == "value"
+        assert len(loads) == 1
+        assert cache.metrics()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_and_invalidated_loads_are_not_cached(self):
+        cache = TtlCache(ttl_secs=60)
+
+        async def failing():
+            raise Exception("Engine is down")
+
+        with pytest.raises(Exception):
+            await cache.get_or_load("key", failing)
+        assert "key" not in cache
+
+        async def slow():
+            await asyncio.sleep(0.01)
+            return "stale"
+
+        load = asyncio.ensure_future(cache.get_or_load("key", slow))
+        await asyncio.sleep(0)
+        cache.invalidate("key")
+        assert await load == "stale"
+        assert "key" not in cache
+
+    @pytest.mark.asyncio
+    async def test_entries_expire_and_size_is_bounded(self):
+        cache = TtlCache(ttl_secs=0.02, max_size=2)
+        for key in range(3):
+            cache.set(key, key)
+        assert len(cache) == 2 and cache.get(0) is None and cache.get(2) == 2
+        await asyncio.sleep(0.03)
+        assert cache.get(2) is None
+
+
+class TestSecurityApiCache:
+    @pytest.mark.asyncio
+    async def test_user_info_and_keys_are_cached_per_s2s_key(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            engine.add_s2skey(ADMIN_KEY, {"is_admin": True}, "admin", "cache_provider")
+            sdk = ProviderSdk(engine.url, ADMIN_KEY, logger=logger, tracer=opentracing.Tracer(),
+                              transport=Transport(), security_cache_ttl_secs=60)
+            sdk.version("0.1.0")
+            sdk.prefix("cache_provider")
+            try:
+                admin = sdk.provider_security_api
+                new_key = await admin.create_key(AttributeDict(user_info={"owner": "alice"}))
+                user = sdk.new_security_api(new_key.key)
+                infos = await asyncio.gather(*[sdk.new_security_api(new_key.key).user_info() for _ in range(3)])
+                assert [info.owner for info in infos] == ["alice"] * 3
+                infos[0].owner = "mallory"
+                assert (await user.user_info()).owner == "alice"
+                assert len(await admin.list_keys()) == 2
+                assert len(await admin.list_keys()) == 2
+                assert engine.request_counts["user_info"] == 1
+                assert engine.request_counts["list_keys"] == 1
+
+                await admin.deactivate_key(new_key.key)
+                with pytest.raises(SecurityApiError):
+                    await user.user_info()
+                assert len(await admin.list_keys()) == 1
+                await admin.create_key(AttributeDict(user_info={"owner": "bob"}))
+                assert len(await admin.list_keys()) == 2
+                assert engine.request_counts["list_keys"] == 3
+            finally:
+                await sdk.__aexit__(None, None, None)
+
+
+class TestEntityCache:
+    @pytest.mark.asyncio
+    async def test_get_is_read_through_and_follows_writes(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            sdk = ProviderSdk(engine.url, ADMIN_KEY, logger=logger, tracer=opentracing.Tracer(),
+                              transport=Transport())
+            sdk.version("0.1.0")
+            sdk.prefix("cache_provider")
+            sdk.new_kind({"bucket": {"type": "object", "x-papiea-entity": "differ"}})
+            await sdk.register()
+            try:
+                async with EntityCRUD(engine.url, "cache_provider", "0.1.0", "bucket", ADMIN_KEY, logger=logger,
+                                      tracer=opentracing.Tracer(), transport=Transport(),
+                                      entity_cache_ttl_secs=60) as client:
+                    created = await client.create(AttributeDict(spec={"name": "a"}))
+                    entity = await client.get(created.metadata)
+                    entity.spec.name = "modified by the caller"
+                    assert (await client.get(created.metadata)).spec.name == "a"
+                    assert engine.request_counts["get_entity"] == 0
+
+                    await client.update(entity.metadata, {"name": "b"})
+                    entity = await client.get(created.metadata)
+                    assert entity.spec.name == "b" and entity.metadata.spec_version == 2
+                    assert engine.request_counts["get_entity"] == 0
+
+                    # A handler got a newer version of the entity
+                    client.observe_entity(AttributeDict(metadata=AttributeDict(uuid=created.metadata.uuid,
+                                                                               kind="bucket", spec_version=3)))
+                    await asyncio.gather(*[client.get(created.metadata) for _ in range(3)])
+                    assert engine.request_counts["get_entity"] == 1
+
+                    await client.delete(created.metadata)
+                    with pytest.raises(EntityNotFoundException):
+                        await client.get(created.metadata)
+                    assert client.entity_cache_metrics()["hits"] == 3
+            finally:
+                await sdk.__aexit__(None, None, None)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+
+import pytest
+from aiohttp import ServerDisconnectedError, web
+
+from papiea.api import ApiInstance, Operation, RequestTimeouts
+from papiea.circuit_breaker import CircuitBreaker, CircuitState
+from papiea.python_sdk_exceptions import ApiException, CircuitOpenException, ProcedureInvocationException
+from papiea.retry import NO_RETRY
+from papiea.transport import Transport
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 9023
+
+
+class Engine(object):
+    def __init__(self):
+        self.status = 200
+        self.body = {"ok": True}
+        self.delay = 0
+        self.requests = 0
+        self.runner = None
+
+    async def handle(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        return web.json_response(self.body, status=self.status)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.add_routes([web.route("*", "/{tail:.*}", self.handle)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, SERVER_HOST, SERVER_PORT).start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.runner.cleanup()
+
+
+def breaker(**kwargs) -> CircuitBreaker:
+    return CircuitBreaker(**{"window_size": 4, "min_calls": 4, "open_secs": 0.05, **kwargs})
+
+
+class TestCircuitBreaker:
+    def test_opens_on_error_rate_and_fails_fast(self):
+        circuit = breaker(error_rate_threshold=0.5)
+        for failed in (False, True, False):
+            circuit.record(circuit.acquire(), failed, 0.01)
+        assert circuit.state == CircuitState.Closed
+        circuit.record(circuit.acquire(), True, 0.01)
+        assert circuit.state == CircuitState.Open
+        with pytest.raises(CircuitOpenException):
+            circuit.acquire()
+        assert circuit.metrics()["rejected"] == 1
+
+    def test_opens_on_slow_calls(self):
+        circuit = breaker(slow_call_secs=0.5, slow_call_rate_threshold=0.75)
+        for latency in (1, 1, 0.1, 1):
+            circuit.record(circuit.acquire(), False, latency)
+        assert circuit.state == CircuitState.Open
+
+    @pytest.mark.asyncio
+    async def test_half_open_probes_close_or_reopen_the_circuit(self):
+        circuit = breaker(half_open_probes=1)
+        for _ in range(4):
+            circuit.record(circuit.acquire(), True, 0.01)
+        await asyncio.sleep(0.06)
+        probe = circuit.acquire()
+        assert probe and circuit.state == CircuitState.HalfOpen
+        with pytest.raises(CircuitOpenException):
+            circuit.acquire()
+        circuit.record(probe, True, 0.01)
+        assert circuit.state == CircuitState.Open
+
+        await asyncio.sleep(0.06)
+        probe = circuit.acquire()
+        circuit.release(probe)
+        probe = circuit.acquire()
+        circuit.record(probe, False, 0.01)
+        assert circuit.state == CircuitState.Closed
+        assert not circuit.acquire()
+
+    def test_only_engine_failures_count(self):
+        assert CircuitBreaker.is_failure(ServerDisconnectedError())
+        assert CircuitBreaker.is_failure(asyncio.TimeoutError())
+        assert CircuitBreaker.is_failure(ApiException(503, "Unavailable", ""))
+        assert CircuitBreaker.is_failure(ApiException(500, "Internal Server Error", ""))
+        assert not CircuitBreaker.is_failure(ApiException(404, "Not found", ""))
+
+
+class TestApiInstanceCircuitBreaker:
+    @pytest.mark.asyncio
+    async def test_open_circuit_stops_requests_to_the_engine(self):
+        async with Engine() as engine:
+            transport = Transport(circuit_breaker=breaker())
+            api = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}", logger=logger, transport=transport,
+                              retry_policy=NO_RETRY)
+            engine.status = 503
+            for _ in range(4):
+                with pytest.raises(ApiException):
+                    await api.get("entity")
+            with pytest.raises(CircuitOpenException):
+                await api.get("entity")
+            assert engine.requests == 4
+
+            engine.status = 200
+            await asyncio.sleep(0.06)
+            assert (await api.get("entity")).ok
+            assert transport.circuit_breaker.state == CircuitState.Closed
+            await api.close()
+
+    @pytest.mark.asyncio
+    async def test_failing_procedure_does_not_open_the_circuit(self):
+        async with Engine() as engine:
+            transport = Transport(circuit_breaker=breaker())
+            api = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}", logger=logger, transport=transport,
+                              retry_policy=NO_RETRY)
+            engine.status = 500
+            engine.body = {"error": {"code": 500, "errors": [{"message": "Provider failed"}],
+                                     "message": "Provider failed", "type": "procedure_invocation_error"}}
+            for _ in range(8):
+                with pytest.raises(ProcedureInvocationException):
+                    await api.post("procedure", {}, operation=Operation.Procedure)
+            assert engine.requests == 8
+            assert transport.circuit_breaker.state == CircuitState.Closed
+            await api.close()
+
+    @pytest.mark.asyncio
+    async def test_per_operation_timeouts(self):
+        async with Engine() as engine:
+            api = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}", timeout=100, logger=logger,
+                              transport=Transport(), retry_policy=NO_RETRY,
+                              timeouts={Operation.Get: RequestTimeouts(connect=1, read=0.5)})
+            assert api.client_timeout.total == 0.1
+            engine.delay = 0.2
+            # The timeout is in milliseconds, requests without an operation get 100ms in total
+            with pytest.raises(asyncio.TimeoutError):
+                await api.post("create", {})
+            assert (await api.get("entity")).ok
+            assert (await api.post("filter", {}, operation=Operation.Filter)).ok
+            # Creations and deletions run the provider's constructor and destructor, only
+            # the connection is bounded
+            assert (await api.post("", {}, operation=Operation.Create)).ok
+            assert (await api.delete("entity")).ok
+            await api.close()
@@ -0,0 +1,260 @@
+import asyncio
+import logging
+
+import opentracing
+import pytest
+
+from papiea.client import EntityClientPool, EntityCRUD, IntentWatcherClient, IntentWatcherPoller
+from papiea.core import AttributeDict, IntentfulStatus
+from papiea.transport import Transport
+
+logger = logging.getLogger(__name__)
+
+PAPIEA_URL = "http://127.0.0.1:3000"
+
+
+class TestEntityClientPool:
+    @pytest.mark.asyncio
+    async def test_reuses_client_per_token_and_kind(self):
+        pool = EntityClientPool(PAPIEA_URL, logger=logger, tracer=opentracing.Tracer(), transport=Transport())
+        client = pool.get("provider", "0.1.0", "bucket", "token")
+        async with client:
+            pass
+        assert pool.get("provider", "0.1.0", "bucket", "token") is client
+        assert pool.get("provider", "0.1.0", "bucket", "other_token") is not client
+        assert pool.get("provider", "0.1.0", "object", "token") is not client
+        assert not client.api_instance._closed
+        await pool.close()
+        assert client.api_instance._closed
+
+    @pytest.mark.asyncio
+    async def test_evicts_least_recently_used(self):
+        pool = EntityClientPool(PAPIEA_URL, max_size=2, logger=logger, tracer=opentracing.Tracer(), transport=Transport())
+        first = pool.get("provider", "0.1.0", "bucket", "first")
+        pool.get("provider", "0.1.0", "bucket", "second")
+        pool.get("provider", "0.1.0", "bucket", "first")
+        pool.get("provider", "0.1.0", "bucket", "third")
+        assert len(pool) == 2
+        assert pool.get("provider", "0.1.0", "bucket", "first") is first
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_evicts_idle_clients(self):
+        pool = EntityClientPool(PAPIEA_URL, idle_timeout_secs=0, logger=logger, tracer=opentracing.Tracer(), transport=Transport())
+        first = pool.get("provider", "0.1.0", "bucket", "token")
+        assert pool.get("provider", "0.1.0", "bucket", "token") is not first
+        await pool.close()
+        assert first.api_instance._closed
+
+
+class FakeIntentWatcherClient(IntentWatcherClient):
+    def __init__(self):
+        super().__init__(PAPIEA_URL, logger=logger, tracer=opentracing.Tracer(), transport=Transport())
+        self.statuses = {}
+        self.requests = 0
+
+    async def filter_intent_watcher(self, filter_obj, limit=None, offset=None):
+        self.requests += 1
+        watchers = [AttributeDict(uuid=uuid, status=status) for uuid, status in self.statuses.items()
+                    if status == filter_obj.get("status", status)]
+        offset = offset or 0
+        return watchers[offset:offset + limit] if limit is not None else watchers[offset:]
+
+
+class TestIntentWatcherPoller:
+    @pytest.mark.asyncio
+    async def test_concurrent_waiters_share_requests(self):
+        client = FakeIntentWatcherClient()
+        client.statuses = {str(i): IntentfulStatus.Active for i in range(20)}
+        waits = [
+            asyncio.ensure_future(client.wait_for_watcher_status(
+                AttributeDict(uuid=str(i)), IntentfulStatus.Completed_Successfully, 5, 10
+            ))
+            for i in range(20)
+        ]
+        await asyncio.sleep(0.05)
+        for i in range(20):
+            client.statuses[str(i)] = IntentfulStatus.Completed_Successfully
+        assert all(await asyncio.gather(*waits))
+        assert client.requests < 10
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_one_paged_query_per_tick(self):
+        client = FakeIntentWatcherClient()
+        client.statuses = {str(i): IntentfulStatus.Completed_Successfully for i in range(100)}
+        client._poller = IntentWatcherPoller(client, page_size=10)
+        # The scan stops at the page of the last awaited watcher
+        assert all(await asyncio.gather(*[
+            client.wait_for_watcher_status(AttributeDict(uuid=str(i)), IntentfulStatus.Completed_Successfully, 5, 10)
+            for i in (0, 25, 45)
+        ]))
+        assert client.requests == 5
+
+        # Waiters for different statuses share the query, which is then not on the status
+        client.requests = 0
+        client.statuses["failed"] = IntentfulStatus.Failed
+        assert all(await asyncio.gather(
+            client.wait_for_watcher_status(AttributeDict(uuid="0"), IntentfulStatus.Completed_Successfully, 5, 10),
+            client.wait_for_watcher_status(AttributeDict(uuid="failed"), IntentfulStatus.Failed, 5, 10)
+        ))
+        assert client.requests == 11
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_new_waiter_is_polled_right_away(self):
+        client = FakeIntentWatcherClient()
+        client.statuses = {"slow": IntentfulStatus.Active, "done": IntentfulStatus.Completed_Successfully}
+        slow = asyncio.ensure_future(client.wait_for_watcher_status(
+            AttributeDict(uuid="slow"), IntentfulStatus.Completed_Successfully, 5, 1000
+        ))
+        await asyncio.sleep(0.01)
+        # The poller sleeps for a second now
+        assert await asyncio.wait_for(client.wait_for_watcher_status(
+            AttributeDict(uuid="done"), IntentfulStatus.Completed_Successfully, 5, 1000
+        ), 0.1)
+        await client.close()
+        assert client._poller._task.done()
+        with pytest.raises(Exception) as excinfo:
+            await slow
+        assert str(excinfo.value) == "Intent watcher client closed"
+
+    @pytest.mark.asyncio
+    async def test_does_not_block_event_loop(self):
+        client = FakeIntentWatcherClient()
+        client.statuses = {"watcher": IntentfulStatus.Active}
+        wait = asyncio.ensure_future(client.wait_for_watcher_status(
+            AttributeDict(uuid="watcher"), IntentfulStatus.Completed_Successfully, 5, 50
+        ))
+        ticks = 0
+        while not wait.done() and ticks < 10:
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert ticks == 10
+        client.statuses["watcher"] = IntentfulStatus.Completed_Successfully
+        assert await wait
+        await client.api_instance.close()
+
+    @pytest.mark.asyncio
+    async def test_timeout(self):
+        client = FakeIntentWatcherClient()
+        client.statuses = {"watcher": IntentfulStatus.Active}
+        with pytest.raises(Exception) as excinfo:
+            await client.wait_for_watcher_status(
+                AttributeDict(uuid="watcher"), IntentfulStatus.Completed_Successfully, 0.1, 10
+            )
+        assert str(excinfo.value) == "Timeout waiting for intent watcher status"
+        assert client._poller.pending == 0
+        await client.api_instance.close()
+
+
+class FakeEntityCRUD(EntityCRUD):
+    def __init__(self):
+        super().__init__(PAPIEA_URL, "provider", "0.1.0", "bucket", logger=logger,
+                         tracer=opentracing.Tracer(), transport=Transport())
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get(self, entity_reference):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.001 * (int(entity_reference.uuid) % 3))
+            if int(entity_reference.uuid) % 5 == 0:
+                raise Exception(f"Failed {entity_reference.uuid}")
+            return AttributeDict(metadata=entity_reference)
+        finally:
+            self.in_flight -= 1
+
+
+class TestBulkOperations:
+    @pytest.mark.asyncio
+    async def test_keeps_order_and_collects_errors(self):
+        client = FakeEntityCRUD()
+        refs = (AttributeDict(uuid=str(i), kind="bucket") for i in range(1, 51))
+        results = await client.get_many(refs, concurrency=4)
+        assert len(results) == 50
+        assert client.max_in_flight == 4
+        for i, result in enumerate(results, 1):
+            if i % 5 == 0:
+                assert str(result) == f"Failed {i}"
+            else:
+                assert result.metadata.uuid == str(i)
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_accepts_async_iterables(self):
+        client = FakeEntityCRUD()
+
+        async def refs():
+            for i in range(1, 10):
+                yield AttributeDict(uuid=str(i), kind="bucket")
+
+        results = await client.get_many(refs(), concurrency=3)
+        assert [r.metadata.uuid for r in results if not isinstance(r, Exception)] == \
+               [str(i) for i in range(1, 10) if i % 5 != 0]
+        await client.close()
+
+
+class FakeFilterEntityCRUD(EntityCRUD):
+    def __init__(self, total):
+        super().__init__(PAPIEA_URL, "provider", "0.1.0", "bucket", logger=logger,
+                         tracer=opentracing.Tracer(), transport=Transport())
+        self.total = total
+        self.requests = []
+        self.outstanding = 0
+        self.max_outstanding = 0
+
+        async def post(prefix, data, headers={}, idempotent=False, operation=None):
+            query = dict(param.split("=") for param in prefix.split("?")[1].split("&"))
+            limit, offset = int(query["limit"]), int(query["offset"] or 0)
+            self.requests.append(offset)
+            self.outstanding += 1
+            self.max_outstanding = max(self.max_outstanding, self.outstanding)
+            try:
+                await asyncio.sleep(0.001)
+            finally:
+                self.outstanding -= 1
+            return AttributeDict(results=list(range(offset, min(offset + limit, self.total))))
+
+        self.api_instance.post = post
+
+
+class TestFilterIter:
+    @pytest.mark.asyncio
+    async def test_iterates_all_pages(self):
+        client = FakeFilterEntityCRUD(95)
+        iterator = await client.filter_iter({}, prefetch=2)
+        assert [x async for x in iterator(10)] == list(range(95))
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_no_recursion_on_long_scans(self):
+        client = FakeFilterEntityCRUD(1500)
+        iterator = await client.filter_iter({}, prefetch=0)
+        assert len([x async for x in iterator(1)]) == 1500
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_stop_on_short_page(self):
+        client = FakeFilterEntityCRUD(25)
+        iterator = await client.filter_iter({}, prefetch=0, stop_on_short_page=True)
+        assert [x async for x in iterator(10)] == list(range(25))
+        assert client.requests == [0, 10, 20]
+        iterator = await client.filter_iter({}, prefetch=0)
+        client.requests = []
+        assert [x async for x in iterator(10)] == list(range(25))
+        assert client.requests == [0, 10, 20, 30]
+        await client.close()
+
+    @pytest.mark.asyncio
+    async def test_prefetch_bounds_outstanding_requests(self):
+        for prefetch, requests in [(0, [0, 10, 20, 30]), (1, [0, 10, 20, 30]), (2, [0, 10, 20, 30, 40])]:
+            client = FakeFilterEntityCRUD(25)
+            iterator = await client.filter_iter({}, prefetch=prefetch)
+            async for _ in iterator(10):
+                # Slow consumer, the prefetched pages are all sent meanwhile
+                await asyncio.sleep(0.005)
+            assert client.requests == requests
+            assert client.max_outstanding == prefetch + 1
+            await client.close()
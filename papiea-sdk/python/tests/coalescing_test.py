@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+import opentracing
+import pytest
+from aiohttp import web
+
+from papiea.api import ApiInstance, Operation
+from papiea.client import EntityCRUD
+from papiea.core import AttributeDict
+from papiea.python_sdk_exceptions import ApiException
+from papiea.retry import NO_RETRY
+from papiea.transport import Transport
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 9024
+
+
+class SlowEngine(object):
+    def __init__(self):
+        self.requests = []
+        self.runner = None
+
+    async def handle(self, request):
+        body = await request.read()
+        self.requests.append((request.method, request.path_qs, request.headers.get("Authorization")))
+        await asyncio.sleep(0.02)
+        if request.path.endswith("/missing"):
+            return web.json_response({"missing": True}, status=418)
+        return web.json_response({"path": request.path_qs, "body": body.decode()})
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.add_routes([web.route("*", "/{tail:.*}", self.handle)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, SERVER_HOST, SERVER_PORT).start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.runner.cleanup()
+
+
+class TestReadCoalescing:
+    @pytest.mark.asyncio
+    async def test_identical_reads_share_one_request(self):
+        async with SlowEngine() as engine:
+            api = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}", headers={"Authorization": "Bearer alice"},
+                              logger=logger, transport=Transport(), retry_policy=NO_RETRY, coalesce_reads=True)
+            results = await asyncio.gather(
+                *[api.get("entity/1") for _ in range(5)],
+                *[api.post("filter", {"spec": {"name": "a"}}, operation=Operation.Filter) for _ in range(3)],
+                api.post("filter", {"spec": {"name": "b"}}, operation=Operation.Filter),
+                api.get("entity/1", headers={"Authorization": "Bearer bob"}),
+                *[api.post("entity", {"spec": {}}) for _ in range(2)],
+            )
+            assert results[0] is results[4]
+            assert results[5] is results[7] and results[8].body != results[5].body
+            assert len(engine.requests) == 6
+            assert api.coalescing_metrics() == {"requests": 4, "coalesced": 6, "in_flight": 0}
+
+            # Later reads are not served from the finished request
+            await api.get("entity/1")
+            assert len(engine.requests) == 7
+            await api.close()
+
+    @pytest.mark.asyncio
+    async def test_errors_are_shared_and_cancelled_callers_do_not_cancel_the_request(self):
+        async with SlowEngine() as engine:
+            api = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}", logger=logger, transport=Transport(),
+                              retry_policy=NO_RETRY, coalesce_reads=True)
+            first = asyncio.ensure_future(api.get("missing"))
+            await asyncio.sleep(0)
+            others = [asyncio.ensure_future(api.get("missing")) for _ in range(2)]
+            await asyncio.sleep(0)
+            first.cancel()
+            results = await asyncio.gather(*others, return_exceptions=True)
+            assert all(isinstance(result, ApiException) and result.status == 418 for result in results)
+            assert len(engine.requests) == 1
+            await api.close()
+
+    @pytest.mark.asyncio
+    async def test_entity_crud_opt_in(self):
+        async with SlowEngine() as engine:
+            base = f"http://{SERVER_HOST}:{SERVER_PORT}"
+            async with EntityCRUD(base, "provider", "0.1.0", "bucket", "alice", logger=logger,
+                                  tracer=opentracing.Tracer(), transport=Transport(), coalesce_reads=True) as client:
+                await asyncio.gather(*[client.get(AttributeDict(uuid="1")) for _ in range(3)],
+                                     *[client.filter({"spec": {"name": "a"}}) for _ in range(3)])
+                assert client.coalescing_metrics()["coalesced"] == 4
+            async with EntityCRUD(base, "provider", "0.1.0", "bucket", "alice", logger=logger,
+                                  tracer=opentracing.Tracer(), transport=Transport()) as client:
+                await asyncio.gather(*[client.get(AttributeDict(uuid="1")) for _ in range(3)])
+                assert client.coalescing_metrics()["coalesced"] == 0
+            assert len(engine.requests) == 5
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from papiea.codec import JsonCodec, OrjsonCodec, orjson
+from papiea.core import AttributeDict
+
+CODECS = [JsonCodec(), JsonCodec(lazy_attrs=True)]
+if orjson is not None:
+    CODECS.extend([OrjsonCodec(lazy_attrs=False), OrjsonCodec()])
+
+
+def codec_id(codec):
+    return codec.name + ("+lazy" if codec.lazy_attrs else "")
+
+
+class TestCodec:
+    @pytest.mark.parametrize("codec", CODECS, ids=codec_id)
+    def test_round_trip(self, codec):
+        entity = AttributeDict(
+            metadata=AttributeDict(uuid="1", kind="bucket", spec_version=1),
+            spec=AttributeDict(name="bucket", objects=[AttributeDict(name="object")]),
+        )
+        decoded = codec.loads_attrs(codec.dumps(entity))
+        assert decoded == entity
+        assert decoded.metadata.uuid == "1"
+        assert decoded.spec.objects[0].name == "object"
+
+    @pytest.mark.parametrize("codec", CODECS, ids=codec_id)
+    def test_matches_json_module(self, codec):
+        data = {"big": 2 ** 70, 1: "int key", "tuple": ("a", 1), "none": None}
+        assert json.loads(codec.dumps(data)) == json.loads(json.dumps(data))
+
+    @pytest.mark.parametrize("codec", CODECS, ids=codec_id)
+    def test_response(self, codec):
+        resp = codec.response({"errors": []}, status=400)
+        assert resp.status == 400
+        assert resp.content_type == "application/json"
+        assert json.loads(resp.body) == {"errors": []}
+
+
+    @pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+    def test_orjson_decodes_lazily_by_default(self):
+        assert OrjsonCodec().lazy_attrs and not JsonCodec().lazy_attrs
+        decoded = OrjsonCodec().loads_attrs('{"metadata": {"uuid": "1"}}')
+        assert type(dict.__getitem__(decoded, "metadata")) is dict
+        assert decoded.metadata.uuid == "1"
+
+
+class TestLazyAttributeDict:
+    def test_wraps_nested_objects_on_access(self):
+        decoded = JsonCodec(lazy_attrs=True).loads_attrs(
+            '{"results": [{"metadata": {"uuid": "1"}, "spec": {"tags": [{"name": "a"}]}}]}'
+        )
+        assert isinstance(decoded, AttributeDict)
+        assert isinstance(decoded, dict)
+        assert type(dict.__getitem__(decoded, "results")) is list
+        entity = decoded.results[0]
+        assert type(dict.__getitem__(entity, "spec")) is dict
+        assert entity.metadata.uuid == "1"
+        assert [tag.name for tag in entity.spec.tags] == ["a"]
+        assert entity.get("status", {}) == {}
+        assert [value.uuid for key, value in entity.items() if key == "metadata"] == ["1"]
+        assert decoded == {"results": [{"metadata": {"uuid": "1"}, "spec": {"tags": [{"name": "a"}]}}]}
+
+    def test_missing_attribute(self):
+        decoded = JsonCodec(lazy_attrs=True).loads_attrs('{"metadata": {}}')
+        assert not hasattr(decoded.metadata, "uuid")
+        with pytest.raises(KeyError):
+            decoded["spec"]
+
+    def test_attribute_assignment(self):
+        decoded = JsonCodec(lazy_attrs=True).loads_attrs('{"spec": {"x": 1}}')
+        decoded.spec.x += 5
+        assert json.loads(JsonCodec().dumps(decoded)) == {"spec": {"x": 6}}
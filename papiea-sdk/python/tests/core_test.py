@@ -0,0 +1,43 @@
+import json
+
+from papiea.codec import JsonCodec
+from papiea.core import AttributeDict, CompactEntity, CompactEntityReference, CompactMetadata
+
+METADATA = {
+    "uuid": "6c6b4bd4-4b6b-4b1e-8b4b-6c6b4bd44b6b",
+    "kind": "bucket",
+    "spec_version": 2,
+    "provider_prefix": "test_provider",
+    "provider_version": "0.1.0",
+    "created_at": "2020-12-01T10:00:00.000Z",
+    "extension": {"owner": "nutanix"},
+    "status_hash": "abc",
+}
+
+
+class TestCompactModels:
+    def test_metadata_round_trip(self):
+        metadata = CompactMetadata.from_wire(METADATA)
+        assert metadata.uuid == METADATA["uuid"]
+        assert metadata.kind == "bucket"
+        assert metadata.spec_version == 2
+        assert metadata["status_hash"] == "abc"
+        assert metadata.get("deleted_at") is None
+        assert metadata.to_wire() == METADATA
+        assert metadata == AttributeDict(METADATA)
+
+    def test_entity_from_wire(self):
+        entity = CompactEntity.from_wire({"metadata": METADATA, "spec": {"name": "b"}, "status": None})
+        assert isinstance(entity.metadata, CompactMetadata)
+        assert entity.metadata.uuid == METADATA["uuid"]
+        assert entity.to_wire() == {"metadata": METADATA, "spec": {"name": "b"}, "status": None}
+
+    def test_strings_are_shared(self):
+        first = CompactMetadata.from_wire(json.loads(json.dumps(METADATA)))
+        second = CompactMetadata.from_wire(json.loads(json.dumps(METADATA)))
+        assert first.kind is second.kind
+        assert first.provider_prefix is second.provider_prefix
+
+    def test_codec_encodes_compact_records(self):
+        ref = CompactEntityReference(uuid="1", kind="bucket")
+        assert json.loads(JsonCodec().dumps([("read", ref)])) == [["read", {"uuid": "1", "kind": "bucket"}]]
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import time
+
+import opentracing
+import pytest
+from aiohttp import ClientSession
+from multidict import CIMultiDict
+
+from papiea.client import EntityCRUD
+from papiea.core import AttributeDict, ProcedureDescription, Spec
+from papiea.executors import ExecutorPolicy, HandlerExecutor, SerializedInvocations
+from papiea.python_sdk import ProviderSdk, ProviderServerManager
+from papiea.python_sdk_context import CtxSnapshot
+from papiea.python_sdk_exceptions import InvocationError, ProcedureInvocationException
+from papiea.transport import Transport
+from tests.local_engine import LocalEngine
+
+logger = logging.getLogger(__name__)
+
+ENGINE_HOST = "127.0.0.1"
+ENGINE_PORT = 9016
+PROVIDER_PORT = 9017
+ADMIN_KEY = "executor_admin_key"
+
+
+class FakeCtx(CtxSnapshot):
+    def __init__(self):
+        super().__init__("http://engine/services", "http://engine/provider", "provider", "0.1.0",
+                         CIMultiDict(Authorization="Bearer token"))
+        self.snapshots = 0
+
+    def snapshot(self):
+        self.snapshots += 1
+        return CtxSnapshot(self.base_url, self.provider_url, self.provider_prefix, self.provider_version,
+                           CIMultiDict(self.headers))
+
+
+def blocking_handler(ctx, input):
+    time.sleep(input)
+    return ctx.get_invoking_token()
+
+
+def process_handler(ctx, input):
+    return {"pid": os.getpid(), "token": ctx.get_invoking_token(), "snapshot": type(ctx).__name__}
+
+
+def failing_handler(ctx, input):
+    raise InvocationError(422, "Cannot process", [{"input": input}])
+
+
+def sum_handler(ctx, input):
+    return sum(input)
+
+
+class TestHandlerExecutor:
+    @pytest.mark.asyncio
+    async def test_inline_runs_plain_and_coroutine_functions(self):
+        executor = HandlerExecutor()
+
+        async def async_handler(ctx, input):
+            return input + 1
+
+        assert await executor.run(async_handler, FakeCtx(), 1) == 2
+        assert await executor.run(sum_handler, FakeCtx(), [1, 2]) == 3
+        assert executor.metrics()["completed"] == 2
+
+    @pytest.mark.asyncio
+    async def test_thread_pool_does_not_block_event_loop(self):
+        executor = HandlerExecutor(ExecutorPolicy.Thread, max_workers=2)
+        calls = [asyncio.ensure_future(executor.run(blocking_handler, FakeCtx(), 0.1)) for _ in range(2)]
+        ticks = 0
+        while not all(call.done() for call in calls):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert ticks >= 5
+        assert [call.result() for call in calls] == ["token", "token"]
+        assert executor.metrics()["pending"] == 0
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_process_pool_gets_ctx_snapshot(self):
+        executor = HandlerExecutor(ExecutorPolicy.Process, max_workers=1)
+        ctx = FakeCtx()
+        result = await executor.run(process_handler, ctx, None)
+        assert result == {"pid": result["pid"], "token": "token", "snapshot": "CtxSnapshot"}
+        assert result["pid"] != os.getpid()
+        assert ctx.snapshots == 1
+        with pytest.raises(InvocationError) as excinfo:
+            await executor.run(failing_handler, ctx, 1)
+        assert excinfo.value.status_code == 422
+        assert excinfo.value.errors == [{"input": 1}]
+        assert executor.metrics()["failed"] == 1
+        executor.shutdown()
+
+    def test_rejects_coroutine_functions_in_pools(self):
+        async def async_handler(ctx, input):
+            return input
+
+        with pytest.raises(Exception):
+            HandlerExecutor(ExecutorPolicy.Thread).check_handler(async_handler)
+        HandlerExecutor(ExecutorPolicy.Thread).check_handler(sum_handler)
+
+
+class TestProviderHandlerExecutors:
+    @pytest.mark.asyncio
+    async def test_kind_procedures_with_executor_policies(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            location_kind = {"Location": {"type": "object", "x-papiea-entity": "spec-only",
+                                          "properties": {"x": {"type": "number"}}}}
+            sdk = ProviderSdk.create_provider(engine.url, ADMIN_KEY, ENGINE_HOST, PROVIDER_PORT, logger=logger,
+                                              tracer=opentracing.Tracer(), transport=Transport())
+            sdk.version("0.1.0")
+            sdk.prefix("executor_provider")
+            location = sdk.new_kind(location_kind)
+            location.kind_procedure("sum", ProcedureDescription(), sum_handler, ExecutorPolicy.Thread)
+            location.kind_procedure("describe", ProcedureDescription(), process_handler, ExecutorPolicy.Process)
+            location.kind_procedure("fail", ProcedureDescription(), failing_handler, ExecutorPolicy.Process)
+            await sdk.register()
+            try:
+                async with EntityCRUD(engine.url, "executor_provider", "0.1.0", "Location", ADMIN_KEY, logger=logger,
+                                      tracer=opentracing.Tracer(), transport=Transport()) as client:
+                    await client.create(AttributeDict(spec=Spec(x=1)))
+                    assert await client.invoke_kind_procedure("sum", [1, 2, 3]) == 6
+                    described = await client.invoke_kind_procedure("describe", None)
+                    assert described.token == ADMIN_KEY and described.pid != os.getpid()
+                    with pytest.raises(ProcedureInvocationException):
+                        await client.invoke_kind_procedure("fail", None)
+                metrics = sdk.handler_executor_metrics()
+                assert metrics[ExecutorPolicy.Thread]["completed"] == 1
+                assert metrics[ExecutorPolicy.Process]["completed"] == 1
+                assert metrics[ExecutorPolicy.Process]["failed"] == 1
+            finally:
+                await sdk.server.close()
+                await sdk.__aexit__(None, None, None)
+
+    @pytest.mark.asyncio
+    async def test_process_pool_handlers_in_server_workers(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            server = ProviderServerManager(ENGINE_HOST, PROVIDER_PORT, workers=2)
+            sdk = ProviderSdk(engine.url, ADMIN_KEY, server, logger=logger, tracer=opentracing.Tracer(),
+                              transport=Transport())
+            sdk.version("0.1.0")
+            sdk.prefix("executor_provider")
+            location = sdk.new_kind({"Location": {"type": "object", "x-papiea-entity": "spec-only",
+                                                  "properties": {"x": {"type": "number"}}}})
+            location.kind_procedure("describe", ProcedureDescription(), process_handler, ExecutorPolicy.Process)
+            await sdk.register()
+            try:
+                async with EntityCRUD(engine.url, "executor_provider", "0.1.0", "Location", ADMIN_KEY, logger=logger,
+                                      tracer=opentracing.Tracer(), transport=Transport()) as client:
+                    for _ in range(100):
+                        try:
+                            described = await client.invoke_kind_procedure("describe", None)
+                            break
+                        except ProcedureInvocationException:
+                            # The workers may not be listening yet
+                            await asyncio.sleep(0.02)
+                    assert described.token == ADMIN_KEY
+                    assert described.pid != os.getpid() and described.pid not in server.worker_pids
+            finally:
+                await server.close()
+                await sdk.__aexit__(None, None, None)
+
+
+class TestSerializedInvocations:
+    @pytest.mark.asyncio
+    async def test_coalesces_waiting_invocations_to_latest_version(self):
+        serialized = SerializedInvocations()
+        release = asyncio.Event()
+        runs = []
+
+        def invocation(version):
+            async def call():
+                runs.append(version)
+                await release.wait()
+                return version
+            return call
+
+        first = asyncio.ensure_future(serialized.run("uuid", 1, invocation(1)))
+        await asyncio.sleep(0)
+        waiting = [asyncio.ensure_future(serialized.run("uuid", v, invocation(v))) for v in (2, 4, 3)]
+        other = asyncio.ensure_future(serialized.run("other", 1, invocation(10)))
+        await asyncio.sleep(0.01)
+        assert runs == [1, 10]
+        release.set()
+        assert await first == 1
+        assert await asyncio.gather(*waiting) == [4, 4, 4]
+        assert await other == 10
+        assert runs == [1, 10, 4]
+        assert serialized.coalesced == 2
+        assert serialized.active == 0
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_coalesced_callers_and_cancelled_callers_do_not_cancel_runs(self):
+        serialized = SerializedInvocations()
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "done"
+
+        async def failing():
+            raise Exception("Reconcile failed")
+
+        first = asyncio.ensure_future(serialized.run("uuid", 1, slow))
+        await asyncio.sleep(0)
+        waiting = [asyncio.ensure_future(serialized.run("uuid", 2, failing)) for _ in range(2)]
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        assert [str(e) for e in results] == ["Reconcile failed", "Reconcile failed"]
+        assert serialized.runs == 2
+
+
+class TestSerializedIntentfulHandler:
+    @pytest.mark.asyncio
+    async def test_on_handler_runs_once_per_entity_at_a_time(self):
+        location_kind = {"Location": {"type": "object", "x-papiea-entity": "differ",
+                                      "properties": {"x": {"type": "number"}}}}
+        sdk = ProviderSdk.create_provider(f"http://{ENGINE_HOST}:{ENGINE_PORT}", ADMIN_KEY, ENGINE_HOST,
+                                          PROVIDER_PORT, logger=logger, tracer=opentracing.Tracer(),
+                                          transport=Transport())
+        sdk.version("0.1.0")
+        sdk.prefix("executor_provider")
+        calls = []
+
+        async def reconcile(ctx, entity, input):
+            calls.append(entity.metadata.spec_version)
+            await asyncio.sleep(0.05)
+            return {"delay_secs": entity.metadata.spec_version}
+
+        sdk.new_kind(location_kind).on("x", reconcile, serialize_per_entity=True)
+        await sdk.server.start_server()
+        try:
+            async with ClientSession() as session:
+                async def invoke(spec_version):
+                    body = {"metadata": {"uuid": "uuid", "kind": "Location", "spec_version": spec_version},
+                            "spec": {"x": 1}, "status": {"x": 0}, "input": []}
+                    async with session.post(f"{sdk.server.callback_url()}/Location/x", json=body) as resp:
+                        return (await resp.json())["delay_secs"]
+
+                first = asyncio.ensure_future(invoke(1))
+                await asyncio.sleep(0.02)
+                assert await asyncio.gather(first, invoke(2), invoke(3)) == [1, 3, 3]
+            assert calls == [1, 3]
+        finally:
+            await sdk.server.close()
+            await sdk.__aexit__(None, None, None)
@@ -0,0 +1,645 @@
+import argparse
+import asyncio
+import copy
+import datetime
+import logging
+import uuid as uuid_lib
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+from papiea.codec import JsonCodec, get_default_codec
+from papiea.core import IntentfulBehaviour, IntentfulStatus, PapieaError
+
+DEFAULT_PAGE_SIZE = 30
+
+Authorizer = Callable[[Optional[str], str, Any], bool]
+
+ERROR_STATUS = {
+    PapieaError.Validation.value: 400,
+    PapieaError.BadRequest.value: 400,
+    PapieaError.EntityNotFound.value: 404,
+    PapieaError.Unauthorized.value: 401,
+    PapieaError.PermissionDenied.value: 403,
+    PapieaError.ConflictingEntity.value: 409,
+    PapieaError.ServerError.value: 500,
+}
+
+
+class LocalEngineError(Exception):
+    def __init__(self, error_type: str, message: str, status: Optional[int] = None, errors: Optional[List[Any]] = None):
+        super().__init__(message)
+        self.error_type = error_type
+        self.message = message
+        self.status = status if status is not None else ERROR_STATUS.get(error_type, 500)
+        self.errors = errors if errors is not None else [{"message": message}]
+        self.retry_after: Optional[float] = None
+
+    def to_response(self) -> dict:
+        return {
+            "error": {
+                "code": self.status,
+                "errors": self.errors,
+                "message": self.message,
+                "type": self.error_type,
+            }
+        }
+
+
+def now() -> str:
+    return datetime.datetime.utcnow().isoformat() + "Z"
+
+
+def get_path(obj: Any, path: List[str]) -> Any:
+    for key in path:
+        if not isinstance(obj, dict) or key not in obj:
+            return None
+        obj = obj[key]
+    return obj
+
+
+def apply_partial_status(status: dict, partial: dict) -> dict:
+    """
+    Applies a partial status the way the engine's PATCH update_status does:
+    objects are merged key by key, arrays and scalars are replaced and
+    null removes the field.
+    """
+    result = dict(status)
+    for key, value in partial.items():
+        if value is None:
+            result.pop(key, None)
+        elif isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = apply_partial_status(result[key], value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+def matches(document: Any, query: Any) -> bool:
+    if isinstance(query, dict) and isinstance(document, dict):
+        return all(matches(document.get(key), value) for key, value in query.items())
+    return document == query
+
+
+def sort_key(entity: dict, field: str) -> Tuple[bool, Any]:
+    value = get_path(entity, field.split("."))
+    return value is None, value
+
+
+def signature_path(signature: str) -> List[str]:
+    # The stand-in differ only understands plain field paths, so list and
+    # map selectors of the SFS language ('[a]', '{b}') are reduced to them
+    cleaned = signature.translate(str.maketrans("", "", "[]{}() "))
+    return [key for key in cleaned.split(".") if key]
+
+
+class LocalEngine(object):
+    """
+    In-process stand-in for the Papiea engine, backed by in-memory stores.
+
+    It serves the routes used by the SDK (provider registration and
+    update_status, s2s keys, entity CRUD and filter, procedures, permission
+    checks and intent watchers) with the request and response shapes of
+    the real engine, and calls provider callbacks the same way: constructors,
+    destructors, procedures and intentful handlers, the latter with a
+    simplified differ. Every caller is authenticated, and every permission
+    check passes unless an `authorizer` is given.
+    """
+
+    def __init__(
+            self,
+            host: str = "127.0.0.1",
+            port: int = 3000,
+            *,
+            authorizer: Optional[Authorizer] = None,
+            handler_retry_secs: float = 0.05,
+            max_handler_attempts: int = 20,
+            logger: logging.Logger = logging.getLogger(__name__),
+            codec: Optional[JsonCodec] = None
+    ):
+        self.host = host
+        self.port = port
+        self.authorizer = authorizer
+        self.handler_retry_secs = handler_retry_secs
+        self.max_handler_attempts = max_handler_attempts
+        self.logger = logger
+        self.codec = codec if codec is not None else get_default_codec()
+        self.providers: Dict[Tuple[str, str], Any] = {}
+        self.entities: Dict[Tuple[str, str, str], Dict[str, dict]] = {}
+        self.watchers: Dict[str, dict] = {}
+        self.s2skeys: Dict[str, dict] = {}
+        self.request_counts: Counter = Counter()
+        self.app = self._build_app()
+        self._runner: Optional[web.AppRunner] = None
+        self._session: Optional[ClientSession] = None
+        self._tasks = set()
+
+    async def __aenter__(self) -> "LocalEngine":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._session = ClientSession(timeout=ClientTimeout(total=60))
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def add_s2skey(self, key: str, user_info: Optional[dict] = None, owner: str = "admin",
+                   provider_prefix: Optional[str] = None) -> dict:
+        s2skey = {
+            "uuid": str(uuid_lib.uuid4()),
+            "key": key,
+            "name": None,
+            "owner": owner,
+            "provider_prefix": provider_prefix,
+            "user_info": dict(user_info or {"owner": owner}),
+            "created_at": now(),
+            "deleted_at": None,
+        }
+        self.s2skeys[key] = s2skey
+        return s2skey
+
+    def _build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._error_middleware], client_max_size=64 * 1024 ** 2)
+        entity = "/services/{prefix}/{version}/{kind}"
+        # Routes are matched in order, the fixed paths must come before the
+        # ones where the same segment is a kind or an entity uuid
+        app.add_routes([
+            web.post("/provider{slash:/*}", self.register_provider),
+            web.patch("/provider/{prefix}/{version}/update_status", self.update_status),
+            web.post("/provider/{prefix}/{version}/update_status", self.replace_status),
+            web.get("/provider/{prefix}/{version}/auth/user_info", self.user_info),
+            web.get("/provider/{prefix}/{version}/s2skey", self.list_keys),
+            web.post("/provider/{prefix}/{version}/s2skey", self.create_key),
+            web.put("/provider/{prefix}/{version}/s2skey", self.inactivate_key),
+            web.get("/services/intent_watcher{slash:/?}", self.list_watchers),
+            web.post("/services/intent_watcher/filter", self.filter_watchers),
+            web.get("/services/intent_watcher/{id}", self.get_watcher),
+            web.post("/services/{prefix}/{version}/check_permission", self.check_permission),
+            web.post("/services/{prefix}/{version}/procedure/{name}", self.provider_procedure),
+            web.get(entity + "{slash:/?}", self.list_entities),
+            web.post(entity + "{slash:/?}", self.create_entity),
+            web.post(entity + "/filter", self.filter_entities),
+            web.post(entity + "/procedure/{name}", self.kind_procedure),
+            web.get(entity + "/{uuid}", self.get_entity),
+            web.put(entity + "/{uuid}", self.update_entity),
+            web.delete(entity + "/{uuid}", self.delete_entity),
+            web.post(entity + "/{uuid}/procedure/{name}", self.entity_procedure),
+        ])
+        return app
+
+    @web.middleware
+    async def _error_middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        self.request_counts[request.match_info.route.handler.__name__] += 1
+        try:
+            return await handler(request)
+        except LocalEngineError as e:
+            return self.codec.response(e.to_response(), status=e.status)
+        except web.HTTPException:
+            raise
+        except Exception as e:
+            self.logger.exception("Local engine request failed")
+            error = LocalEngineError(PapieaError.ServerError.value, str(e))
+            return self.codec.response(error.to_response(), status=error.status)
+
+    async def _body(self, request: web.Request) -> Any:
+        raw = await request.read()
+        if not raw:
+            return {}
+        try:
+            return self.codec.loads(raw)
+        except ValueError as e:
+            raise LocalEngineError(PapieaError.BadRequest.value, f"Malformed request body: {e}")
+
+    def _kind(self, prefix: str, version: str, kind_name: str) -> dict:
+        provider = self.providers.get((prefix, version))
+        if provider is None:
+            raise LocalEngineError(PapieaError.EntityNotFound.value,
+                                   f"Provider with prefix {prefix} and version {version} not found")
+        for kind in provider["kinds"]:
+            if kind["name"] == kind_name:
+                return kind
+        raise LocalEngineError(PapieaError.BadRequest.value,
+                               f"Kind {kind_name} not found on provider {prefix} version {version}")
+
+    def _store(self, prefix: str, version: str, kind_name: str) -> Dict[str, dict]:
+        self._kind(prefix, version, kind_name)
+        return self.entities.setdefault((prefix, version, kind_name), {})
+
+    def _entity(self, request: web.Request) -> dict:
+        info = request.match_info
+        entity = self._store(info["prefix"], info["version"], info["kind"]).get(info["uuid"])
+        if entity is None:
+            raise LocalEngineError(PapieaError.EntityNotFound.value,
+                                   f"Entity {info['uuid']} of kind {info['kind']} not found")
+        return entity
+
+    @staticmethod
+    def _token(request: web.Request) -> Optional[str]:
+        parts = request.headers.get("Authorization", "").split(" ")
+        if len(parts) == 2 and parts[0] == "Bearer":
+            return parts[1]
+        return None
+
+    @staticmethod
+    def _forwarded_headers(request: web.Request) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if "Authorization" in request.headers:
+            headers["Authorization"] = request.headers["Authorization"]
+        return headers
+
+    async def _invoke(self, url: str, body: Any, headers: dict) -> Any:
+        async with self._session.post(url, data=self.codec.dumps(body), headers=headers) as resp:
+            raw = await resp.read()
+            status = resp.status
+            retry_after = resp.headers.get("Retry-After")
+        data = self.codec.loads(raw) if raw else None
+        if status >= 400:
+            data = data if isinstance(data, dict) else {}
+            error = LocalEngineError(
+                PapieaError.ProcedureInvocation.value,
+                str([data.get("message")]),
+                status=status,
+                errors=[{
+                    "message": data.get("message"),
+                    "errors": data.get("errors"),
+                    "stacktrace": data.get("stacktrace"),
+                }]
+            )
+            if retry_after is not None and retry_after.isdigit():
+                error.retry_after = int(retry_after)
+            raise error
+        return data
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Provider API
+
+    async def register_provider(self, request: web.Request) -> web.Response:
+        provider = await self._body(request)
+        for field in ("prefix", "version", "kinds"):
+            if field not in provider:
+                raise LocalEngineError(PapieaError.Validation.value, f"Provider is missing {field}")
+        self.providers[(provider["prefix"], provider["version"])] = provider
+        return self.codec.response("OK")
+
+    async def _apply_status(self, request: web.Request, replace: bool) -> web.Response:
+        body = await self._body(request)
+        entity_ref = body.get("entity_ref") or {}
+        status = body.get("status")
+        if "uuid" not in entity_ref or "kind" not in entity_ref:
+            raise LocalEngineError(PapieaError.BadRequest.value, "Entity reference is missing uuid or kind")
+        if not isinstance(status, dict):
+            raise LocalEngineError(PapieaError.Validation.value, "Status should be an object")
+        store = self._store(request.match_info["prefix"], request.match_info["version"], entity_ref["kind"])
+        entity = store.get(entity_ref["uuid"])
+        if entity is None:
+            raise LocalEngineError(PapieaError.EntityNotFound.value,
+                                   f"Entity {entity_ref['uuid']} of kind {entity_ref['kind']} not found")
+        if replace:
+            entity["status"] = copy.deepcopy(status)
+        else:
+            entity["status"] = apply_partial_status(entity["status"], status)
+        return self.codec.response("OK")
+
+    async def update_status(self, request: web.Request) -> web.Response:
+        return await self._apply_status(request, replace=False)
+
+    async def replace_status(self, request: web.Request) -> web.Response:
+        return await self._apply_status(request, replace=True)
+
+    async def user_info(self, request: web.Request) -> web.Response:
+        token = self._token(request)
+        s2skey = self.s2skeys.get(token)
+        if s2skey is None or s2skey["deleted_at"] is not None:
+            raise LocalEngineError(PapieaError.Unauthorized.value, "Unauthorized")
+        return self.codec.response(s2skey["user_info"])
+
+    async def list_keys(self, request: web.Request) -> web.Response:
+        prefix = request.match_info["prefix"]
+        return self.codec.response([
+            s2skey for s2skey in self.s2skeys.values()
+            if s2skey["provider_prefix"] == prefix and s2skey["deleted_at"] is None
+        ])
+
+    async def create_key(self, request: web.Request) -> web.Response:
+        body = await self._body(request)
+        if "active" in body:
+            # SecurityApi.deactivate_key posts to this route
+            if not body["active"]:
+                self._inactivate(body.get("key"), body.get("uuid"))
+            return self.codec.response("OK")
+        key = body.get("key") or uuid_lib.uuid4().hex
+        s2skey = self.add_s2skey(key, body.get("user_info"), body.get("owner") or "admin",
+                                 request.match_info["prefix"])
+        s2skey["name"] = body.get("name")
+        return self.codec.response(s2skey)
+
+    async def inactivate_key(self, request: web.Request) -> web.Response:
+        body = await self._body(request)
+        if not body.get("active"):
+            self._inactivate(body.get("key"), body.get("uuid"))
+        return self.codec.response("OK")
+
+    def _inactivate(self, key: Optional[str], key_uuid: Optional[str]) -> None:
+        for s2skey in self.s2skeys.values():
+            if s2skey["key"] == key or s2skey["uuid"] == key_uuid:
+                s2skey["deleted_at"] = now()
+
+    # Entity API
+
+    async def list_entities(self, request: web.Request) -> web.Response:
+        filter_obj = {}
+        for field in ("spec", "status", "metadata"):
+            if field in request.query:
+                filter_obj[field] = self.codec.loads(request.query[field])
+        return self._filter_response(request, filter_obj)
+
+    async def filter_entities(self, request: web.Request) -> web.Response:
+        return self._filter_response(request, await self._body(request))
+
+    def _filter_response(self, request: web.Request, filter_obj: dict) -> web.Response:
+        info = request.match_info
+        store = self._store(info["prefix"], info["version"], info["kind"])
+        query = request.query
+        results = [
+            entity for entity in store.values()
+            if matches(entity["metadata"], filter_obj.get("metadata", {}))
+            and matches(entity["spec"], filter_obj.get("spec", {}))
+            and matches(entity["status"], filter_obj.get("status", {}))
+        ]
+        if query.get("sort"):
+            for order in reversed(query["sort"].split(",")):
+                field, _, direction = order.partition(":")
+                results.sort(key=lambda entity: sort_key(entity, field.strip()), reverse=direction == "desc")
+        offset = int(query.get("offset") or 0)
+        limit = int(query.get("limit") or DEFAULT_PAGE_SIZE)
+        return self.codec.response({
+            "results": results[offset:offset + limit],
+            "entity_count": len(results),
+        })
+
+    async def get_entity(self, request: web.Request) -> web.Response:
+        return self.codec.response(self._entity(request))
+
+    async def create_entity(self, request: web.Request) -> web.Response:
+        info = request.match_info
+        prefix, version, kind_name = info["prefix"], info["version"], info["kind"]
+        kind = self._kind(prefix, version, kind_name)
+        store = self._store(prefix, version, kind_name)
+        body = await self._body(request)
+        constructor = kind.get("kind_procedures", {}).get(f"__{kind_name}_create")
+        if constructor is not None:
+            created = await self._invoke(constructor["procedure_callback"], {"input": body},
+                                         self._forwarded_headers(request))
+            spec, status = created.get("spec", {}), created.get("status", {})
+            metadata_in = created.get("metadata") or {}
+        else:
+            spec = body.get("spec")
+            if spec is None:
+                raise LocalEngineError(PapieaError.Validation.value, "Spec is required to create an entity")
+            status = copy.deepcopy(spec)
+            metadata_in = body.get("metadata") or {}
+        entity_uuid = metadata_in.get("uuid") or str(uuid_lib.uuid4())
+        if entity_uuid in store:
+            raise LocalEngineError(PapieaError.ConflictingEntity.value,
+                                   f"Entity with uuid {entity_uuid} already exists")
+        metadata = {
+            "uuid": entity_uuid,
+            "kind": kind_name,
+            "spec_version": 1,
+            "created_at": now(),
+            "deleted_at": None,
+            "provider_prefix": prefix,
+            "provider_version": version,
+            "extension": metadata_in.get("extension") or {},
+        }
+        store[entity_uuid] = {"metadata": metadata, "spec": spec, "status": status}
+        return self.codec.response({
+            "intent_watcher": None,
+            "metadata": metadata,
+            "spec": spec,
+            "status": status,
+        })
+
+    async def update_entity(self, request: web.Request) -> web.Response:
+        entity = self._entity(request)
+        kind = self._kind(request.match_info["prefix"], request.match_info["version"], request.match_info["kind"])
+        body = await self._body(request)
+        spec_version = (body.get("metadata") or {}).get("spec_version")
+        if spec_version != entity["metadata"]["spec_version"]:
+            raise LocalEngineError(
+                PapieaError.ConflictingEntity.value,
+                f"Spec with version {spec_version} already exists. Entity spec version is "
+                f"{entity['metadata']['spec_version']}"
+            )
+        entity["spec"] = body.get("spec")
+        entity["metadata"]["spec_version"] += 1
+        if kind.get("intentful_behaviour") != IntentfulBehaviour.Differ:
+            entity["status"] = apply_partial_status(entity["status"], entity["spec"])
+            return self.codec.response({"watcher": None})
+        watcher = self._new_watcher(entity)
+        self._spawn(self._resolve(kind, entity["metadata"], watcher, self._forwarded_headers(request)))
+        return self.codec.response({"watcher": watcher})
+
+    async def delete_entity(self, request: web.Request) -> web.Response:
+        info = request.match_info
+        entity = self._entity(request)
+        kind = self._kind(info["prefix"], info["version"], info["kind"])
+        destructor = kind.get("kind_procedures", {}).get(f"__{info['kind']}_delete")
+        if destructor is not None:
+            await self._invoke(destructor["procedure_callback"], {"input": entity},
+                               self._forwarded_headers(request))
+        self._store(info["prefix"], info["version"], info["kind"]).pop(info["uuid"], None)
+        return self.codec.response("OK")
+
+    async def check_permission(self, request: web.Request) -> web.Response:
+        body = await self._body(request)
+        checks = body if isinstance(body, list) and body and isinstance(body[0], list) else [body]
+        token = self._token(request)
+        for action, entity_ref in checks:
+            if self.authorizer is not None and not self.authorizer(token, action, entity_ref):
+                raise LocalEngineError(PapieaError.PermissionDenied.value,
+                                       f"Permission denied for action {action}")
+        return self.codec.response({"success": "Ok"})
+
+    # Procedures
+
+    async def entity_procedure(self, request: web.Request) -> web.Response:
+        info = request.match_info
+        entity = self._entity(request)
+        kind = self._kind(info["prefix"], info["version"], info["kind"])
+        procedure = self._procedure(kind.get("entity_procedures", {}), info["name"])
+        body = await self._body(request)
+        result = await self._invoke(
+            procedure["procedure_callback"],
+            {"metadata": entity["metadata"], "spec": entity["spec"], "status": entity["status"],
+             "input": body.get("input")},
+            self._forwarded_headers(request)
+        )
+        return self.codec.response(result)
+
+    async def kind_procedure(self, request: web.Request) -> web.Response:
+        info = request.match_info
+        kind = self._kind(info["prefix"], info["version"], info["kind"])
+        procedure = self._procedure(kind.get("kind_procedures", {}), info["name"])
+        body = await self._body(request)
+        result = await self._invoke(procedure["procedure_callback"], {"input": body.get("input")},
+                                    self._forwarded_headers(request))
+        return self.codec.response(result)
+
+    async def provider_procedure(self, request: web.Request) -> web.Response:
+        info = request.match_info
+        provider = self.providers.get((info["prefix"], info["version"]))
+        if provider is None:
+            raise LocalEngineError(PapieaError.EntityNotFound.value,
+                                   f"Provider with prefix {info['prefix']} and version {info['version']} not found")
+        procedure = self._procedure(provider.get("procedures", {}), info["name"])
+        body = await self._body(request)
+        result = await self._invoke(procedure["procedure_callback"], {"input": body.get("input")},
+                                    self._forwarded_headers(request))
+        return self.codec.response(result)
+
+    @staticmethod
+    def _procedure(procedures: dict, name: str) -> dict:
+        procedure = procedures.get(name)
+        if procedure is None:
+            raise LocalEngineError(PapieaError.BadRequest.value, f"Procedure {name} not found")
+        return procedure
+
+    # Intent watchers
+
+    def _new_watcher(self, entity: dict) -> dict:
+        metadata = entity["metadata"]
+        watcher = {
+            "uuid": str(uuid_lib.uuid4()),
+            "entity_ref": {
+                "uuid": metadata["uuid"],
+                "kind": metadata["kind"],
+                "provider_prefix": metadata["provider_prefix"],
+                "provider_version": metadata["provider_version"],
+            },
+            "spec_version": metadata["spec_version"],
+            "status": IntentfulStatus.Active,
+            "created_at": now(),
+        }
+        self.watchers[watcher["uuid"]] = watcher
+        return watcher
+
+    def _diffs(self, kind: dict, entity: dict) -> List[Tuple[dict, dict]]:
+        diffs = []
+        for signature in kind.get("intentful_signatures", []):
+            path = signature_path(signature["signature"])
+            spec_value = get_path(entity["spec"], path)
+            status_value = get_path(entity["status"], path)
+            if spec_value != status_value:
+                diffs.append((signature, {
+                    "keys": {},
+                    "key": path[-1] if path else "",
+                    "path": path,
+                    "spec": [spec_value],
+                    "status": [status_value],
+                }))
+        return diffs
+
+    async def _resolve(self, kind: dict, metadata: dict, watcher: dict, headers: dict) -> None:
+        store = self._store(metadata["provider_prefix"], metadata["provider_version"], metadata["kind"])
+        for _ in range(self.max_handler_attempts):
+            entity = store.get(metadata["uuid"])
+            if entity is None or entity["metadata"]["spec_version"] != watcher["spec_version"]:
+                watcher["status"] = IntentfulStatus.Outdated
+                return
+            diffs = self._diffs(kind, entity)
+            if not diffs:
+                watcher["status"] = IntentfulStatus.Completed_Successfully
+                return
+            delay = self.handler_retry_secs
+            for signature, diff_fields in diffs:
+                try:
+                    result = await self._invoke(
+                        signature["procedure_callback"],
+                        {"metadata": entity["metadata"], "spec": entity["spec"],
+                         "status": entity["status"], "input": [diff_fields]},
+                        headers
+                    )
+                    if isinstance(result, dict) and result.get("delay_secs"):
+                        delay = max(delay, result["delay_secs"])
+                except LocalEngineError as e:
+                    # A provider shedding load asks to be retried later
+                    if e.retry_after is not None:
+                        delay = max(delay, e.retry_after)
+                    self.logger.debug(f"Intentful handler {signature['name']} failed: {e}")
+            await asyncio.sleep(delay)
+        watcher["status"] = IntentfulStatus.Failed
+
+    async def get_watcher(self, request: web.Request) -> web.Response:
+        watcher = self.watchers.get(request.match_info["id"])
+        if watcher is None:
+            raise LocalEngineError(PapieaError.EntityNotFound.value,
+                                   f"Intent watcher {request.match_info['id']} not found")
+        return self.codec.response(watcher)
+
+    async def list_watchers(self, request: web.Request) -> web.Response:
+        watchers = list(self.watchers.values())
+        return self.codec.response({"results": watchers, "entity_count": len(watchers)})
+
+    async def filter_watchers(self, request: web.Request) -> web.Response:
+        filter_obj = await self._body(request)
+        unknown = set(filter_obj) - {"entity_ref", "created_at", "status"}
+        if unknown:
+            raise LocalEngineError(PapieaError.BadRequest.value, f"Unknown filter fields: {sorted(unknown)}")
+        results = [watcher for watcher in self.watchers.values() if matches(watcher, filter_obj)]
+        offset = int(request.query.get("offset") or 0)
+        limit = int(request.query.get("limit") or DEFAULT_PAGE_SIZE)
+        return self.codec.response({
+            "results": results[offset:offset + limit],
+            "entity_count": len(results),
+        })
+
+
+async def serve(host: str, port: int, s2skey: Optional[str]) -> None:
+    engine = LocalEngine(host, port)
+    if s2skey is not None:
+        engine.add_s2skey(s2skey, {"is_admin": True})
+    await engine.start()
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await engine.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the in-memory Papiea engine stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--s2skey", default=None, help="Admin s2s key accepted by the auth routes")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.s2skey))
+
+
+if __name__ == "__main__":
+    main()
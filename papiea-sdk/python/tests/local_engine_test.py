@@ -0,0 +1,136 @@
+import copy
+import logging
+
+import opentracing
+import pytest
+from yaml import Loader as YamlLoader
+from yaml import load as load_yaml
+
+from papiea.client import EntityCRUD
+from papiea.core import AttributeDict, IntentfulStatus, ProcedureDescription, Spec
+from papiea.python_sdk import ProviderSdk
+from papiea.python_sdk_exceptions import ConflictingEntityException, EntityNotFoundException
+from papiea.transport import Transport
+from tests.local_engine import LocalEngine, apply_partial_status
+
+logger = logging.getLogger(__name__)
+
+ENGINE_HOST = "127.0.0.1"
+ENGINE_PORT = 9012
+PROVIDER_PORT = 9013
+PROVIDER_PREFIX = "local_engine_provider"
+PROVIDER_VERSION = "0.1.0"
+ADMIN_KEY = "local_admin_key"
+
+
+def load_yaml_from_file(filename):
+    with open(filename) as f:
+        return load_yaml(f, Loader=YamlLoader)
+
+
+async def start_provider(engine: LocalEngine, intentful: bool = False) -> ProviderSdk:
+    location_yaml = load_yaml_from_file("./test_data/location_kind_test_data.yml")
+    if intentful:
+        location_yaml = copy.deepcopy(location_yaml)
+        location_yaml["Location"]["x-papiea-entity"] = "differ"
+    sdk = ProviderSdk.create_provider(engine.url, ADMIN_KEY, ENGINE_HOST, PROVIDER_PORT, logger=logger,
+                                      tracer=opentracing.Tracer(), transport=Transport())
+    sdk.version(PROVIDER_VERSION)
+    sdk.prefix(PROVIDER_PREFIX)
+    location = sdk.new_kind(location_yaml)
+
+    async def move_x(ctx, entity, input):
+        entity.spec.x += input
+        async with ctx.entity_client_for_user(entity.metadata) as entity_client:
+            await entity_client.update(entity.metadata, entity.spec)
+        return entity.spec.x
+
+    async def count(ctx, input):
+        return len(engine.entities[(PROVIDER_PREFIX, PROVIDER_VERSION, "Location")]) + input
+
+    async def sync_x(ctx, entity, input):
+        await ctx.update_status(entity.metadata, {"x": input[0]["spec"][0]})
+
+    location.entity_procedure("moveX", ProcedureDescription(), move_x)
+    location.kind_procedure("count", ProcedureDescription(), count)
+    if intentful:
+        location.on("x", sync_x)
+    await sdk.register()
+    return sdk
+
+
+async def stop_provider(sdk: ProviderSdk) -> None:
+    await sdk.server.close()
+    await sdk.__aexit__(None, None, None)
+
+
+def location_client(token: str = ADMIN_KEY) -> EntityCRUD:
+    return EntityCRUD(f"http://{ENGINE_HOST}:{ENGINE_PORT}", PROVIDER_PREFIX, PROVIDER_VERSION, "Location", token,
+                      logger=logger, tracer=opentracing.Tracer(), transport=Transport())
+
+
+class TestLocalEngine:
+    @pytest.mark.asyncio
+    async def test_crud_and_filter(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            sdk = await start_provider(engine)
+            try:
+                async with location_client() as client:
+                    created = [await client.create(AttributeDict(spec=Spec(x=i, y=i % 2))) for i in range(40)]
+                    entity = await client.get(created[0].metadata)
+                    assert entity.spec == {"x": 0, "y": 0}
+                    assert entity.status == entity.spec
+                    await client.update(entity.metadata, Spec(x=100, y=0))
+                    with pytest.raises(ConflictingEntityException):
+                        await client.update(entity.metadata, Spec(x=200, y=0))
+                    assert (await client.get(entity.metadata)).metadata.spec_version == 2
+
+                    assert len((await client.filter({"spec": {"y": 1}})).results) == 20
+                    iterator = await client.filter_iter({"spec": {"y": 0}})
+                    assert len([x async for x in iterator(7)]) == 20
+                    res = await client.api_instance.post("filter?sort=spec.x:desc&limit=3", {})
+                    assert [e.spec.x for e in res.results] == [100, 39, 38]
+                    assert res.entity_count == 40
+
+                    await client.delete(entity.metadata)
+                    with pytest.raises(EntityNotFoundException):
+                        await client.get(entity.metadata)
+            finally:
+                await stop_provider(sdk)
+
+    @pytest.mark.asyncio
+    async def test_procedures_call_provider(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            sdk = await start_provider(engine)
+            try:
+                async with location_client() as client:
+                    entity = await client.create(AttributeDict(spec=Spec(x=10, y=11)))
+                    assert await client.invoke_procedure("moveX", entity.metadata, 5) == 15
+                    assert (await client.get(entity.metadata)).spec.x == 15
+                    assert await client.invoke_kind_procedure("count", 1) == 2
+                assert engine.request_counts["entity_procedure"] == 1
+            finally:
+                await stop_provider(sdk)
+
+    @pytest.mark.asyncio
+    async def test_intentful_handler_resolves_watcher(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            sdk = await start_provider(engine, intentful=True)
+            try:
+                async with location_client() as client:
+                    entity = await client.create(AttributeDict(spec=Spec(x=1, y=1)))
+                    res = await client.update(entity.metadata, Spec(x=5, y=1))
+                    assert await sdk.intent_watcher.wait_for_watcher_status(
+                        res.watcher, IntentfulStatus.Completed_Successfully, 5, 0.05
+                    )
+                    assert (await client.get(entity.metadata)).status == {"x": 5, "y": 1}
+            finally:
+                await stop_provider(sdk)
+
+
+class TestApplyPartialStatus:
+    def test_merges_objects_replaces_arrays_and_unsets_nulls(self):
+        status = {"x": 1, "v": {"e": 1, "d": 2}, "tags": [1, 2], "gone": True}
+        partial = AttributeDict(v={"d": 3}, tags=[3], gone=None)
+        assert apply_partial_status(status, partial) == {"x": 1, "v": {"e": 1, "d": 3}, "tags": [3]}
+        assert status["v"] == {"e": 1, "d": 2}
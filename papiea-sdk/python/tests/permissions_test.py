@@ -0,0 +1,126 @@
+import asyncio
+import logging
+
+import opentracing
+import pytest
+from multidict import CIMultiDict
+
+from papiea.core import Action, AttributeDict
+from papiea.python_sdk import ProviderSdk
+from papiea.python_sdk_context import ProceduralCtx
+from papiea.transport import Transport
+from tests.local_engine import LocalEngine
+
+logger = logging.getLogger(__name__)
+
+ENGINE_HOST = "127.0.0.1"
+ENGINE_PORT = 9020
+ADMIN_KEY = "permission_admin_key"
+
+
+def ref(uuid):
+    return AttributeDict(uuid=uuid, kind="bucket")
+
+
+def authorize(token, action, entity_ref):
+    # alice may read everything and update her own buckets
+    if entity_ref["uuid"] == "broken":
+        raise Exception("Authorizer failed")
+    return token == "alice" and (action == Action.Read or entity_ref["uuid"].startswith("alice"))
+
+
+async def new_provider(engine, **kwargs) -> ProviderSdk:
+    sdk = ProviderSdk(engine.url, ADMIN_KEY, logger=logger, tracer=opentracing.Tracer(), transport=Transport(),
+                      **kwargs)
+    sdk.version("0.1.0")
+    sdk.prefix("permission_provider")
+    sdk.new_kind({"bucket": {"type": "object", "x-papiea-entity": "differ"}})
+    await sdk.register()
+    return sdk
+
+
+class TestPermissionChecker:
+    @pytest.mark.asyncio
+    async def test_answers_are_cached_per_token_action_and_entity(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT, authorizer=authorize) as engine:
+            sdk = await new_provider(engine, permission_cache_ttl_secs=5)
+            try:
+                ctx = ProceduralCtx(sdk, "permission_provider", "0.1.0", CIMultiDict(Authorization="Bearer alice"))
+                assert await ctx.check_permission([(Action.Update, ref("alice-1"))])
+                assert await ctx.check_permission([(Action.Update, ref("alice-1"))])
+                assert not await ctx.check_permission([(Action.Update, ref("bob-1"))])
+                assert not await ctx.check_permission([(Action.Update, ref("bob-1"))])
+                assert not await ctx.check_permission([(Action.Update, ref("alice-1"))], user_token="bob")
+                assert engine.request_counts["check_permission"] == 3
+                assert sdk.permission_checker.metrics()["hits"] == 2
+
+                sdk.permission_checker.invalidate(authorization="Bearer alice", entity_reference=ref("bob-1"))
+                assert await ctx.check_permission([(Action.Update, ref("alice-1"))])
+                assert not await ctx.check_permission([(Action.Update, ref("bob-1"))])
+                assert engine.request_counts["check_permission"] == 4
+                sdk.permission_checker.invalidate()
+                assert len(sdk.permission_checker) == 0
+            finally:
+                await sdk.__aexit__(None, None, None)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_checks_are_batched_per_token(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT, authorizer=authorize) as engine:
+            # Answers are not cached by default, checks are still batched
+            sdk = await new_provider(engine)
+            try:
+                checker = sdk.permission_checker
+                allowed = await asyncio.gather(
+                    *[checker.check("permission_provider", "0.1.0", "Bearer alice", [(Action.Read, ref(str(i)))])
+                      for i in range(10)],
+                    checker.check("permission_provider", "0.1.0", "Bearer alice", [(Action.Read, ref("0"))]),
+                    checker.check("permission_provider", "0.1.0", "Bearer bob", [(Action.Read, ref("0"))]),
+                )
+                assert allowed == [True] * 11 + [False]
+                assert engine.request_counts["check_permission"] == 2
+
+                # A denied batch is repeated check by check
+                allowed = await asyncio.gather(
+                    *[checker.check("permission_provider", "0.1.0", "Bearer alice", [(Action.Update, ref(uuid))])
+                      for uuid in ("alice-1", "bob-1", "alice-2")]
+                )
+                assert allowed == [True, False, True]
+                assert engine.request_counts["check_permission"] == 6
+                assert len(checker) == 0
+            finally:
+                await sdk.__aexit__(None, None, None)
+
+    @pytest.mark.asyncio
+    async def test_answers_expire_and_failures_are_not_cached(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT, authorizer=authorize) as engine:
+            sdk = await new_provider(engine, permission_cache_ttl_secs=0.05)
+            try:
+                ctx = ProceduralCtx(sdk, "permission_provider", "0.1.0", CIMultiDict(Authorization="Bearer alice"))
+                assert await ctx.check_permission([(Action.Read, ref("1"))])
+                await asyncio.sleep(0.1)
+                assert await ctx.check_permission([(Action.Read, ref("1"))])
+                assert engine.request_counts["check_permission"] == 2
+                assert not await ctx.check_permission([(Action.Read, ref("broken"))])
+                assert not await ctx.check_permission([(Action.Read, ref("broken"))])
+                assert engine.request_counts["check_permission"] == 4
+            finally:
+                await sdk.__aexit__(None, None, None)
+
+    @pytest.mark.asyncio
+    async def test_authorization_header_is_forwarded_as_is(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT, authorizer=authorize) as engine:
+            sdk = await new_provider(engine)
+            sent = []
+
+            async def post(prefix, data, headers={}, idempotent=False, operation=None):
+                sent.append(headers.get("Authorization"))
+                return AttributeDict(success="Ok")
+
+            try:
+                sdk.permission_checker.api.post = post
+                for authorization in ("Basic YWxpY2U6c2VjcmV0", "Bearer alice extra", "bearer alice"):
+                    ctx = ProceduralCtx(sdk, "permission_provider", "0.1.0", CIMultiDict(Authorization=authorization))
+                    assert await ctx.check_permission([(Action.Read, ref("1"))])
+                assert sent == ["Basic YWxpY2U6c2VjcmV0", "Bearer alice extra", "bearer alice"]
+            finally:
+                await sdk.__aexit__(None, None, None)
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import signal
+
+import pytest
+from aiohttp import ClientConnectionError, ClientSession, TCPConnector, web
+
+from papiea.python_sdk import ConcurrencyLimit, ProviderServerManager
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 9014
+
+
+class TestConcurrencyLimit:
+    @pytest.mark.asyncio
+    async def test_queues_in_order_and_sheds_when_full(self):
+        limit = ConcurrencyLimit(1, max_queue=2)
+        assert await limit.acquire()
+        order = []
+
+        async def queued(i):
+            assert await limit.acquire()
+            order.append(i)
+            limit.release()
+
+        waiters = [asyncio.ensure_future(queued(i)) for i in range(2)]
+        await asyncio.sleep(0)
+        assert limit.queue_depth == 2
+        assert not await limit.acquire()
+        limit.release()
+        await asyncio.gather(*waiters)
+        assert order == [0, 1]
+        assert limit.in_flight == 0
+        assert limit.metrics()["shed"] == 1
+        assert limit.metrics()["admitted"] == 3
+        assert limit.metrics()["max_queue_depth"] == 2
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        limit = ConcurrencyLimit(1, max_queue=1, queue_timeout_secs=0.01)
+        assert await limit.acquire()
+        assert not await limit.acquire()
+        assert limit.queue_depth == 0
+        assert limit.max_wait_secs >= 0.01
+        limit.release()
+        assert limit.in_flight == 0
+
+
+class TestProviderServerManagerLimits:
+    @pytest.mark.asyncio
+    async def test_sheds_with_retry_after(self):
+        manager = ProviderServerManager(SERVER_HOST, SERVER_PORT, max_concurrency=10, retry_after_secs=2)
+        manager.limit_kind("bucket", 2)
+        release = asyncio.Event()
+        running = 0
+
+        async def slow(request):
+            nonlocal running
+            running += 1
+            await release.wait()
+            running -= 1
+            return web.json_response("OK")
+
+        manager.register_handler("/bucket/slow", slow, "bucket")
+        manager.register_handler("/bucket/other", slow, "bucket")
+        manager.register_handler("/object/slow", slow, "object")
+        await manager.start_server()
+        try:
+            async with ClientSession() as session:
+                async def call(route):
+                    async with session.post(manager.callback_url() + route) as resp:
+                        await resp.read()
+                        return resp.status, resp.headers.get("Retry-After")
+
+                admitted = [asyncio.ensure_future(call(route)) for route in ("/bucket/slow", "/bucket/other", "/object/slow")]
+                while running < 3:
+                    await asyncio.sleep(0.01)
+                assert await call("/bucket/slow") == (429, "2")
+                release.set()
+                assert [status for status, _ in await asyncio.gather(*admitted)] == [200, 200, 200]
+            metrics = manager.limit_metrics()
+            assert metrics["kinds"]["bucket"]["shed"] == 1
+            assert metrics["kinds"]["bucket"]["in_flight"] == 0
+            assert metrics["global"]["admitted"] == 3
+        finally:
+            await manager.close()
+
+
+class TestProviderServerWorkers:
+    @pytest.mark.asyncio
+    async def test_workers_share_port_and_are_restarted(self):
+        manager = ProviderServerManager(SERVER_HOST, SERVER_PORT, workers=2, restart_delay_secs=0.05)
+
+        async def pid(request):
+            return web.json_response(os.getpid())
+
+        manager.register_handler("/pid", pid)
+        await manager.start_server()
+        try:
+            async with ClientSession(connector=TCPConnector(force_close=True)) as session:
+                async def call():
+                    for _ in range(100):
+                        try:
+                            async with session.post(manager.callback_url() + "/pid") as resp:
+                                return await resp.json()
+                        except ClientConnectionError:
+                            await asyncio.sleep(0.02)
+
+                workers = manager.worker_pids
+                assert len(workers) == 2 and os.getpid() not in workers
+                served = {await call() for _ in range(50)}
+                assert served <= set(workers)
+
+                os.kill(workers[0], signal.SIGKILL)
+                while manager.worker_restarts == 0:
+                    await asyncio.sleep(0.02)
+                assert len(manager.worker_pids) == 2
+                assert workers[0] not in manager.worker_pids
+                assert await call() in manager.worker_pids
+        finally:
+            await manager.close()
+        assert manager.worker_pids == []
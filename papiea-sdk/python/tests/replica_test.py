@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+import opentracing
+import pytest
+
+from papiea.client import EntityCRUD
+from papiea.core import AttributeDict, CompactEntity
+from papiea.python_sdk import ProviderSdk
+from papiea.replica import KindReplica
+from papiea.transport import Transport
+from tests.local_engine import LocalEngine
+
+logger = logging.getLogger(__name__)
+
+ENGINE_HOST = "127.0.0.1"
+ENGINE_PORT = 9025
+ADMIN_KEY = "replica_admin_key"
+PREFIX = "replica_provider"
+VERSION = "0.1.0"
+
+
+async def registered_sdk(engine: LocalEngine) -> ProviderSdk:
+    sdk = ProviderSdk(engine.url, ADMIN_KEY, logger=logger, tracer=opentracing.Tracer(), transport=Transport())
+    sdk.version(VERSION)
+    sdk.prefix(PREFIX)
+    sdk.new_kind({"host": {"type": "object", "x-papiea-entity": "differ"}})
+    await sdk.register()
+    return sdk
+
+
+def names(entities) -> set:
+    return {entity.spec.name for entity in entities}
+
+
+class TestKindReplica:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("compact_entities", [False, True])
+    async def test_lookups_follow_refreshes(self, compact_entities):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            sdk = await registered_sdk(engine)
+            try:
+                async with EntityCRUD(engine.url, PREFIX, VERSION, "host", ADMIN_KEY, logger=logger,
+                                      tracer=opentracing.Tracer(), transport=Transport()) as client:
+                    created = [await client.create(AttributeDict(spec={"name": name, "rack": rack}))
+                               for name, rack in [("web-1", 1), ("web-2", 1), ("db-1", 2)]]
+                    replica = KindReplica(client, indexes=["spec.name", "spec.rack", "status.state"], batch_size=2,
+                                          refresh_interval_secs=60, compact_entities=compact_entities)
+                    async with replica:
+                        assert len(replica) == 3
+                        assert isinstance(replica.get(created[0].metadata.uuid), CompactEntity) == compact_entities
+                        assert names(replica.lookup("spec.rack", 1)) == {"web-1", "web-2"}
+                        assert names(replica.lookup_prefix("spec.name", "web-")) == {"web-1", "web-2"}
+                        assert replica.lookup("spec.name", "web-3") == []
+                        with pytest.raises(Exception):
+                            replica.lookup("spec.size", 1)
+
+                        requests = engine.request_counts["filter_entities"]
+                        assert replica.lookup("spec.rack", 2)[0].spec.name == "db-1"
+                        assert engine.request_counts["filter_entities"] == requests
+
+                        await client.update(created[0].metadata, {"name": "api-1", "rack": 2})
+                        await client.delete(created[2].metadata)
+                        store = engine._store(PREFIX, VERSION, "host")
+                        store[created[1].metadata.uuid]["status"] = {"state": "down"}
+                        await replica.refresh()
+
+                        assert len(replica) == 2
+                        assert names(replica.lookup("spec.rack", 2)) == {"api-1"}
+                        assert names(replica.lookup_prefix("spec.name", "web-")) == {"web-2"}
+                        assert names(replica.lookup("status.state", "down")) == {"web-2"}
+                        assert replica.get(created[2].metadata.uuid) is None
+            finally:
+                await sdk.__aexit__(None, None, None)
+
+    @pytest.mark.asyncio
+    async def test_polling_and_staleness_bound(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            sdk = await registered_sdk(engine)
+            try:
+                async with EntityCRUD(engine.url, PREFIX, VERSION, "host", ADMIN_KEY, logger=logger,
+                                      tracer=opentracing.Tracer(), transport=Transport()) as client:
+                    replica = KindReplica(client, indexes=["spec.name"], refresh_interval_secs=0.02,
+                                          max_staleness_secs=0.2)
+                    with pytest.raises(Exception):
+                        replica.lookup("spec.name", "web-1")
+                    async with replica:
+                        await client.create(AttributeDict(spec={"name": "web-1"}))
+                        for _ in range(50):
+                            if replica.lookup("spec.name", "web-1"):
+                                break
+                            await asyncio.sleep(0.01)
+                        assert names(replica.lookup("spec.name", "web-1")) == {"web-1"}
+                        assert replica.staleness_secs < 0.2
+
+                    # Not refreshed anymore
+                    await asyncio.sleep(0.25)
+                    with pytest.raises(Exception):
+                        replica.lookup("spec.name", "web-1")
+                    assert replica.metrics()["refreshes"] > 1
+            finally:
+                await sdk.__aexit__(None, None, None)
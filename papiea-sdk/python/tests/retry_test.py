@@ -0,0 +1,141 @@
+import asyncio
+import logging
+
+import pytest
+from aiohttp import ClientConnectorError, ClientResponseError, ServerDisconnectedError
+
+from papiea.api import ApiInstance
+from papiea.python_sdk_exceptions import ApiException
+from papiea.retry import RetryBudget, RetryPolicy
+from papiea.transport import Transport
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 9022
+
+
+class FlakyServer(object):
+    """
+    Raw HTTP server closing the first `drops` connections without answering.
+    """
+
+    def __init__(self, drops: int):
+        self.drops = drops
+        self.requests = 0
+        self.server = None
+
+    async def handle(self, reader, writer):
+        while True:
+            request = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in request.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            self.requests += 1
+            if self.requests <= self.drops:
+                writer.close()
+                return
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 12\r\n\r\n"
+                         b"{\"ok\": true}")
+            await writer.drain()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, SERVER_HOST, SERVER_PORT)
+        return self
+
+    async def __aexit__(self, *args):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def no_jitter(**kwargs) -> RetryPolicy:
+    return RetryPolicy(backoff_base_secs=0.001, jitter=False, **kwargs)
+
+
+class TestRetryPolicy:
+    @pytest.mark.asyncio
+    async def test_retries_safe_methods_until_max_attempts(self):
+        policy = no_jitter(max_attempts=3)
+        calls = []
+
+        async def request():
+            calls.append(1)
+            raise ServerDisconnectedError()
+
+        with pytest.raises(ServerDisconnectedError):
+            await policy.call("get", False, request)
+        assert len(calls) == 3 and policy.retries == 2
+
+    @pytest.mark.asyncio
+    async def test_only_unsent_requests_are_retried_for_non_idempotent_methods(self):
+        policy = no_jitter()
+        error = ServerDisconnectedError()
+        assert not policy.is_retryable("post", False, error)
+        assert policy.is_retryable("post", True, error)
+        assert policy.is_retryable("post", False, ClientConnectorError(None, OSError("refused")))
+        assert not policy.is_retryable("get", False, ValueError())
+
+    def test_backoff_is_exponential_capped_and_jittered(self):
+        policy = RetryPolicy(backoff_base_secs=0.1, backoff_max_secs=0.3, jitter=False)
+        assert [policy.backoff(attempt) for attempt in (1, 2, 3)] == [0.1, 0.2, 0.3]
+        policy.jitter = True
+        assert all(0 <= policy.backoff(3) <= 0.3 for _ in range(20))
+
+    @pytest.mark.asyncio
+    async def test_waits_for_retry_after_of_any_error_with_headers(self):
+        policy = no_jitter(max_attempts=2)
+        errors = [
+            ApiException(503, "Service Unavailable", "", {"Retry-After": "0.1"}),
+            ClientResponseError(None, (), status=503, headers={"Retry-After": "0.1"}),
+        ]
+        for error in errors:
+            async def request():
+                raise error
+
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            with pytest.raises(type(error)):
+                await policy.call("get", False, request)
+            assert loop.time() - start >= 0.1
+
+    @pytest.mark.asyncio
+    async def test_budget_stops_retry_storms(self):
+        policy = no_jitter(max_attempts=5, budget=RetryBudget(ratio=0.5, max_tokens=2))
+
+        async def request():
+            raise ServerDisconnectedError()
+
+        for _ in range(3):
+            with pytest.raises(ServerDisconnectedError):
+                await policy.call("get", False, request)
+        # 2 initial tokens, plus half a token per request
+        assert policy.retries == 3
+        assert policy.budget_exhausted == 3
+
+
+class TestApiInstanceRetries:
+    @pytest.mark.asyncio
+    async def test_broken_connection_is_replaced_without_renewing_the_session(self):
+        async with FlakyServer(drops=1) as server:
+            transport = Transport()
+            api = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}", logger=logger, transport=transport,
+                              retry_policy=no_jitter())
+            session = api.session
+            assert (await api.get("entity")).ok
+            assert server.requests == 2
+            assert api.session is session
+            await api.close()
+
+    @pytest.mark.asyncio
+    async def test_posts_are_retried_only_when_idempotent(self):
+        async with FlakyServer(drops=1) as server:
+            api = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}", logger=logger, transport=Transport(),
+                              retry_policy=no_jitter())
+            with pytest.raises(ServerDisconnectedError):
+                await api.post("create", {})
+            server.drops = 2
+            assert (await api.post("filter", {}, idempotent=True)).ok
+            assert server.requests == 3
+            await api.close()
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+
+import opentracing
+import pytest
+
+from papiea.core import AttributeDict
+from papiea.python_sdk import ProviderSdk
+from papiea.python_sdk_context import ProceduralCtx
+from papiea.status_buffer import StatusWriteBuffer, merge_partial_status, status_diff
+from papiea.transport import Transport
+from tests.local_engine import LocalEngine
+
+logger = logging.getLogger(__name__)
+
+ENGINE_HOST = "127.0.0.1"
+ENGINE_PORT = 9018
+ADMIN_KEY = "status_admin_key"
+
+
+class RecordingSender(object):
+    def __init__(self, delay: float = 0, fail_uuids=()):
+        self.delay = delay
+        self.fail_uuids = fail_uuids
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, entity_reference, status):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if entity_reference["uuid"] in self.fail_uuids:
+                raise Exception(f"Cannot update {entity_reference['uuid']}")
+            self.sent.append((entity_reference["uuid"], status))
+        finally:
+            self.in_flight -= 1
+
+
+def ref(uuid):
+    return AttributeDict(uuid=uuid, kind="bucket")
+
+
+class TestMergePartialStatus:
+    def test_merges_like_sequential_updates(self):
+        assert merge_partial_status({"a": {"b": 1}, "list": [1]}, {"a": {"c": 2}, "list": [2], "d": None}) == \
+               {"a": {"b": 1, "c": 2}, "list": [2], "d": None}
+        assert merge_partial_status({"a": {"b": 1}}, {"a": None}) == {"a": None}
+
+    def test_refuses_to_set_fields_of_unset_object(self):
+        assert merge_partial_status({"a": None}, {"a": {"b": 1}}) is None
+        assert merge_partial_status({"x": {"a": None}}, {"x": {"a": {"b": 1}}}) is None
+
+
+class TestStatusWriteBuffer:
+    @pytest.mark.asyncio
+    async def test_merges_updates_of_an_entity_within_the_window(self):
+        sender = RecordingSender()
+        buffer = StatusWriteBuffer(sender, flush_interval_secs=0.01)
+        updates = [buffer.update(ref("1"), {"progress": i, "steps": {str(i): "done"}}) for i in range(3)]
+        updates.append(buffer.update(ref("2"), AttributeDict(progress=1)))
+        await asyncio.gather(*updates)
+        assert sorted(sender.sent) == [
+            ("1", {"progress": 2, "steps": {"0": "done", "1": "done", "2": "done"}}),
+            ("2", {"progress": 1}),
+        ]
+        assert buffer.merged == 2 and buffer.requests == 2
+
+    @pytest.mark.asyncio
+    async def test_flushes_on_size_with_limited_concurrency(self):
+        sender = RecordingSender(delay=0.01)
+        buffer = StatusWriteBuffer(sender, flush_interval_secs=60, max_batch_size=10, max_concurrency=3)
+        updates = [buffer.update(ref(str(i)), {"i": i}) for i in range(10)]
+        await asyncio.wait_for(asyncio.gather(*updates), 1)
+        assert len(sender.sent) == 10
+        assert sender.max_in_flight == 3
+
+    @pytest.mark.asyncio
+    async def test_keeps_order_across_flushes_and_reports_errors(self):
+        sender = RecordingSender(delay=0.01, fail_uuids=("bad",))
+        buffer = StatusWriteBuffer(sender, flush_interval_secs=60)
+        buffer.update(ref("1"), {"a": {"b": 1}})
+        first_flush = asyncio.ensure_future(buffer.flush())
+        await asyncio.sleep(0)
+        unset = buffer.update(ref("1"), {"a": None})
+        recreate = buffer.update(ref("1"), {"a": {"c": 1}})
+        failed = buffer.update(ref("bad"), {"a": 1})
+        await buffer.close()
+        await first_flush
+        assert sender.sent == [("1", {"a": {"b": 1}}), ("1", {"a": None}), ("1", {"a": {"c": 1}})]
+        assert unset.done() and recreate.done()
+        assert str(failed.exception()) == "Cannot update bad"
+        with pytest.raises(Exception):
+            buffer.update(ref("1"), {"a": 2})
+
+
+class TestProviderStatusWriteBehind:
+    @pytest.mark.asyncio
+    async def test_ctx_updates_are_batched_and_flushed_on_shutdown(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            sdk = ProviderSdk(engine.url, ADMIN_KEY, logger=logger, tracer=opentracing.Tracer(),
+                              transport=Transport(), status_write_behind=True, status_flush_interval_secs=60)
+            sdk.version("0.1.0")
+            sdk.prefix("status_provider")
+            sdk.new_kind({"bucket": {"type": "object", "x-papiea-entity": "differ"}})
+            await sdk.register()
+            store = engine._store("status_provider", "0.1.0", "bucket")
+            store["1"] = {"metadata": {"uuid": "1", "kind": "bucket", "spec_version": 1}, "spec": {}, "status": {}}
+            ctx = ProceduralCtx(sdk, "status_provider", "0.1.0", {})
+            updates = [asyncio.ensure_future(ctx.update_status(ref("1"), {"objects": i})) for i in range(5)]
+            await asyncio.sleep(0.01)
+            assert engine.request_counts["update_status"] == 0
+            await sdk.__aexit__(None, None, None)
+            await asyncio.gather(*updates)
+            assert engine.request_counts["update_status"] == 1
+            assert store["1"]["status"] == {"objects": 4}
+
+
+class TestStatusDiff:
+    def test_only_changed_paths_are_kept(self):
+        last = {"state": "running", "disks": [1, 2], "net": {"ip": "10.0.0.1", "mac": "aa"}, "old": 1}
+        new = {"state": "running", "disks": [1, 2, 3], "net": {"ip": "10.0.0.2", "mac": "aa"}, "new": {"a": 1}}
+        assert status_diff(last, new) == {"disks": [1, 2, 3], "net": {"ip": "10.0.0.2"}, "new": {"a": 1},
+                                          "old": None}
+        assert status_diff(last, dict(last)) == {}
+        assert status_diff({"a": None}, {}) == {}
+        assert status_diff(None, {"a": 1}) == {"a": 1}
+
+
+
+class TestUpdateChangedStatus:
+    @pytest.mark.asyncio
+    async def test_sends_minimal_diffs_and_skips_unchanged_statuses(self):
+        async with LocalEngine(ENGINE_HOST, ENGINE_PORT) as engine:
+            sdk = ProviderSdk(engine.url, ADMIN_KEY, logger=logger, tracer=opentracing.Tracer(),
+                              transport=Transport())
+            sdk.version("0.1.0")
+            sdk.prefix("status_provider")
+            sdk.new_kind({"bucket": {"type": "object", "x-papiea-entity": "differ"}})
+            await sdk.register()
+            store = engine._store("status_provider", "0.1.0", "bucket")
+            metadata = {"uuid": "1", "kind": "bucket", "spec_version": 1}
+            status = {"size": 1, "objects": ["a"], "owner": {"name": "alice", "id": 1}}
+            store["1"] = {"metadata": metadata, "spec": {}, "status": status}
+            entity = AttributeDict(metadata=AttributeDict(metadata), spec={}, status=status)
+            try:
+                ctx = ProceduralCtx(sdk, "status_provider", "0.1.0", {})
+                assert not await ctx.update_changed_status(entity, dict(status))
+                new_status = {"size": 2, "objects": ["a"], "owner": {"name": "alice"}}
+                assert await ctx.update_changed_status(entity, new_status)
+                # The baseline is now what this invocation wrote, not the incoming entity
+                assert not await ctx.update_changed_status(entity, new_status)
+                assert engine.request_counts["update_status"] == 1
+                assert store["1"]["status"] == new_status
+
+                # Another invocation with only a reference has no baseline and sends the whole status
+                ctx = ProceduralCtx(sdk, "status_provider", "0.1.0", {})
+                assert await ctx.update_changed_status(ref("1"), new_status)
+                assert engine.request_counts["update_status"] == 2
+                assert not await ctx.update_changed_status(ref("1"), new_status)
+                assert engine.request_counts["update_status"] == 2
+            finally:
+                await sdk.__aexit__(None, None, None)
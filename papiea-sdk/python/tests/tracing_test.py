@@ -0,0 +1,40 @@
+import subprocess
+import sys
+
+import opentracing
+import pytest
+
+from papiea.client import EntityCRUD
+from papiea.tracing_utils import NOOP_TRACER, disable_tracing, get_default_tracer, set_default_tracer, \
+    tracing_headers
+from papiea.transport import Transport
+
+PAPIEA_URL = "http://127.0.0.1:3000"
+
+
+class TestTracing:
+    def test_import_does_not_initialize_jaeger(self):
+        res = subprocess.run(
+            [sys.executable, "-c", "import sys, papiea.python_sdk; print('jaeger_client' in sys.modules)"],
+            capture_output=True, text=True, cwd="..",
+        )
+        assert res.stdout.strip() == "False"
+
+    @pytest.mark.asyncio
+    async def test_disabled_tracing_injects_nothing(self):
+        previous = get_default_tracer()
+        try:
+            disable_tracing()
+            async with EntityCRUD(PAPIEA_URL, "provider", "0.1.0", "bucket", transport=Transport()) as client:
+                assert client.tracer is NOOP_TRACER
+                with client.tracer.start_span(operation_name="get_entity_client") as span:
+                    assert tracing_headers(client.tracer, span) == {}
+        finally:
+            set_default_tracer(previous)
+
+    @pytest.mark.asyncio
+    async def test_injected_tracer_is_used(self):
+        tracer = opentracing.Tracer()
+        async with EntityCRUD(PAPIEA_URL, "provider", "0.1.0", "bucket", tracer=tracer,
+                              transport=Transport()) as client:
+            assert client.tracer is tracer
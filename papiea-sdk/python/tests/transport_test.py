@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import threading
+
+import pytest
+from aiohttp import web
+
+from papiea.api import ApiInstance
+from papiea.transport import Transport
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 9011
+
+
+async def start_echo_server():
+    async def echo(request):
+        return web.json_response({"path": request.path})
+
+    app = web.Application()
+    app.add_routes([web.get("/{tail:.*}", echo)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, SERVER_HOST, SERVER_PORT).start()
+    return runner
+
+
+class TestTransport:
+    @pytest.mark.asyncio
+    async def test_api_instances_share_session(self):
+        runner = await start_echo_server()
+        try:
+            transport = Transport(limit_per_host=4)
+            first = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}/first", logger=logger, transport=transport)
+            second = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}/second", logger=logger, transport=transport)
+            assert (await first.get("a")).path == "/first/a"
+            assert (await second.get("b")).path == "/second/b"
+            assert first.session is second.session
+            await first.close()
+            assert not transport.closed
+            await second.close()
+            assert transport.closed
+        finally:
+            await runner.cleanup()
+
+    @pytest.mark.asyncio
+    async def test_closing_twice_releases_once(self):
+        transport = Transport()
+        first = ApiInstance("http://localhost", logger=logger, transport=transport)
+        second = ApiInstance("http://localhost", logger=logger, transport=transport)
+        session = first.session
+        await first.close()
+        await first.close()
+        assert not session.closed
+        await second.close()
+        assert session.closed
+
+    @pytest.mark.asyncio
+    async def test_concurrent_loops_keep_their_own_sessions(self):
+        runner = await start_echo_server()
+        try:
+            transport = Transport()
+            api = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}", logger=logger, transport=transport)
+
+            async def request():
+                assert (await api.get("a")).path == "/a"
+                return transport.session
+
+            other_loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=other_loop.run_forever)
+            thread.start()
+            loop = asyncio.get_running_loop()
+
+            async def request_on_other_loop():
+                future = asyncio.run_coroutine_threadsafe(request(), other_loop)
+                return await loop.run_in_executor(None, future.result)
+
+            try:
+                sessions = await asyncio.gather(request_on_other_loop(), request(), request_on_other_loop(),
+                                                request())
+                other_session, session = sessions[0], sessions[1]
+                assert other_session is not session
+                assert sessions == [other_session, session, other_session, session]
+                assert not other_session.closed and not session.closed
+
+                # Releasing the transport closes the sessions of every loop
+                await api.close()
+                assert session.closed
+                for _ in range(50):
+                    if other_session.closed:
+                        break
+                    await asyncio.sleep(0.01)
+                assert other_session.closed and transport.closed
+            finally:
+                other_loop.call_soon_threadsafe(other_loop.stop)
+                await loop.run_in_executor(None, thread.join)
+                other_loop.close()
+        finally:
+            await runner.cleanup()
+
+    @pytest.mark.asyncio
+    async def test_session_of_closed_loop_is_closed(self):
+        runner = await start_echo_server()
+        try:
+            transport = Transport()
+            api = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}", logger=logger, transport=transport)
+
+            async def request():
+                assert (await api.get("a")).path == "/a"
+                return transport.session
+
+            # The session of a closed loop is detached, its connector closed
+            old_session = await asyncio.get_running_loop().run_in_executor(None, asyncio.run, request())
+            old_connector = old_session.connector
+            assert not old_session.closed
+            assert await request() is not old_session
+            await asyncio.sleep(0)
+            assert old_session.closed and old_connector.closed
+            await api.close()
+            assert transport.closed
+        finally:
+            await runner.cleanup()
+
+
+class TestRequestHeaders:
+    @pytest.mark.asyncio
+    async def test_per_call_headers_do_not_leak(self):
+        async def echo_headers(request):
+            return web.json_response({"trace": request.headers.get("uber-trace-id")})
+
+        app = web.Application()
+        app.add_routes([web.get("/{tail:.*}", echo_headers)])
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, SERVER_HOST, SERVER_PORT).start()
+        try:
+            api = ApiInstance(f"http://{SERVER_HOST}:{SERVER_PORT}", headers={"Content-Type": "application/json"},
+                              logger=logger, transport=Transport())
+            results = await asyncio.gather(*(api.get(str(i), headers={"uber-trace-id": str(i)}) for i in range(20)))
+            assert [res.trace for res in results] == [str(i) for i in range(20)]
+            assert (await api.get("untraced")).trace is None
+            assert "uber-trace-id" not in api.headers
+            await api.close()
+        finally:
+            await runner.cleanup()